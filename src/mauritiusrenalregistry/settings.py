@@ -61,6 +61,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Read from the read replica (when configured) in the GET requests
+    "utils.routers.ReplicaMiddleware",
+    # Compress responses (brotli when supported by the browser and installed, otherwise gzip)
+    "utils.middleware.CompressionMiddleware",
+    # ETag for responses without one and 304 Not Modified for unchanged responses
+    "django.middleware.http.ConditionalGetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -68,10 +74,16 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "simple_history.middleware.HistoryRequestMiddleware",
+    # Count the prepared statements executed (Server-Timing header in DEBUG)
+    "renaldataregistry.prepared.PreparedStatementMiddleware",
 ]
 
 ROOT_URLCONF = "mauritiusrenalregistry.urls"
 
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -79,8 +91,11 @@ TEMPLATES = [
             os.path.join(BASE_DIR, "templates"),
             os.path.join(os.path.join(BASE_DIR, "templates"), "renaldataregistry"),
         ],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Compiled templates are kept in memory in production, in debug mode templates are reloaded on every request
+            "loaders": TEMPLATE_LOADERS
+            if DEBUG
+            else [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -105,9 +120,116 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", "postgres"),
         "HOST": os.getenv("POSTGRES_HOST", "localhost"),
         "PORT": os.getenv("POSTGRES_PORT", "5432"),
+        # Seconds a connection is kept open and reused by the next requests (0 closes it after each request)
+        "CONN_MAX_AGE": int(os.getenv("POSTGRES_CONN_MAX_AGE", "60")),
+        # Check that a persistent connection still works before a request reuses it (see utils/connections.py)
+        "CONN_HEALTH_CHECKS": bool(int(os.getenv("POSTGRES_CONN_HEALTH_CHECKS", "1"))),
+        # Server-side cursors (QuerySet.iterator) do not work through pgbouncer in transaction pooling mode
+        "DISABLE_SERVER_SIDE_CURSORS": bool(
+            int(os.getenv("POSTGRES_DISABLE_SERVER_SIDE_CURSORS", "0"))
+        ),
+        # Run the hot queries of the views as named prepared statements (see renaldataregistry/prepared.py),
+        # they do not work through pgbouncer in transaction pooling mode
+        "PREPARED_STATEMENTS": bool(
+            int(os.getenv("POSTGRES_PREPARED_STATEMENTS", "1"))
+        ),
+    }
+}
+
+# Optional read replica (e.g. a PostgreSQL streaming replica) used by the GET requests and the reports,
+# see utils/routers.py
+if os.getenv("POSTGRES_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.getenv("POSTGRES_REPLICA_DB", DATABASES["default"]["NAME"]),
+        "HOST": os.getenv("POSTGRES_REPLICA_HOST"),
+        "PORT": os.getenv("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["utils.routers.ReplicaRouter"]
+# Seconds a browser reads from the primary database after it wrote, so it sees its changes despite the
+# replication lag
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get("DATABASE_REPLICA_PIN_SECONDS", 10))
+
+# Historical records (simple_history) partitioning and retention
+# See the historypartitions management command
+
+# Months of history kept in the database, older monthly partitions are archived to files
+HISTORY_RETENTION_MONTHS = int(os.environ.get("HISTORY_RETENTION_MONTHS", 60))
+# Monthly partitions created in advance by the maintain action
+HISTORY_PARTITION_MONTHS_AHEAD = int(
+    os.environ.get("HISTORY_PARTITION_MONTHS_AHEAD", 3)
+)
+HISTORY_ARCHIVE_DIR = os.environ.get(
+    "HISTORY_ARCHIVE_DIR", os.path.join(BASE_DIR, "history_archive")
+)
+
+# Background jobs (see the runjobs management command)
+
+# Worker processes running the jobs
+JOB_WORKER_PROCESSES = int(os.environ.get("JOB_WORKER_PROCESSES", 2))
+# Seconds between the checks for queued jobs of an idle worker
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 5))
+# Seconds after which a running job whose progress is not updated is considered stopped
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 3600))
+JOB_RESULTS_DIR = os.environ.get(
+    "JOB_RESULTS_DIR", os.path.join(BASE_DIR, "job_results")
+)
+# Directory of the files imported by the bulkimport jobs, their path is relative to it
+JOB_IMPORTS_DIR = os.environ.get(
+    "JOB_IMPORTS_DIR", os.path.join(BASE_DIR, "job_imports")
+)
+
+# Seconds the ids of a cohort are cached at most (see renaldataregistry/cohorts.py)
+COHORT_CACHE_TIMEOUT = int(os.environ.get("COHORT_CACHE_TIMEOUT", 3600))
+
+# Completed snapshots of the registry statistics kept (see the snapshotstatistics management command)
+STATISTICS_SNAPSHOTS_KEPT = int(os.environ.get("STATISTICS_SNAPSHOTS_KEPT", 30))
+
+# Cache (per process), used by the fragment cache of the forms and the cohorts. Each process caches its own copy,
+# what is cached is keyed on versions read from the database so that it expires in every process
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     }
 }
 
+# Query parameters that are validated and not reflected in the pages as given (page numbers, cursors...): the
+# responses to requests with other parameters (e.g. search_keyword) are not compressed, see utils/middleware.py
+COMPRESSION_SAFE_PARAMETERS = [
+    "page",
+    "cursor",
+    "page_size",
+    "patient",
+    "fields",
+    "include",
+    "limit",
+    "resources",
+    "since",
+]
+
+# Seconds the rendering of blank forms is cached ({% formcache %} template tag)
+FORM_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get("FORM_FRAGMENT_CACHE_TIMEOUT", 300))
+
+# Seconds browsers reuse the HD unit options loaded by the forms without revalidating them
+UNIT_OPTIONS_CACHE_MAX_AGE = int(os.environ.get("UNIT_OPTIONS_CACHE_MAX_AGE", 300))
+
+# Serve the read-only pages with their asynchronous views (see renaldataregistry/async_views.py), when the app runs
+# under an ASGI server: under WSGI every request would start an event loop and database connections
+ASYNC_VIEWS = bool(int(os.environ.get("ASYNC_VIEWS", 0)))
+
+# Seconds the matches of the patient lookup (search box autocomplete) are cached for a typed prefix
+PATIENT_LOOKUP_CACHE_TIMEOUT = int(os.environ.get("PATIENT_LOOKUP_CACHE_TIMEOUT", 30))
+
+# Seconds between full recounts of the completeness dashboard, the health institutions with updated rows
+# are recounted in between
+COMPLETENESS_CACHE_TIMEOUT = int(os.environ.get("COMPLETENESS_CACHE_TIMEOUT", 3600))
+
+# Change feed (see the changefeed management command and the api/changes/ endpoint)
+
+# Records saved less than this many seconds ago are left for the next sync, their transaction may not be committed yet
+CHANGE_FEED_LAG_SECONDS = int(os.environ.get("CHANGE_FEED_LAG_SECONDS", 60))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -141,6 +263,8 @@ USE_TZ = True
 
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# Hashed file names (cached forever by browsers and nginx) with gzip/brotli variants written by collectstatic
+STATICFILES_STORAGE = "utils.storage.CompressedManifestStaticFilesStorage"
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
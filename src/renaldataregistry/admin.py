@@ -4,6 +4,8 @@ This file contains the models that can be managed in the admin module of the app
 
 # Register your models here.
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
 from simple_history.admin import SimpleHistoryAdmin
 from .models import (
     PatientRegistration,
@@ -11,6 +13,9 @@ from .models import (
     Disability,
     HealthInstitution,
     HDUnit,
+    PatientMerge,
+    Job,
+    StatisticsSnapshot,
 )
 
 
@@ -19,3 +24,75 @@ admin.site.register(Disability)
 admin.site.register(HealthInstitution)
 admin.site.register(HDUnit)
 admin.site.register(PatientRegistration, SimpleHistoryAdmin)
+admin.site.register(PatientMerge)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """
+    Queue background jobs and follow their progress, run by the runjobs command.
+    """
+
+    list_display = (
+        "__str__",
+        "status",
+        "progress",
+        "message",
+        "created_by",
+        "created_at",
+        "started_at",
+        "finished_at",
+        "result_link",
+    )
+    list_filter = ("status", "task")
+    readonly_fields = (
+        "status",
+        "progress",
+        "message",
+        "result_link",
+        "error",
+        "worker",
+        "created_by",
+        "created_at",
+        "started_at",
+        "finished_at",
+    )
+
+    @staticmethod
+    @admin.display(description="Result")
+    def result_link(obj):
+        """
+        Link to the download of the result file of the job.
+        """
+        if not obj.result_file:
+            return "-"
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse("renaldataregistry:JobResultView", args=[obj.pk]),
+            obj.result_file,
+        )
+
+    def get_readonly_fields(self, request, obj=None):
+        # The task and its arguments are chosen when the job is queued
+        if obj is not None:
+            return ("task", "arguments", *self.readonly_fields)
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(StatisticsSnapshot)
+class StatisticsSnapshotAdmin(admin.ModelAdmin):
+    """
+    Follow the snapshots of the registry statistics computed by the snapshotstatistics command, and their errors.
+    """
+
+    list_display = ("__str__", "status", "created_at", "completed_at")
+    list_filter = ("status",)
+    readonly_fields = ("status", "error", "created_at", "completed_at")
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,698 @@
+"""
+This file contains the JSON API used by hospital systems to read and write registry records without scraping the HTML views.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import transaction
+from django.forms.models import model_to_dict
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from renaldataregistry.models import (
+    Patient,
+    PatientRegistration,
+    PatientKRTModality,
+    PatientAssessment,
+    PatientStop,
+)
+from renaldataregistry.forms import (
+    PatientForm,
+    PatientRegistrationForm,
+    PatientKRTModalityForm,
+    PatientAssessmentForm,
+    PatientAssessmentLPForm,
+    PatientAssessmentMedicationForm,
+    PatientAssessmentDialysisForm,
+    PatientStopForm,
+)
+from renaldataregistry.bulk import BulkUpsert
+from renaldataregistry.lookup import (
+    lookup_patients,
+    PATIENT_LOOKUP_LIMIT,
+    PATIENT_LOOKUP_MAX_LIMIT,
+)
+from renaldataregistry.changes import (
+    CHANGE_FEED_SOURCES,
+    get_watermark,
+    iter_changes,
+    parse_watermark,
+)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class ApiError(Exception):
+    """
+    Error returned to the API client as a JSON response.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def get_concrete_field_names(model):
+    """
+    Return the names of the fields stored in the model's table.
+    """
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def serialize_instance(instance, field_names):
+    """
+    Serialize a model instance, foreign keys are represented by their id (as .values() does).
+    """
+    return {
+        field_name: instance._meta.get_field(field_name).value_from_object(instance)
+        for field_name in field_names
+    }
+
+
+class Include:
+    """
+    Define a related record that can be embedded in the API representation of a resource.
+    """
+
+    def __init__(self, lookup, fields=None):
+        self.lookup = lookup
+        self.fields = fields
+        # Set by bind() from the relation
+        self.many = False
+        self.related_model = None
+        self.accessor = None
+        self.pk_name = None
+
+    def bind(self, model):
+        """
+        Resolve the relation of the include for the given model.
+        """
+        relation = model._meta.get_field(self.lookup)
+        self.many = relation.one_to_many or relation.many_to_many
+        self.related_model = relation.related_model
+        # Name of the attribute on the instance (e.g. patientkrtmodality_set for a reverse foreign key)
+        if relation.auto_created and not relation.concrete:
+            self.accessor = relation.get_accessor_name()
+        else:
+            self.accessor = relation.name
+        if self.fields is None:
+            self.fields = get_concrete_field_names(self.related_model)
+        self.pk_name = self.related_model._meta.pk.name
+        if self.pk_name not in self.fields:
+            self.fields = [self.pk_name] + list(self.fields)
+        return self
+
+
+class ApiResource:
+    """
+    Define the model, includes and form used by the API for a type of record.
+    """
+
+    def __init__(
+        self,
+        model,
+        form_class,
+        includes=None,
+        parent_field=None,
+        created_at_from=None,
+        sub_forms=None,
+    ):
+        self.model = model
+        self.form_class = form_class
+        self.fields = get_concrete_field_names(model)
+        self.includes = {
+            name: include.bind(model) for name, include in (includes or {}).items()
+        }
+        # Field linking the record to its patient, given in the request body when the record is created
+        self.parent_field = parent_field
+        # created_at is not automatic in some models: "now" or "patient" (the patient's registration date)
+        self.created_at_from = created_at_from
+        # Forms of the one-to-one sub-records written with the record: key -> (form class, accessor)
+        self.sub_forms = sub_forms or {}
+
+    @property
+    def pk_name(self):
+        """
+        Name of the primary key of the model.
+        """
+        return self.model._meta.pk.name
+
+    def get_queryset(self):
+        """
+        Return the records readable through the API.
+        """
+        return self.model.objects.all()
+
+    def before_save(self, instance, created, user):
+        """
+        Set the values not included in the form before saving the record.
+        """
+        if created:
+            if self.created_at_from == "now":
+                instance.created_at = timezone.now()
+            elif self.created_at_from == "patient":
+                instance.created_at = instance.patient.created_at
+            if hasattr(instance, "created_by_id"):
+                instance.created_by = user
+        elif hasattr(instance, "updated_by_id"):
+            instance.updated_by = user
+
+    def after_save(self, instance, created):
+        """
+        Apply the changes to other records that the HTML views do when the record is saved.
+        """
+
+
+class PatientKRTModalityResource(ApiResource):
+    def after_save(self, instance, created):
+        # Only one current KRT modality per patient
+        if instance.is_current:
+            PatientKRTModality.objects.filter(
+                patient=instance.patient_id, is_current=True
+            ).exclude(pk=instance.pk).update(
+                is_current=False, updated_at=timezone.now()
+            )
+            Patient.objects.filter(pk=instance.patient_id).exclude(
+                in_krt_modality="Y"
+            ).update(in_krt_modality="Y", updated_at=timezone.now())
+
+
+class PatientStopResource(ApiResource):
+    def after_save(self, instance, created):
+        # When a patient stops dialysis, the current KRT modality is not current anymore
+        PatientKRTModality.objects.filter(
+            patient=instance.patient_id, is_current=True
+        ).update(is_current=False, updated_at=timezone.now())
+
+
+API_RESOURCES = {
+    "patients": ApiResource(
+        Patient,
+        PatientForm,
+        includes={
+            "registration": Include("patientregistration"),
+            "renaldiagnoses": Include("patientrenaldiagnosis"),
+            "akimeasurement": Include("patientakimeasurement"),
+            "modalities": Include("patientkrtmodality"),
+            "assessments": Include("patientassessment"),
+            "stop": Include("patientstop"),
+        },
+    ),
+    "registrations": ApiResource(
+        PatientRegistration,
+        PatientRegistrationForm,
+        parent_field="patient",
+        created_at_from="patient",
+        includes={
+            "patient": Include("patient"),
+            "health_institution": Include(
+                "health_institution", fields=["id", "code", "name", "type"]
+            ),
+        },
+    ),
+    "modalities": PatientKRTModalityResource(
+        PatientKRTModality,
+        PatientKRTModalityForm,
+        parent_field="patient",
+        created_at_from="now",
+        includes={
+            "patient": Include("patient"),
+            "hd_unit": Include("hd_unit", fields=["id", "code", "name"]),
+        },
+    ),
+    "assessments": ApiResource(
+        PatientAssessment,
+        PatientAssessmentForm,
+        parent_field="patient",
+        created_at_from="now",
+        sub_forms={
+            "lp": (PatientAssessmentLPForm, "patientlpassessment"),
+            "medication": (
+                PatientAssessmentMedicationForm,
+                "patientmedicationassessment",
+            ),
+            "dialysis": (PatientAssessmentDialysisForm, "patientdialysisassessment"),
+        },
+        includes={
+            "patient": Include("patient"),
+            "lp": Include("patientlpassessment"),
+            "medication": Include("patientmedicationassessment"),
+            "dialysis": Include("patientdialysisassessment"),
+            "comorbidities": Include("comorbidity", fields=["id", "comorbidity"]),
+            "disabilities": Include("disability", fields=["id", "disability"]),
+        },
+    ),
+    "stops": PatientStopResource(
+        PatientStop,
+        PatientStopForm,
+        parent_field="patient",
+        includes={"patient": Include("patient")},
+    ),
+}
+
+
+class ApiLoginRequiredMixin:
+    """
+    Authenticate API requests with the session or HTTP Basic credentials (email and password).
+    As in Django REST framework, CSRF is only enforced for requests authenticated with the session.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Authenticate the request, and return the API errors raised by the view as JSON responses.
+        """
+        try:
+            if request.user.is_authenticated:
+                if request.method not in ("GET", "HEAD", "OPTIONS"):
+                    csrf_check = CsrfViewMiddleware(lambda request: None)
+                    csrf_check.process_request(request)
+                    if csrf_check.process_view(request, None, (), {}):
+                        raise ApiError("CSRF verification failed.", status=403)
+            else:
+                request.user = self.authenticate_basic(request)
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            response = JsonResponse({"error": error.message}, status=error.status)
+            if error.status == 401:
+                response["WWW-Authenticate"] = 'Basic realm="renaldataregistry"'
+            return response
+
+    @staticmethod
+    def authenticate_basic(request):
+        """
+        Return the user of the Authorization: Basic header.
+        """
+        authorization = request.META.get("HTTP_AUTHORIZATION", "").split()
+        if len(authorization) != 2 or authorization[0].lower() != "basic":
+            raise ApiError("Authentication credentials were not provided.", status=401)
+        try:
+            email, password = (
+                base64.b64decode(authorization[1]).decode("utf-8").split(":", 1)
+            )
+        except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+            raise ApiError(
+                "Invalid basic authentication header.", status=401
+            ) from error
+        user = authenticate(request, email=email, password=password)
+        if user is None or not user.is_active:
+            raise ApiError("Invalid email or password.", status=401)
+        return user
+
+
+class ApiResourceMixin(ApiLoginRequiredMixin):
+    """
+    Resolve the resource of the URL and the fields and includes requested by the client.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.resource = API_RESOURCES.get(kwargs["resource"])
+        if self.resource is None:
+            return JsonResponse({"error": "Unknown resource."}, status=404)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_requested_fields(self):
+        """
+        Fields selected with ?fields=a,b (the primary key is always included).
+        """
+        requested = self.request.GET.get("fields")
+        if not requested:
+            return self.resource.fields
+        field_names = [name.strip() for name in requested.split(",") if name.strip()]
+        unknown = set(field_names) - set(self.resource.fields)
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+        if self.resource.pk_name not in field_names:
+            field_names.insert(0, self.resource.pk_name)
+        return field_names
+
+    def get_requested_includes(self):
+        """
+        Related records requested with ?include=a,b.
+        """
+        requested = self.request.GET.get("include")
+        if not requested:
+            return []
+        names = [name.strip() for name in requested.split(",") if name.strip()]
+        unknown = set(names) - set(self.resource.includes)
+        if unknown:
+            raise ApiError(f"Unknown includes: {', '.join(sorted(unknown))}.")
+        return [(name, self.resource.includes[name]) for name in names]
+
+    def json_response(self, data, status=200):
+        """
+        Return the JSON response with an ETag, or 304 when it matches If-None-Match.
+        """
+        response = JsonResponse(data, status=status)
+        if status == 200 and self.request.method in ("GET", "HEAD"):
+            response["ETag"] = quote_etag(hashlib.sha256(response.content).hexdigest())
+            return get_conditional_response(
+                self.request, etag=response["ETag"], response=response
+            )
+        return response
+
+    def parse_body(self):
+        """
+        Return the JSON object sent in the request body.
+        """
+        try:
+            data = json.loads(self.request.body or b"{}")
+        except ValueError as error:
+            raise ApiError("Request body is not valid JSON.") from error
+        if not isinstance(data, dict):
+            raise ApiError("Request body must be a JSON object.")
+        return data
+
+    @staticmethod
+    def get_form_data(form_class, instance, data):
+        """
+        Merge the values sent by the client with the current values of the record, so that partial updates validate.
+        """
+        form_data = {}
+        if instance is not None:
+            for field_name, value in model_to_dict(
+                instance, fields=form_class._meta.fields
+            ).items():
+                if isinstance(value, list):
+                    value = [getattr(item, "pk", item) for item in value]
+                form_data[field_name] = value
+        form_data.update(data)
+        return form_data
+
+    def save(self, data, instance=None):
+        """
+        Validate the record (and its sub-records) with the application forms and save them in one transaction.
+        """
+        resource = self.resource
+        created = instance is None
+        sub_data = {key: data.pop(key, None) for key in resource.sub_forms}
+
+        form = resource.form_class(
+            data=self.get_form_data(resource.form_class, instance, data),
+            instance=instance,
+        )
+        errors = {}
+        if not form.is_valid():
+            errors.update(form.errors.get_json_data())
+
+        parent = None
+        if created and resource.parent_field:
+            parent = Patient.objects.filter(pk=data.get(resource.parent_field)).first()
+            if parent is None:
+                errors[resource.parent_field] = [
+                    {"message": "Unknown or missing patient.", "code": "invalid"}
+                ]
+
+        sub_forms = []
+        for key, (sub_form_class, accessor) in resource.sub_forms.items():
+            if sub_data[key] is None:
+                continue
+            sub_instance = getattr(instance, accessor, None) if instance else None
+            sub_form = sub_form_class(
+                data=self.get_form_data(sub_form_class, sub_instance, sub_data[key]),
+                instance=sub_instance,
+            )
+            if sub_form.is_valid():
+                sub_forms.append(sub_form)
+            else:
+                errors[key] = sub_form.errors.get_json_data()
+        if errors:
+            raise ApiError(errors)
+
+        with transaction.atomic():
+            record = form.save(commit=False)
+            if parent is not None:
+                setattr(record, resource.parent_field, parent)
+            resource.before_save(record, created, self.request.user)
+            record.save()
+            form.save_m2m()
+            for sub_form in sub_forms:
+                sub_record = sub_form.save(commit=False)
+                sub_record.patientassessment = record
+                sub_record.save()
+            resource.after_save(record, created)
+        return record
+
+    def get_object_data(self, record_id):
+        """
+        Serialize a single record, related records are loaded with select_related and prefetch_related.
+        """
+        field_names = self.get_requested_fields()
+        includes = self.get_requested_includes()
+        queryset = self.resource.get_queryset()
+        select = [include.lookup for _, include in includes if not include.many]
+        prefetch = [include.accessor for _, include in includes if include.many]
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        instance = queryset.filter(pk=record_id).first()
+        if instance is None:
+            raise ApiError("No record found.", status=404)
+
+        data = serialize_instance(instance, field_names)
+        for name, include in includes:
+            if include.many:
+                data[name] = [
+                    serialize_instance(related, include.fields)
+                    for related in getattr(instance, include.accessor).all()
+                ]
+            else:
+                related = getattr(instance, include.accessor, None)
+                data[name] = (
+                    serialize_instance(related, include.fields)
+                    if related is not None
+                    else None
+                )
+        return data
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ApiResourceListView(ApiResourceMixin, View):
+    """
+    List records with cursor pagination (GET) and create records (POST).
+    The list is serialized from .values() rows, without instantiating the models.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return a page of records ordered by primary key.
+        """
+        field_names = self.get_requested_fields()
+        includes = self.get_requested_includes()
+        try:
+            page_size = min(
+                int(request.GET.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE
+            )
+            after = self.decode_cursor(request.GET.get("cursor"))
+        except ValueError as error:
+            raise ApiError("Invalid page_size or cursor.") from error
+        if page_size < 1:
+            raise ApiError("Invalid page_size or cursor.")
+
+        queryset = self.resource.get_queryset().order_by("pk")
+        patient_id = request.GET.get("patient")
+        if patient_id and "patient" in self.resource.fields:
+            if not patient_id.isdigit():
+                raise ApiError("Invalid patient.")
+            queryset = queryset.filter(patient=patient_id)
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+
+        # Forward and one-to-one includes are joined in the same query
+        one_includes = [
+            (name, include) for name, include in includes if not include.many
+        ]
+        value_names = list(field_names)
+        for _, include in one_includes:
+            value_names.extend(f"{include.lookup}__{field}" for field in include.fields)
+        rows = list(queryset.values(*value_names)[: page_size + 1])
+
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_query = request.GET.copy()
+            next_query["cursor"] = self.encode_cursor(rows[-1][self.resource.pk_name])
+            next_url = f"{request.path}?{next_query.urlencode()}"
+
+        results = []
+        for row in rows:
+            record = {field_name: row[field_name] for field_name in field_names}
+            for name, include in one_includes:
+                related = {
+                    field: row[f"{include.lookup}__{field}"] for field in include.fields
+                }
+                record[name] = related if related[include.pk_name] is not None else None
+            results.append(record)
+        self.add_many_includes(
+            results, [(name, include) for name, include in includes if include.many]
+        )
+
+        return self.json_response({"results": results, "next": next_url})
+
+    def add_many_includes(self, results, many_includes):
+        """
+        Add the reverse foreign key and many-to-many includes to the records of the page, with one query
+        each for the whole page.
+        """
+        pks = [record[self.resource.pk_name] for record in results]
+        for name, include in many_includes:
+            related_by_pk = {pk: [] for pk in pks}
+            related_rows = (
+                self.resource.model.objects.filter(
+                    pk__in=pks, **{f"{include.lookup}__isnull": False}
+                )
+                .order_by(f"{include.lookup}__{include.pk_name}")
+                .values(
+                    "pk", *[f"{include.lookup}__{field}" for field in include.fields]
+                )
+            )
+            for related_row in related_rows:
+                related_by_pk[related_row["pk"]].append(
+                    {
+                        field: related_row[f"{include.lookup}__{field}"]
+                        for field in include.fields
+                    }
+                )
+            for record in results:
+                record[name] = related_by_pk[record[self.resource.pk_name]]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Create a record, validated with the same forms as the HTML views.
+        """
+        record = self.save(self.parse_body())
+        return self.json_response(self.get_object_data(record.pk), status=201)
+
+    @staticmethod
+    def encode_cursor(record_id):
+        """
+        Encode the primary key of the last record of the page.
+        """
+        return base64.urlsafe_b64encode(str(record_id).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Decode the primary key after which the page starts.
+        """
+        if not cursor:
+            return None
+        try:
+            return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (binascii.Error, UnicodeDecodeError) as error:
+            raise ValueError("Invalid cursor.") from error
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ApiResourceDetailView(ApiResourceMixin, View):
+    """
+    Read (GET) and partially update (PATCH) a single record.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return a single record.
+        """
+        return self.json_response(self.get_object_data(kwargs["pk"]))
+
+    def patch(self, request, *args, **kwargs):
+        """
+        Update the fields sent in the request body.
+        """
+        instance = self.resource.get_queryset().filter(pk=kwargs["pk"]).first()
+        if instance is None:
+            raise ApiError("No record found.", status=404)
+        data = self.parse_body()
+        data.pop(self.resource.parent_field, None)
+        record = self.save(data, instance=instance)
+        return self.json_response(self.get_object_data(record.pk))
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ApiBulkUpsertView(ApiLoginRequiredMixin, View):
+    """
+    Create or update KRT modalities and assessments sent as NDJSON (one JSON record per line).
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        Ingest the batch in one transaction and return the result of every record as NDJSON.
+        The body is read line by line, so batches are not limited by DATA_UPLOAD_MAX_MEMORY_SIZE.
+        """
+        results = BulkUpsert(user=request.user).run(request)
+        return HttpResponse(
+            "".join(json.dumps(result) + "\n" for result in results),
+            content_type="application/x-ndjson",
+        )
+
+
+class ApiChangeFeedView(ApiLoginRequiredMixin, View):
+    """
+    Stream as NDJSON the records changed since a watermark, for downstream systems that sync deltas.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return the records changed between since (the watermark of the previous sync, omitted for a full sync)
+        and the new watermark, sent on the last line and in the X-Watermark header.
+        """
+        since = None
+        if request.GET.get("since"):
+            try:
+                since = parse_watermark(request.GET["since"])
+            except ValueError as error:
+                raise ApiError(str(error)) from error
+        resources = None
+        if request.GET.get("resources"):
+            resources = request.GET["resources"].split(",")
+            unknown = set(resources) - set(CHANGE_FEED_SOURCES)
+            if unknown:
+                raise ApiError(f"Unknown resources: {', '.join(sorted(unknown))}.")
+        until = get_watermark()
+        # The records are read while the response is streamed, after ReplicaMiddleware, from the primary:
+        # the watermark's lag does not account for the replication lag
+        response = StreamingHttpResponse(
+            iter_changes(since, until, resources), content_type="application/x-ndjson"
+        )
+        response["X-Watermark"] = until.isoformat()
+        return response
+
+
+class ApiPatientLookupView(ApiLoginRequiredMixin, View):
+    """
+    Return the patients whose N.I.C/passport number, name, surname or unit number starts with q,
+    for the autocomplete of the patient search box.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return the first limit matches (default 10), ordered by surname and name.
+        """
+        try:
+            limit = min(
+                int(request.GET.get("limit", PATIENT_LOOKUP_LIMIT)),
+                PATIENT_LOOKUP_MAX_LIMIT,
+            )
+        except ValueError as error:
+            raise ApiError("Invalid limit.") from error
+        if limit < 1:
+            raise ApiError("Invalid limit.")
+        response = JsonResponse(
+            {"results": lookup_patients(request.GET.get("q", ""), limit)}
+        )
+        # The browser reuses the matches while the user types and deletes characters
+        patch_cache_control(
+            response, private=True, max_age=settings.PATIENT_LOOKUP_CACHE_TIMEOUT
+        )
+        return response
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RenaldataregistryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "renaldataregistry"
+
+    def ready(self):
+        # Connect the signal receivers and register the checks
+        # pylint: disable=import-outside-toplevel, unused-import
+        from renaldataregistry import cohorts, comorbidities, vendor
+        from utils import connections
@@ -0,0 +1,371 @@
+"""
+This file contains the asynchronous views, served without blocking a worker when the app runs under ASGI.
+The read-only pages (patient list, registration history, patient, timeline, KRT modality and assessment details) have
+an asynchronous variant, used instead of the class-based view with ASYNC_VIEWS (see urls.py), that runs its
+independent queries concurrently.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.paginator import InvalidPage, Paginator
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from renaldataregistry.etags import (
+    patient_view_etag,
+    patient_modality_detail_etag,
+    patient_assessment_detail_etag,
+)
+from renaldataregistry.history import diff_history_rows
+from renaldataregistry.models import (
+    Patient,
+    PatientRegistration,
+    PatientRenalDiagnosis,
+    PatientAKImeasurement,
+    PatientKRTModality,
+    PatientAssessment,
+)
+from renaldataregistry.prepared import (
+    CURRENT_KRT_MODALITY,
+    FIRST_KRT_MODALITY,
+    FORM_ASSESSMENT,
+)
+from renaldataregistry.reference_data import get_hd_unit_options
+from renaldataregistry.timeline import decode_cursor, encode_cursor, get_timeline
+from renaldataregistry.views import (
+    PatientRegistrationListView,
+    PatientRegistrationHistoryView,
+    search_patientregistrations,
+)
+
+
+def database_sync_to_async(function):
+    """
+    Return a coroutine function running the ORM function in a thread of the event loop's executor, so that
+    several of them run concurrently, each on the database connection of its thread. As channels'
+    database_sync_to_async, the connections of the thread older than CONN_MAX_AGE (or broken) are closed before
+    and after, the request_started and request_finished signals closing them are not sent in these threads.
+    """
+
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def gather_queries(*functions):
+    """
+    Run the ORM functions (without arguments) concurrently and return their results.
+    """
+    return await asyncio.gather(
+        *(database_sync_to_async(function)() for function in functions)
+    )
+
+
+async def render_async(request, template_name, context):
+    """
+    Render the template, the ORM being synchronous: the template may read related records.
+    """
+    return await database_sync_to_async(render)(request, template_name, context)
+
+
+def async_login_required(view):
+    """
+    Redirect the anonymous users to the login page, as LoginRequiredMixin.
+    """
+
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        # The ORM (sessions) is synchronous
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return inner
+
+
+def async_condition(etag_func):
+    """
+    Answer 304 Not Modified when the browser has the ETag of the page, as condition(etag_func=...) of the
+    class-based views.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await database_sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if (
+                request.method in ("GET", "HEAD")
+                and etag
+                and not response.has_header("ETag")
+            ):
+                response.headers["ETag"] = etag
+            return response
+
+        return inner
+
+    return decorator
+
+
+async def paginate(request, queryset, per_page, extra_rows=0):
+    """
+    Return the paginator and the page of the queryset requested (page parameter), as ListView. The page
+    rows and the count are queried concurrently, unless the last page is requested. The page rows are
+    followed by up to extra_rows rows of the next page.
+    """
+    paginator = Paginator(queryset, per_page)
+    page_number = request.GET.get("page") or 1
+    count = None
+    if page_number == "last":
+        paginator.count = count = await database_sync_to_async(queryset.count)()
+        page_number = paginator.num_pages
+    try:
+        number = int(page_number)
+    except ValueError as error:
+        raise Http404(
+            "Page is not “last”, nor can it be converted to an int."
+        ) from error
+
+    bottom = (number - 1) * per_page
+    top = bottom + per_page + extra_rows
+    if count is None:
+        paginator.count, rows = await gather_queries(
+            queryset.count, lambda: list(queryset[bottom:top])
+        )
+    else:
+        rows = await database_sync_to_async(lambda: list(queryset[bottom:top]))()
+    try:
+        page = paginator.page(number)
+    except InvalidPage as error:
+        raise Http404(f"Invalid page ({number}): {error}") from error
+    page.object_list = rows[:per_page]
+    return paginator, page, rows[per_page:]
+
+
+@async_login_required
+async def unit_dropdownlist_options(request):
+    """
+    Return the <option> list of the HD units, loaded by the forms' HD unit selects (LazySelect widget).
+    The options are served from an in-memory index rebuilt when HD units change and cached by the browser.
+    """
+    etag, options = await sync_to_async(get_hd_unit_options)()
+    response = HttpResponse(options)
+    # ConditionalGetMiddleware answers 304 Not Modified when the browser has the same ETag
+    response.headers["ETag"] = etag
+    patch_cache_control(
+        response, private=True, max_age=settings.UNIT_OPTIONS_CACHE_MAX_AGE
+    )
+    return response
+
+
+@async_login_required
+async def patient_registration_list(request):
+    """
+    Asynchronous renaldataregistry.views.PatientRegistrationListView, the count and the page of the
+    patient registrations are queried concurrently.
+    """
+    search_word = request.GET.get("search_keyword")
+    paginator, page, _ = await paginate(
+        request,
+        search_patientregistrations(search_word),
+        PatientRegistrationListView.paginate_by,
+    )
+    context = {
+        "paginator": paginator,
+        "page_obj": page,
+        "is_paginated": page.has_other_pages(),
+        "object_list": page.object_list,
+        "patientregistration_list": page.object_list,
+    }
+    if request.user.is_superuser:
+        context["search_word"] = search_word
+        if search_word:
+            context["count"] = paginator.count
+    return await render_async(request, "patientregistration_list.html", context)
+
+
+@async_login_required
+async def patient_registration_history(request, patient_id):
+    """
+    Asynchronous renaldataregistry.views.PatientRegistrationHistoryView, the registration, the count and the
+    page of the history (with the version preceding the oldest one of the page) are queried concurrently.
+    """
+    history = (
+        PatientRegistration.history.filter(  # pylint: disable=no-member
+            patient_id=patient_id
+        )
+        .select_related("health_institution")
+        .order_by("-history_date", "-history_id")
+    )
+    patientregistration, (paginator, page, previous_rows) = await asyncio.gather(
+        database_sync_to_async(get_object_or_404)(PatientRegistration, pk=patient_id),
+        paginate(
+            request,
+            history,
+            PatientRegistrationHistoryView.paginate_by,
+            extra_rows=1,
+        ),
+    )
+    history_rows = diff_history_rows(
+        page.object_list, previous_rows[0] if previous_rows else None
+    )
+    return await render_async(
+        request,
+        PatientRegistrationHistoryView.template_name,
+        {
+            "paginator": paginator,
+            "page_obj": page,
+            "is_paginated": page.has_other_pages(),
+            "object_list": history_rows,
+            "patientregistration": patientregistration,
+            "patientregistration_history": history_rows,
+        },
+    )
+
+
+@async_login_required
+@async_condition(patient_view_etag)
+async def patient_view(request, **kwargs):
+    """
+    Asynchronous renaldataregistry.views.PatientView, the KRT modalities, assessment and renal diagnoses of
+    the patient's registration form are queried concurrently.
+    """
+    patient = await database_sync_to_async(get_object_or_404)(Patient, pk=kwargs["pk"])
+    (
+        patient_krtmodalities,
+        patient_assessement,
+        patientrenaldiagnoses,
+    ) = await gather_queries(
+        lambda: list(
+            PatientKRTModality.objects.filter(
+                patient=patient, created_at=patient.created_at
+            ).order_by("start_date")[:6]
+        ),
+        lambda: FORM_ASSESSMENT.get(patient, patient.created_at),
+        lambda: list(PatientRenalDiagnosis.objects.filter(patient=patient)),
+    )
+    context = {"object": patient, "patient": patient}
+    if patient_krtmodalities:
+        context["patient_krtmodalities"] = patient_krtmodalities
+    if patient_assessement:
+        context["patient_assessement"] = patient_assessement
+    for patientrenaldiagnosis in patientrenaldiagnoses:
+        if patientrenaldiagnosis.is_primary_renaldiagnosis:
+            context["patient_primaryrenaldiagnosis"] = patientrenaldiagnosis
+        else:
+            context["patient_secondaryrenaldiagnosis"] = patientrenaldiagnosis
+    return await render_async(request, "patient_view.html", context)
+
+
+@async_login_required
+async def patient_timeline(request, patient_id):
+    """
+    Asynchronous renaldataregistry.views.PatientTimelineView, the patient and the page of events are
+    queried concurrently.
+    """
+    try:
+        after = decode_cursor(request.GET.get("cursor"))
+    except ValueError as error:
+        raise Http404("Invalid cursor.") from error
+    patient, (events, has_more) = await gather_queries(
+        lambda: get_object_or_404(Patient, id=patient_id),
+        lambda: get_timeline(patient_id, after),
+    )
+    context = {
+        "patient": patient,
+        "events": events,
+        "is_first_page": after is None,
+    }
+    if has_more:
+        context["next_cursor"] = encode_cursor(events[-1].key)
+    return await render_async(request, "patient_timeline.html", context)
+
+
+@async_login_required
+@async_condition(patient_modality_detail_etag)
+async def patient_modality_detail(request, modality_id):
+    """
+    Asynchronous renaldataregistry.views.PatientModalityDetailView, the AKI measurement, assessment, previous
+    and first KRT modalities of the patient are queried concurrently.
+    """
+    patientmodality = await database_sync_to_async(get_object_or_404)(
+        PatientKRTModality.objects.select_related("patient"), pk=modality_id
+    )
+    patient = patientmodality.patient
+    (
+        patientakimeasurement,
+        patient_assessement,
+        previouspatientmodality,
+        patient_first_krtmodality,
+    ) = await gather_queries(
+        lambda: PatientAKImeasurement.objects.filter(
+            patient=patient, created_at=patientmodality.created_at
+        ).first(),
+        lambda: FORM_ASSESSMENT.get(patient, patientmodality.created_at),
+        # The queryset is only evaluated by first(), in the thread
+        PatientKRTModality.objects.filter(
+            patient=patient, start_date__lt=patientmodality.start_date
+        )
+        .order_by("-start_date")
+        .first,
+        lambda: FIRST_KRT_MODALITY.get(patient),
+    )
+    return await render_async(
+        request,
+        "patientmodality_view.html",
+        {
+            "patientmodality": patientmodality,
+            "patientakimeasurement": patientakimeasurement,
+            "patient_assessement": patient_assessement,
+            "previouspatientmodality": previouspatientmodality,
+            "is_first_modality": (
+                "Yes" if patientmodality == patient_first_krtmodality else "No"
+            ),
+        },
+    )
+
+
+@async_login_required
+@async_condition(patient_assessment_detail_etag)
+async def patient_assessment_detail(request, assessment_id):
+    """
+    Asynchronous renaldataregistry.views.PatientAssessmentDetailView, the current and first KRT modalities of
+    the patient are queried concurrently.
+    """
+    patientassesment = await database_sync_to_async(get_object_or_404)(
+        PatientAssessment.objects.select_related("patient"), pk=assessment_id
+    )
+    patient = patientassesment.patient
+    patient_current_krtmodality, patient_first_krtmodality = await gather_queries(
+        lambda: CURRENT_KRT_MODALITY.get(patient),
+        lambda: FIRST_KRT_MODALITY.get(patient),
+    )
+    # HD, modality 2
+    # PD, modality 3
+    current_krt_is_first_dialysis = (
+        patient_first_krtmodality.modality in (2, 3)
+        and patient_current_krtmodality == patient_first_krtmodality
+    )
+    return await render_async(
+        request,
+        "patientassessment_view.html",
+        {
+            "patientassesment": patientassesment,
+            "patient_current_krtmodality": patient_current_krtmodality,
+            "current_krt_is_first_dialysis": current_krt_is_first_dialysis,
+        },
+    )
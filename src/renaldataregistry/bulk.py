@@ -0,0 +1,476 @@
+"""
+This file contains the bulk ingestion of KRT modalities and assessments sent by hospital systems as NDJSON batches.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from renaldataregistry.models import (
+    Patient,
+    PatientKRTModality,
+    PatientAssessment,
+    PatientLPAssessment,
+    PatientMedicationAssessment,
+    PatientDialysisAssessment,
+    HDUnit,
+    Comorbidity,
+    Disability,
+)
+from renaldataregistry.forms import (
+    PatientKRTModalityForm,
+    PatientAssessmentForm,
+    PatientAssessmentLPForm,
+    PatientAssessmentMedicationForm,
+    PatientAssessmentDialysisForm,
+)
+from renaldataregistry.comorbidities import update_comorbidity_masks
+from utils.mixin import validate_krt_modality
+
+BULK_BATCH_SIZE = 500
+
+
+def get_form_field_names(form_class):
+    """
+    Return the names of the model fields of a form, the fields the bulk ingestion accepts.
+    """
+    return form_class._meta.fields
+
+
+# Sub-records of an assessment: key in the NDJSON record -> (model, fields)
+ASSESSMENT_SUB_RECORDS = {
+    "lp": (PatientLPAssessment, get_form_field_names(PatientAssessmentLPForm)),
+    "medication": (
+        PatientMedicationAssessment,
+        get_form_field_names(PatientAssessmentMedicationForm),
+    ),
+    "dialysis": (
+        PatientDialysisAssessment,
+        get_form_field_names(PatientAssessmentDialysisForm),
+    ),
+}
+# Many-to-many fields of an assessment: key in the NDJSON record -> reference model
+ASSESSMENT_M2M = {"comorbidity": Comorbidity, "disability": Disability}
+
+
+class BulkRecord:
+    """
+    A line of the NDJSON batch, with its cleaned values and its result.
+    """
+
+    def __init__(self, line_number, data):
+        self.line_number = line_number
+        self.data = data
+        self.errors = {}
+        self.values = {}
+        self.instance = None
+        self.created = False
+
+    def add_error(self, field_name, messages):
+        """
+        Record validation errors of a field ("__all__" for errors of the whole record).
+        """
+        self.errors.setdefault(field_name, []).extend(messages)
+
+    def result(self):
+        """
+        Return the per-record result sent back to the client.
+        """
+        if self.errors:
+            return {"line": self.line_number, "status": "error", "errors": self.errors}
+        return {
+            "line": self.line_number,
+            "status": "created" if self.created else "updated",
+            "type": self.data.get("type"),
+            "id": self.instance.pk,
+        }
+
+
+def clean_values(record, model, field_names, data, related_ids, partial=True):
+    """
+    Convert and validate the values of data with the model fields, without querying the database.
+    Foreign keys are checked against related_ids (field name -> set of valid ids).
+    With partial, only the fields sent are returned, otherwise missing fields take the model default.
+    Values are keyed by the field attname (e.g. hd_unit_id).
+    """
+    values = {}
+    for field_name in field_names:
+        field = model._meta.get_field(field_name)
+        if field_name in data:
+            value = data[field_name]
+        elif partial:
+            continue
+        else:
+            value = field.get_default()
+        try:
+            if field.is_relation:
+                value = field.to_python(value)
+                if value is not None and value not in related_ids[field_name]:
+                    raise ValidationError(
+                        "Select a valid choice. That choice is not one of the available choices."
+                    )
+                if value is None and not field.null:
+                    raise ValidationError("This field cannot be null.")
+                values[field.attname] = value
+            else:
+                values[field.attname] = field.clean(value, None)
+        except ValidationError as error:
+            record.add_error(field_name, error.messages)
+    return values
+
+
+def get_checked_values(model, field_names, record, instance):
+    """
+    Return the values checked by the validation rules, keyed by field name: the values of the record once
+    written, i.e. the existing instance's values updated with the fields sent.
+    """
+    fields = [model._meta.get_field(field_name) for field_name in field_names]
+    values = {}
+    if instance is not None:
+        values = {field.name: getattr(instance, field.attname) for field in fields}
+    values.update(
+        {
+            field.name: record.values[field.attname]
+            for field in fields
+            if field.attname in record.values
+        }
+    )
+    return values
+
+
+def get_existing(model, records, key_field):
+    """
+    Load in one query the existing records matched by id or by (patient, key_field).
+    """
+    ids = {record.data["id"] for record in records if record.data.get("id")}
+    keys = {
+        record.values.get(key_field) for record in records if not record.data.get("id")
+    }
+    patient_ids = {record.patient.pk for record in records}
+    existing = model.objects.filter(pk__in=ids) | model.objects.filter(
+        patient_id__in=patient_ids, **{f"{key_field}__in": keys}
+    )
+    by_id = {}
+    by_key = {}
+    for instance in existing:
+        by_id[instance.pk] = instance
+        by_key[(instance.patient_id, getattr(instance, key_field))] = instance
+    return by_id, by_key
+
+
+def match_existing(record, by_id, by_key, key_field):
+    """
+    Return the existing record that the NDJSON record updates (if exists).
+    """
+    record_id = record.data.get("id")
+    if record_id:
+        instance = by_id.get(record_id)
+        if instance is None or instance.patient_id != record.patient.pk:
+            record.add_error("id", ["Unknown record for this patient."])
+        return instance
+    return by_key.get((record.patient.pk, record.values.get(key_field)))
+
+
+def clean_assessment(record, field_names, reference_ids):
+    """
+    Convert and validate the values of an assessment record, its comorbidity and disability ids (checked against
+    reference_ids) and the values of its sub-records (kept in record.sub_values).
+    """
+    record.values = clean_values(
+        record, PatientAssessment, field_names + ["created_at"], record.data, {}
+    )
+    for key in ASSESSMENT_M2M:
+        ids = record.data.get(key, [])
+        if not isinstance(ids, list) or not all(
+            isinstance(reference_id, int) and reference_id in reference_ids[key]
+            for reference_id in ids
+        ):
+            record.add_error(key, ["Unknown ids."])
+    record.sub_values = {}
+    for key, (model, sub_field_names) in ASSESSMENT_SUB_RECORDS.items():
+        if isinstance(record.data.get(key), dict):
+            sub_record = BulkRecord(record.line_number, record.data[key])
+            record.sub_values[key] = clean_values(
+                sub_record, model, sub_field_names, record.data[key], {}
+            )
+            for field_name, messages in sub_record.errors.items():
+                record.add_error(f"{key}.{field_name}", messages)
+
+
+def write_assessment_sub_records(records):
+    """
+    Insert or update the LP, medication and dialysis sub-records sent with the written assessments.
+    """
+    for key, (model, _) in ASSESSMENT_SUB_RECORDS.items():
+        sub_records = [record for record in records if key in record.sub_values]
+        existing = model.objects.in_bulk([record.instance.pk for record in sub_records])
+        new_instances = []
+        updated_instances = []
+        updated_fields = set()
+        for record in sub_records:
+            sub_instance = existing.get(record.instance.pk)
+            if sub_instance is None:
+                new_instances.append(
+                    model(patientassessment=record.instance, **record.sub_values[key])
+                )
+            else:
+                for field_name, value in record.sub_values[key].items():
+                    setattr(sub_instance, field_name, value)
+                updated_fields.update(record.sub_values[key])
+                updated_instances.append(sub_instance)
+        model.objects.bulk_create(new_instances, batch_size=BULK_BATCH_SIZE)
+        if updated_fields:
+            model.objects.bulk_update(
+                updated_instances,
+                sorted(updated_fields),
+                batch_size=BULK_BATCH_SIZE,
+            )
+
+
+def write_assessment_m2m(records):
+    """
+    Replace the comorbidities and disabilities of the written assessments that sent them, through the M2M tables.
+    """
+    for key in ASSESSMENT_M2M:
+        through = PatientAssessment._meta.get_field(key).remote_field.through
+        m2m_records = [record for record in records if key in record.data]
+        if not m2m_records:
+            continue
+        through.objects.filter(
+            patientassessment_id__in=[record.instance.pk for record in m2m_records]
+        ).delete()
+        through.objects.bulk_create(
+            [
+                through(
+                    patientassessment_id=record.instance.pk,
+                    **{f"{key}_id": reference_id},
+                )
+                for record in m2m_records
+                for reference_id in set(record.data[key])
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        # bulk_create does not send m2m_changed
+        if key == "comorbidity":
+            update_comorbidity_masks([record.instance.pk for record in m2m_records])
+
+
+class BulkUpsert:
+    """
+    Validate and write a batch of KRT modalities and assessments in one transaction.
+    Records are matched to patients by N.I.C/passport number (Patient.pid) and upserted:
+    modalities on (patient, start_date) and assessments on (patient, created_at), unless an id is given.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.records = []
+
+    def parse(self, lines):
+        """
+        Parse the NDJSON lines of the batch.
+        """
+        for line_number, line in enumerate(lines, start=1):
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError
+            except ValueError:
+                record = BulkRecord(line_number, {})
+                record.add_error("__all__", ["Line is not a JSON object."])
+            else:
+                record = BulkRecord(line_number, data)
+                if data.get("type") not in ("modality", "assessment"):
+                    record.add_error(
+                        "type", ['Type must be "modality" or "assessment".']
+                    )
+                record_id = data.get("id")
+                if record_id is not None and (
+                    not isinstance(record_id, int) or isinstance(record_id, bool)
+                ):
+                    record.add_error("id", ["Id must be an integer."])
+            self.records.append(record)
+
+    def run(self, lines):
+        """
+        Ingest the batch and return the result of every record, in the order of the batch.
+        """
+        self.parse(lines)
+        patients = Patient.objects.in_bulk(
+            {record.data.get("pid") for record in self.records if not record.errors}
+            - {None},
+            field_name="pid",
+        )
+        for record in self.records:
+            if record.errors:
+                continue
+            patient = patients.get(record.data.get("pid"))
+            if patient is None:
+                record.add_error("pid", ["Unknown patient."])
+            else:
+                record.patient = patient
+
+        modalities = [
+            record
+            for record in self.records
+            if not record.errors and record.data["type"] == "modality"
+        ]
+        assessments = [
+            record
+            for record in self.records
+            if not record.errors and record.data["type"] == "assessment"
+        ]
+        with transaction.atomic():
+            self.upsert_modalities(modalities)
+            self.upsert_assessments(assessments)
+        return [record.result() for record in self.records]
+
+    def write(self, model, records):
+        """
+        Insert the new records and update the existing ones in batches, updating only the fields sent.
+        """
+        now = timezone.now()
+        new_instances = []
+        updated_instances = []
+        updated_fields = set()
+        for record in records:
+            if record.created:
+                new_instances.append(record.instance)
+            else:
+                # bulk_update() does not apply auto_now
+                record.instance.updated_at = now
+                record.instance.updated_by = self.user
+                updated_instances.append(record.instance)
+                updated_fields.update(record.values)
+        model.objects.bulk_create(new_instances, batch_size=BULK_BATCH_SIZE)
+        if updated_instances:
+            model.objects.bulk_update(
+                updated_instances,
+                sorted(updated_fields | {"updated_at", "updated_by"}),
+                batch_size=BULK_BATCH_SIZE,
+            )
+
+    def build(self, model, record, instance):
+        """
+        Create or update the model instance of a valid record.
+        """
+        if instance is None:
+            created_at = record.values.pop("created_at", None)
+            instance = model(
+                patient=record.patient,
+                created_at=created_at or timezone.now(),
+                created_by=self.user,
+                **record.values,
+            )
+            if created_at:
+                record.values["created_at"] = created_at
+            record.created = True
+        else:
+            for field_name, value in record.values.items():
+                setattr(instance, field_name, value)
+        record.instance = instance
+
+    def match_and_build(self, model, records, field_names, key_field, related_ids):
+        """
+        Match the records to the existing ones and build their instances.
+        New records are validated with all the fields, defaults filling the missing ones.
+        """
+        by_id, by_key = get_existing(
+            model, [record for record in records if not record.errors], key_field
+        )
+        for record in records:
+            if record.errors:
+                continue
+            instance = match_existing(record, by_id, by_key, key_field)
+            if instance is None and not record.errors:
+                record.values.update(
+                    clean_values(
+                        record,
+                        model,
+                        [
+                            field_name
+                            for field_name in field_names
+                            if field_name not in record.data
+                        ],
+                        {},
+                        related_ids,
+                        partial=False,
+                    )
+                )
+            if model is PatientKRTModality:
+                for message in validate_krt_modality(
+                    get_checked_values(model, field_names, record, instance)
+                ):
+                    record.add_error("__all__", [message])
+            if not record.errors:
+                self.build(model, record, instance)
+                # Later records of the batch with the same key update this one
+                by_key.setdefault(
+                    (record.patient.pk, getattr(record.instance, key_field)),
+                    record.instance,
+                )
+        return [record for record in records if not record.errors]
+
+    def upsert_modalities(self, records):
+        """
+        Validate and write the KRT modalities of the batch.
+        When a batch sets a current modality, the previous current modality of the patient stops being current
+        (the last current modality of the batch wins).
+        """
+        field_names = get_form_field_names(PatientKRTModalityForm)
+        related_ids = {"hd_unit": set(HDUnit.objects.values_list("pk", flat=True))}
+        for record in records:
+            record.values = clean_values(
+                record, PatientKRTModality, field_names, record.data, related_ids
+            )
+        valid_records = self.match_and_build(
+            PatientKRTModality, records, field_names, "start_date", related_ids
+        )
+
+        current_by_patient = {
+            record.patient.pk: record
+            for record in valid_records
+            if record.instance.is_current
+        }
+        if current_by_patient:
+            # update() does not apply auto_now, updated_at is set for the change feed
+            PatientKRTModality.objects.filter(
+                patient_id__in=current_by_patient, is_current=True
+            ).update(is_current=False, updated_at=timezone.now())
+            Patient.objects.filter(pk__in=current_by_patient).exclude(
+                in_krt_modality="Y"
+            ).update(in_krt_modality="Y", updated_at=timezone.now())
+            for record in valid_records:
+                if record.patient.pk in current_by_patient:
+                    record.instance.is_current = (
+                        record is current_by_patient[record.patient.pk]
+                    )
+                    record.values["is_current"] = record.instance.is_current
+        self.write(PatientKRTModality, valid_records)
+
+    def upsert_assessments(self, records):
+        """
+        Validate and write the assessments of the batch, with their LP, medication and dialysis sub-records
+        and their comorbidities and disabilities.
+        """
+        field_names = [
+            field_name
+            for field_name in get_form_field_names(PatientAssessmentForm)
+            if field_name not in ASSESSMENT_M2M
+        ]
+        reference_ids = {
+            key: set(model.objects.values_list("pk", flat=True))
+            for key, model in ASSESSMENT_M2M.items()
+        }
+        for record in records:
+            clean_assessment(record, field_names, reference_ids)
+        valid_records = self.match_and_build(
+            PatientAssessment, records, field_names, "created_at", {}
+        )
+        self.write(PatientAssessment, valid_records)
+        write_assessment_sub_records(valid_records)
+        write_assessment_m2m(valid_records)
@@ -0,0 +1,203 @@
+"""
+This file contains the change feed: the records changed or deleted in a time window, used by downstream systems to
+sync deltas.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from renaldataregistry.models import (
+    Patient,
+    PatientRegistration,
+    PatientKRTModality,
+    PatientAssessment,
+    PatientStop,
+    PatientMerge,
+)
+
+CHANGE_FEED_CHUNK_SIZE = 2000
+
+
+class ChangeFeedSource:
+    """
+    Define the model of a type of record in the change feed, with the one-to-one sub-records and
+    many-to-many ids sent with it. The records whose id is the patient's are deleted with the patient
+    (merged_patients).
+    """
+
+    def __init__(self, model, one_to_one=None, many_to_many=None):
+        self.model = model
+        self.merged_patients = model is Patient or model._meta.pk.name == "patient"
+        self.field_names = [field.name for field in model._meta.concrete_fields]
+        self.pk_name = model._meta.pk.name
+        # key in the record -> accessor of the one-to-one sub-record
+        self.one_to_one = {
+            key: (
+                accessor,
+                [
+                    field.name
+                    for field in model._meta.get_field(
+                        accessor
+                    ).related_model._meta.concrete_fields
+                    if not field.primary_key
+                ],
+            )
+            for key, accessor in (one_to_one or {}).items()
+        }
+        self.many_to_many = many_to_many or []
+
+    def get_queryset(self, since, until):
+        """
+        Return the rows changed in [since, until), ordered as the (updated_at, pk) index.
+        """
+        queryset = self.model.objects.filter(updated_at__lt=until)
+        if since is not None:
+            queryset = queryset.filter(updated_at__gte=since)
+        value_names = list(self.field_names)
+        for accessor, field_names in self.one_to_one.values():
+            value_names.extend(
+                f"{accessor}__{field_name}" for field_name in field_names
+            )
+        return queryset.order_by("updated_at", "pk").values(*value_names)
+
+    def iter_records(self, since, until):
+        """
+        Yield the changed records, reading the rows in chunks with a server side cursor.
+        """
+        chunk = []
+        for row in self.get_queryset(since, until).iterator(
+            chunk_size=CHANGE_FEED_CHUNK_SIZE
+        ):
+            chunk.append(row)
+            if len(chunk) == CHANGE_FEED_CHUNK_SIZE:
+                yield from self.serialize_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self.serialize_chunk(chunk)
+
+    def serialize_chunk(self, rows):
+        """
+        Build the records of a chunk of rows, many-to-many ids take one query per chunk.
+        """
+        pks = [row[self.pk_name] for row in rows]
+        many_to_many_ids = {}
+        for field_name in self.many_to_many:
+            ids_by_pk = {pk: [] for pk in pks}
+            through = self.model._meta.get_field(field_name).remote_field.through
+            source_name = f"{self.model._meta.model_name}_id"
+            for source_id, target_id in (
+                through.objects.filter(**{f"{source_name}__in": pks})
+                .order_by(source_name, f"{field_name}_id")
+                .values_list(source_name, f"{field_name}_id")
+            ):
+                ids_by_pk[source_id].append(target_id)
+            many_to_many_ids[field_name] = ids_by_pk
+
+        for row in rows:
+            data = {field_name: row[field_name] for field_name in self.field_names}
+            for key, (accessor, field_names) in self.one_to_one.items():
+                sub_record = {
+                    field_name: row[f"{accessor}__{field_name}"]
+                    for field_name in field_names
+                }
+                # Every field is None in the LEFT JOIN when the sub-record does not exist
+                data[key] = (
+                    sub_record
+                    if any(value is not None for value in sub_record.values())
+                    else None
+                )
+            for field_name, ids_by_pk in many_to_many_ids.items():
+                data[field_name] = ids_by_pk[row[self.pk_name]]
+            yield data
+
+
+def iter_merged_patients(since, until):
+    """
+    Yield the (id, patient kept id, merge time) of the patients merged in [since, until), deleted by the merge.
+    """
+    merges = PatientMerge.objects.filter(created_at__lt=until)
+    if since is not None:
+        merges = merges.filter(created_at__gte=since)
+    yield from merges.order_by("created_at", "pk").values_list(
+        "merged_patient_id", "patient", "created_at"
+    )
+
+
+# Resource name (as in the JSON API) -> source
+CHANGE_FEED_SOURCES = {
+    "patients": ChangeFeedSource(Patient),
+    "registrations": ChangeFeedSource(PatientRegistration),
+    "modalities": ChangeFeedSource(PatientKRTModality),
+    "assessments": ChangeFeedSource(
+        PatientAssessment,
+        one_to_one={
+            "lp": "patientlpassessment",
+            "medication": "patientmedicationassessment",
+            "dialysis": "patientdialysisassessment",
+        },
+        many_to_many=["comorbidity", "disability"],
+    ),
+    "stops": ChangeFeedSource(PatientStop),
+}
+
+
+def parse_watermark(value):
+    """
+    Parse an ISO 8601 watermark, naive values are in the current time zone.
+    """
+    watermark = parse_datetime(value) if value else None
+    if watermark is None:
+        raise ValueError(f"Invalid watermark: {value}.")
+    if timezone.is_naive(watermark):
+        watermark = timezone.make_aware(watermark)
+    return watermark
+
+
+def get_watermark():
+    """
+    Return the end of the window of a change feed requested now.
+    updated_at is set when a record is saved, before its transaction commits, so the window ends
+    CHANGE_FEED_LAG_SECONDS ago to not skip records of transactions that were still in progress.
+    """
+    return timezone.now() - timedelta(seconds=settings.CHANGE_FEED_LAG_SECONDS)
+
+
+def iter_changes(since, until, resources=None):
+    """
+    Yield the NDJSON lines of the records changed in [since, until), followed by a last line with the watermark
+    to send as since in the next request. The records deleted with the patients merged in the window are sent
+    as tombstones (deleted, with the id of the patient kept), the other records of the merged patients are
+    sent as changed records of the patient kept.
+    """
+    for resource in resources or CHANGE_FEED_SOURCES:
+        source = CHANGE_FEED_SOURCES[resource]
+        for data in source.iter_records(since, until):
+            yield json.dumps(
+                {
+                    "resource": resource,
+                    "id": data[source.pk_name],
+                    "updated_at": data["updated_at"],
+                    "data": data,
+                },
+                cls=DjangoJSONEncoder,
+            ) + "\n"
+        if source.merged_patients:
+            for merged_patient_id, patient_id, merged_at in iter_merged_patients(
+                since, until
+            ):
+                yield json.dumps(
+                    {
+                        "resource": resource,
+                        "id": merged_patient_id,
+                        "updated_at": merged_at,
+                        "deleted": True,
+                        "merged_into": patient_id,
+                        "data": None,
+                    },
+                    cls=DjangoJSONEncoder,
+                ) + "\n"
+    # isoformat() keeps the microseconds that DjangoJSONEncoder drops
+    yield json.dumps({"watermark": until.isoformat()}) + "\n"
@@ -0,0 +1,306 @@
+"""
+This file contains the cohort builder: cohorts of patients defined by criteria on their registration, KRT modalities,
+assessments (comorbidities...) and laboratory values, compiled to one query on the patients with an EXISTS subquery
+per criterion. The ids of a cohort are cached while the tables it reads are not updated.
+"""
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, Max, OuterRef, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from renaldataregistry.models import (
+    Patient,
+    PatientRegistration,
+    PatientAKImeasurement,
+    PatientKRTModality,
+    PatientAssessment,
+    PatientDialysisAssessment,
+    PatientLPAssessment,
+    PatientMedicationAssessment,
+    PatientStop,
+)
+
+COHORT_CACHE_KEY = "renaldataregistry.cohort"
+
+
+class Cohort(ABC):
+    """
+    Define a cohort of patients. Cohorts are combined with & (and), | (or), ~ (not) and - (and not) into a cohort
+    compiled to one query, e.g. Modality(modality="HD") & Lab(hb_gdl__lt=10).
+    """
+
+    @abstractmethod
+    def get_condition(self):
+        """
+        Return the condition (Q) of the patients of the cohort.
+        """
+
+    @abstractmethod
+    def get_definition(self):
+        """
+        Return the JSON definition of the cohort (see parse_cohort).
+        """
+
+    @abstractmethod
+    def get_models(self):
+        """
+        Return the models read by the cohort, whose updates invalidate its cached ids.
+        """
+
+    def __and__(self, other):
+        return CohortCombination("and", [self, other])
+
+    def __or__(self, other):
+        return CohortCombination("or", [self, other])
+
+    def __invert__(self):
+        return CohortCombination("not", [self])
+
+    def __sub__(self, other):
+        return self & ~other
+
+    def get_queryset(self):
+        """
+        Return the patients of the cohort.
+        """
+        return Patient.objects.filter(self.get_condition())
+
+    def get_watermark(self):
+        """
+        Return the last update of each model read by the cohort. The watermark is read from the database, so
+        that the ids cached by every process expire: the changes to the rows without updated_at (the
+        comorbidities, the sub-records of the assessments) update the updated_at of their assessment.
+        """
+        return [
+            model.objects.aggregate(updated_at=Max("updated_at"))["updated_at"]
+            for model in sorted(self.get_models(), key=lambda model: model.__name__)
+        ]
+
+    def get_ids(self):
+        """
+        Return the ids of the patients of the cohort as a frozenset, from the cache while the tables the cohort
+        reads are not updated. The ids are queried again every COHORT_CACHE_TIMEOUT seconds, which accounts
+        for the deleted rows. The sets of several cohorts are combined with the set operators without querying.
+        """
+        definition = json.dumps(self.get_definition(), sort_keys=True, default=str)
+        digest = hashlib.sha1(definition.encode()).hexdigest()  # nosec B324
+        key = f"{COHORT_CACHE_KEY}.{digest}"
+        cached = cache.get(key)
+        watermark = self.get_watermark()
+        if cached is not None and cached["watermark"] == watermark:
+            return cached["ids"]
+
+        ids = frozenset(self.get_queryset().values_list("pk", flat=True))
+        expires_at = (
+            cached["expires_at"]
+            if cached is not None
+            else time.time() + settings.COHORT_CACHE_TIMEOUT
+        )
+        timeout = expires_at - time.time()
+        if timeout > 0:
+            cache.set(
+                key,
+                {"watermark": watermark, "ids": ids, "expires_at": expires_at},
+                timeout,
+            )
+        return ids
+
+
+class CohortCombination(Cohort):
+    """
+    Define the patients of all (and), any (or) or none (not) of the cohorts.
+    """
+
+    def __init__(self, operator, cohorts):
+        if operator not in ("and", "or", "not"):
+            raise ValueError(f"Unknown cohort operator {operator}.")
+        if not cohorts or (operator == "not" and len(cohorts) != 1):
+            raise ValueError(
+                f"The cohort operator {operator} has {len(cohorts)} cohorts."
+            )
+        self.operator = operator
+        # Nested combinations of the same operator are flattened, so a & b & c has the definition of and [a, b, c]
+        self.cohorts = []
+        for cohort in cohorts:
+            if (
+                operator != "not"
+                and isinstance(cohort, CohortCombination)
+                and cohort.operator == operator
+            ):
+                self.cohorts.extend(cohort.cohorts)
+            else:
+                self.cohorts.append(cohort)
+
+    def get_condition(self):
+        conditions = [cohort.get_condition() for cohort in self.cohorts]
+        condition = conditions[0]
+        for other in conditions[1:]:
+            condition = (
+                condition | other if self.operator == "or" else condition & other
+            )
+        return ~condition if self.operator == "not" else condition
+
+    def get_definition(self):
+        if self.operator == "not":
+            return {"not": self.cohorts[0].get_definition()}
+        return {self.operator: [cohort.get_definition() for cohort in self.cohorts]}
+
+    def get_models(self):
+        return set().union(*(cohort.get_models() for cohort in self.cohorts))
+
+
+class CohortCriterion(Cohort):
+    """
+    Define the patients with a row of model matching the lookups (keyword arguments of filter). The values of the
+    fields with choices can be given by their label, e.g. modality="HD". The rows of a model other than Patient
+    are matched with an EXISTS subquery on the patient.
+    """
+
+    name = None
+    model = None
+    # Path from the model to the patient
+    patient = "patient"
+    # Model whose updated_at is updated with the rows of model
+    updated_model = None
+
+    def __init__(self, **lookups):
+        if not lookups:
+            raise ValueError(f"The {self.name} criterion has no lookup.")
+        self.lookups = lookups
+
+    def get_lookups(self):
+        """
+        Return the lookups with the labels of the choices replaced by their value.
+        """
+        lookups = {}
+        for lookup, value in self.lookups.items():
+            field_name, _, operator = lookup.partition("__")
+            choices = {}
+            if operator in ("", "exact", "in"):
+                field = self.model._meta.get_field(field_name)
+                choices = {label: choice for choice, label in field.choices or ()}
+            if operator == "in":
+                value = [choices.get(item, item) for item in value]
+            elif isinstance(value, str):
+                value = choices.get(value, value)
+            lookups[lookup] = value
+        return lookups
+
+    def get_condition(self):
+        if self.model is Patient:
+            return Q(**self.get_lookups())
+        return Q(
+            Exists(
+                self.model.objects.filter(
+                    **{self.patient: OuterRef("pk")}, **self.get_lookups()
+                )
+            )
+        )
+
+    def get_definition(self):
+        return {self.name: self.lookups}
+
+    def get_models(self):
+        return {self.updated_model or self.model}
+
+
+class PatientCriterion(CohortCriterion):
+    name = "patient"
+    model = Patient
+
+
+class Registration(CohortCriterion):
+    name = "registration"
+    model = PatientRegistration
+
+
+class Modality(CohortCriterion):
+    name = "modality"
+    model = PatientKRTModality
+
+
+class Assessment(CohortCriterion):
+    name = "assessment"
+    model = PatientAssessment
+
+
+class Lab(CohortCriterion):
+    name = "lab"
+    model = PatientLPAssessment
+    patient = "patientassessment__patient"
+    updated_model = PatientAssessment
+
+
+class AKIMeasurement(CohortCriterion):
+    name = "aki"
+    model = PatientAKImeasurement
+
+
+class Stop(CohortCriterion):
+    name = "stop"
+    model = PatientStop
+
+
+@receiver(post_save, sender=PatientDialysisAssessment)
+@receiver(post_delete, sender=PatientDialysisAssessment)
+@receiver(post_save, sender=PatientLPAssessment)
+@receiver(post_delete, sender=PatientLPAssessment)
+@receiver(post_save, sender=PatientMedicationAssessment)
+@receiver(post_delete, sender=PatientMedicationAssessment)
+def update_assessment_updated_at(instance, **kwargs):
+    """
+    Update the updated_at of the assessment of a sub-record saved or deleted, the watermark of the cohorts
+    reading the sub-records (see Lab.updated_model).
+    """
+    PatientAssessment.objects.filter(pk=instance.patientassessment_id).update(
+        updated_at=timezone.now()
+    )
+
+
+COHORT_CRITERIA = {
+    criterion.name: criterion
+    for criterion in (
+        PatientCriterion,
+        Registration,
+        Modality,
+        Assessment,
+        Lab,
+        AKIMeasurement,
+        Stop,
+    )
+}
+
+
+def parse_cohort(definition):
+    """
+    Return the cohort of a JSON definition: {"and": [...]}, {"or": [...]}, {"not": {...}} or a criterion
+    {name: {lookup: value}} with name one of COHORT_CRITERIA, e.g.
+    {"and": [{"modality": {"modality": "HD", "start_date__year": 2023}},
+             {"registration": {"health_institution__name": "Victoria Hospital"}},
+             {"assessment": {"comorbidity__comorbidity": "Diabetes"}},
+             {"lab": {"hb_gdl__lt": 10}}]}
+    """
+    if not isinstance(definition, dict) or len(definition) != 1:
+        raise ValueError(
+            "A cohort is defined by an object with one key: and, or, not or a criterion."
+        )
+    [(name, value)] = definition.items()
+    if name in ("and", "or"):
+        if not isinstance(value, list):
+            raise ValueError(f"The cohorts of {name} must be a list.")
+        return CohortCombination(name, [parse_cohort(item) for item in value])
+    if name == "not":
+        return ~parse_cohort(value)
+    if name not in COHORT_CRITERIA:
+        raise ValueError(
+            f"Unknown cohort criterion {name}, expected one of {', '.join(COHORT_CRITERIA)}."
+        )
+    if not isinstance(value, dict):
+        raise ValueError(f"The lookups of the {name} criterion must be an object.")
+    return COHORT_CRITERIA[name](**value)
@@ -0,0 +1,174 @@
+"""
+This file contains the comorbidity bitset of the assessments: each comorbidity has a bit, and the comorbidities of
+an assessment are summarized in PatientAssessment.comorbidity_mask, kept up to date with the M2M table. The
+prevalence of the combinations of comorbidities is counted by grouping the patients by the mask of their latest
+assessment, instead of joining the M2M table.
+"""
+from collections import Counter
+
+from django.contrib.postgres.aggregates import BitOr
+from django.db.models import (
+    BigIntegerField,
+    Count,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import m2m_changed, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from renaldataregistry.models import Comorbidity, Patient, PatientAssessment
+
+# Bits of the masks (bigint), the sign bit is not used
+COMORBIDITY_MASK_BITS = 63
+
+
+def with_comorbidity_bit(bit):
+    """
+    Return the assessments whose mask has the bit.
+    """
+    return PatientAssessment.objects.annotate(
+        has_bit=F("comorbidity_mask").bitand(1 << bit)
+    ).exclude(has_bit=0)
+
+
+def update_comorbidity_masks(assessment_ids):
+    """
+    Recompute the comorbidity masks of the assessments from the M2M table, in one UPDATE. The assessments'
+    updated_at is updated too, their comorbidities changed.
+    """
+    through = PatientAssessment.comorbidity.through
+    masks = (
+        through.objects.filter(
+            patientassessment=OuterRef("pk"), comorbidity__bit__isnull=False
+        )
+        .values("patientassessment")
+        .annotate(
+            mask=BitOr(
+                ExpressionWrapper(
+                    Cast(Value(1), BigIntegerField()).bitleftshift(
+                        F("comorbidity__bit")
+                    ),
+                    output_field=BigIntegerField(),
+                )
+            )
+        )
+        .values("mask")
+    )
+    PatientAssessment.objects.filter(pk__in=assessment_ids).update(
+        comorbidity_mask=Coalesce(Subquery(masks), 0), updated_at=timezone.now()
+    )
+
+
+@receiver(m2m_changed, sender=PatientAssessment.comorbidity.through)
+def comorbidities_changed(instance, action, reverse, pk_set, **kwargs):
+    """
+    Update the masks of the assessments whose comorbidities were added, removed or cleared.
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        update_comorbidity_masks([instance.pk])
+    else:
+        # A comorbidity added to or removed from assessments (pk_set), or cleared from all of its assessments
+        assessment_ids = set(pk_set or ())
+        if instance.bit is not None:
+            assessment_ids.update(
+                with_comorbidity_bit(instance.bit).values_list("pk", flat=True)
+            )
+        update_comorbidity_masks(assessment_ids)
+
+
+@receiver(pre_save, sender=Comorbidity)
+def assign_comorbidity_bit(instance, **kwargs):
+    """
+    Assign the lowest free bit to a new comorbidity. The comorbidities created when all the bits are assigned
+    have none, they are not summarized in the masks.
+    """
+    if instance.bit is not None:
+        return
+    assigned = set(
+        Comorbidity.objects.filter(bit__isnull=False).values_list("bit", flat=True)
+    )
+    instance.bit = next(
+        (bit for bit in range(COMORBIDITY_MASK_BITS) if bit not in assigned), None
+    )
+
+
+@receiver(post_delete, sender=Comorbidity)
+def clear_comorbidity_bit(instance, **kwargs):
+    """
+    Clear the bit of a deleted comorbidity from the masks (its M2M rows are deleted without m2m_changed),
+    before the bit is assigned to another comorbidity.
+    """
+    if instance.bit is None:
+        return
+    with_comorbidity_bit(instance.bit).update(
+        comorbidity_mask=F("comorbidity_mask").bitand(~(1 << instance.bit)),
+        updated_at=timezone.now(),
+    )
+
+
+def get_comorbidity_bits():
+    """
+    Return the comorbidities by bit.
+    """
+    return {
+        comorbidity.bit: comorbidity
+        for comorbidity in Comorbidity.objects.filter(bit__isnull=False).order_by("bit")
+    }
+
+
+def get_mask(comorbidities):
+    """
+    Return the mask of the comorbidities (without those having no bit).
+    """
+    mask = 0
+    for comorbidity in comorbidities:
+        if comorbidity.bit is not None:
+            mask |= 1 << comorbidity.bit
+    return mask
+
+
+def get_mask_comorbidities(mask, comorbidity_bits):
+    """
+    Return the comorbidities of the mask.
+    """
+    return [
+        comorbidity
+        for bit, comorbidity in comorbidity_bits.items()
+        if mask & (1 << bit)
+    ]
+
+
+def get_comorbidity_prevalence():
+    """
+    Return a Counter of the number of patients by the comorbidity mask of their latest assessment, counted in one
+    aggregate query. The patients without an assessment are not counted.
+    """
+    latest_mask = (
+        PatientAssessment.objects.filter(patient=OuterRef("pk"))
+        .order_by("-created_at", "-pk")
+        .values("comorbidity_mask")[:1]
+    )
+    rows = (
+        Patient.objects.values(mask=Subquery(latest_mask))
+        .annotate(patients=Count("pk"))
+        .order_by()
+    )
+    return Counter(
+        {row["mask"]: row["patients"] for row in rows if row["mask"] is not None}
+    )
+
+
+def count_patients_with(prevalence, mask):
+    """
+    Return the number of patients of the prevalence (see get_comorbidity_prevalence) with all the comorbidities of
+    the mask, and maybe others.
+    """
+    return sum(
+        patients for other, patients in prevalence.items() if other & mask == mask
+    )
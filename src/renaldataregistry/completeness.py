@@ -0,0 +1,331 @@
+"""
+This file contains the completeness metrics of the data: the percentage of missing values of the optional fields,
+per health institution and form section, counted with one aggregate query per table and cached.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Count, Exists, F, Max, OuterRef, Q
+from renaldataregistry.models import (
+    Patient,
+    PatientAKImeasurement,
+    PatientKRTModality,
+    PatientAssessment,
+    PatientDialysisAssessment,
+    PatientLPAssessment,
+    PatientRegistration,
+)
+
+COMPLETENESS_CACHE_KEY = "renaldataregistry.completeness"
+
+
+def on_current_modality(modality, patient="patient"):
+    """
+    Return the condition of the rows of the patients whose current KRT modality is modality.
+    """
+    return Exists(
+        PatientKRTModality.objects.filter(
+            patient=OuterRef(patient), is_current=True, modality=modality
+        )
+    )
+
+
+def get_registration_watermark():
+    """
+    Return the last change of the registrations, from their history.
+    """
+    return PatientRegistration.history.aggregate(  # pylint: disable=no-member
+        Max("history_date")
+    )["history_date__max"]
+
+
+def get_moved_institution_ids(since):
+    """
+    Return the health institutions of the registrations changed since the date, before and after the change,
+    from their history. The rows of every table are counted in the health institution of the patient's
+    registration, so a registration moved to another health institution changes the counts of both.
+    """
+    history = PatientRegistration.history.all()  # pylint: disable=no-member
+    changed = list(
+        history.filter(history_date__gt=since).values_list(
+            "patient_id", "health_institution_id"
+        )
+    )
+    patient_ids = {patient_id for patient_id, _ in changed}
+    institution_ids = {institution_id for _, institution_id in changed}
+    previous_institution_ids = dict(
+        history.filter(patient_id__in=patient_ids, history_date__lte=since)
+        .order_by("patient_id", "-history_date", "-history_id")
+        .distinct("patient_id")
+        .values_list("patient_id", "health_institution_id")
+    )
+    institution_ids.update(previous_institution_ids.values())
+    # The patients registered since the date were counted without health institution
+    if patient_ids - previous_institution_ids.keys():
+        institution_ids.add(None)
+    return institution_ids
+
+
+class CompletenessSection:
+    """
+    Define a section of a form: its optional fields, counted in the rows matching condition
+    (e.g. the HD fields of the patients on HD).
+    """
+
+    def __init__(self, title, fields, condition=None):
+        self.title = title
+        self.fields = fields
+        # Exists conditions are wrapped in a Q to be combined with the lookups of the missing values
+        self.condition = None if condition is None else Q(condition)
+
+
+class CompletenessTable:
+    """
+    Define the sections of a table, with the lookups of the health institution of the rows and of their
+    last update, used to recount only the health institutions with changed rows.
+    """
+
+    def __init__(
+        self, name, model, institution, updated_at, sections
+    ):  # pylint: disable=too-many-arguments
+        self.name = name
+        self.model = model
+        self.institution = institution
+        self.updated_at = updated_at
+        self.sections = sections
+
+    def get_counts(self, institution_ids=None):
+        """
+        Return {institution id: {aggregate name: count}} of the rows and missing values of every section,
+        counted together with aggregates filtered by their condition (COUNT(*) FILTER (WHERE ...)) in one
+        query grouped by health institution. The rows without a health institution have the id None.
+        """
+        aggregates = {}
+        for index, section in enumerate(self.sections):
+            aggregates[f"rows{index}"] = Count("pk", filter=section.condition)
+            for field in section.fields:
+                missing = Q(**{f"{field}__isnull": True})
+                if isinstance(self.model._meta.get_field(field), CharField):
+                    missing |= Q(**{field: ""})
+                if section.condition is not None:
+                    missing &= section.condition
+                aggregates[f"missing{index}_{field}"] = Count("pk", filter=missing)
+        queryset = self.model.objects.all()
+        if institution_ids is not None:
+            institutions = Q(**{f"{self.institution}__in": institution_ids - {None}})
+            if None in institution_ids:
+                institutions |= Q(**{f"{self.institution}__isnull": True})
+            queryset = queryset.filter(institutions)
+        counts = {}
+        for row in (
+            queryset.values(institution_id=F(self.institution))
+            .annotate(**aggregates)
+            .order_by()
+        ):
+            counts[row.pop("institution_id")] = row
+        return counts
+
+    def get_watermark(self):
+        """
+        Return the last update of the rows.
+        """
+        return (
+            self.model.objects.order_by(F(self.updated_at).desc(nulls_last=True))
+            .values_list(self.updated_at, flat=True)
+            .first()
+        )
+
+    def get_cached_counts(self):
+        """
+        Return the counts of the table (see get_counts), from the cache while no row is updated.
+        When rows or registrations are updated, only the health institutions of the rows updated since the
+        last count, and those registrations moved from or to, are recounted. The whole table is recounted every
+        COMPLETENESS_CACHE_TIMEOUT seconds, which accounts for the deleted rows and the rows of transactions
+        committed after the last count.
+        """
+        key = f"{COMPLETENESS_CACHE_KEY}.{self.name}"
+        cached = cache.get(key)
+        watermark = (self.get_watermark(), get_registration_watermark())
+        if cached is not None and cached["watermark"] == watermark:
+            return cached["counts"]
+
+        if cached is None or None in cached["watermark"]:
+            counts = self.get_counts()
+            expires_at = time.time() + settings.COMPLETENESS_CACHE_TIMEOUT
+        else:
+            counts = cached["counts"]
+            rows_since, registrations_since = cached["watermark"]
+            changed_institution_ids = set(
+                self.model.objects.filter(
+                    **{f"{self.updated_at}__gt": rows_since}
+                ).values_list(self.institution, flat=True)
+            )
+            changed_institution_ids |= get_moved_institution_ids(registrations_since)
+            for institution_id in changed_institution_ids:
+                counts.pop(institution_id, None)
+            counts.update(self.get_counts(changed_institution_ids))
+            expires_at = cached["expires_at"]
+        timeout = expires_at - time.time()
+        if timeout > 0:
+            cache.set(
+                key,
+                {"watermark": watermark, "counts": counts, "expires_at": expires_at},
+                timeout,
+            )
+        return counts
+
+
+COMPLETENESS_TABLES = [
+    CompletenessTable(
+        "patients",
+        Patient,
+        "patientregistration__health_institution",
+        "updated_at",
+        [
+            CompletenessSection(
+                "Patient details",
+                ["ethnic", "gender", "maritalstatus", "occupationalstatus"],
+            ),
+            CompletenessSection(
+                "Patient measurements", ["height", "weight", "birth_weight"]
+            ),
+            CompletenessSection(
+                "Patient contact", ["street", "postcode", "mobile_number", "email"]
+            ),
+        ],
+    ),
+    CompletenessTable(
+        "aki_measurements",
+        PatientAKImeasurement,
+        "patient__patientregistration__health_institution",
+        "updated_at",
+        [
+            CompletenessSection(
+                "AKI measurement", ["creatinine", "egfr", "hb", "measurement_date"]
+            ),
+        ],
+    ),
+    CompletenessTable(
+        "modalities",
+        PatientKRTModality,
+        "patient__patientregistration__health_institution",
+        "updated_at",
+        [
+            CompletenessSection("KRT modality", ["start_date"]),
+            CompletenessSection(
+                "KRT modality (HD)", ["hd_unit", "hd_privatestart"], Q(modality=2)
+            ),
+            CompletenessSection(
+                "KRT modality (PD)", ["pd_catheterdays"], Q(modality=3)
+            ),
+        ],
+    ),
+    CompletenessTable(
+        "assessments",
+        PatientAssessment,
+        "patient__patientregistration__health_institution",
+        "updated_at",
+        [
+            CompletenessSection("Assessment", ["clinical_frailty"]),
+        ],
+    ),
+    CompletenessTable(
+        "dialysis_assessments",
+        PatientDialysisAssessment,
+        "patientassessment__patient__patientregistration__health_institution",
+        "patientassessment__updated_at",
+        [
+            # The assessments do not record the modality, the current one of the patient is used
+            CompletenessSection(
+                "Dialysis assessment (patients on HD)",
+                [
+                    "posthd_weight",
+                    "hd_sessions",
+                    "hd_minssessions",
+                    "hd_adequacy_urr",
+                    "hd_adequacy_kt",
+                ],
+                on_current_modality(2, "patientassessment__patient"),
+            ),
+            CompletenessSection(
+                "Dialysis assessment (patients on PD)",
+                ["pd_exchangesday", "pd_fluidlitresday", "pd_adequacy", "pd_bp"],
+                on_current_modality(3, "patientassessment__patient"),
+            ),
+        ],
+    ),
+    CompletenessTable(
+        "lp_assessments",
+        PatientLPAssessment,
+        "patientassessment__patient__patientregistration__health_institution",
+        "patientassessment__updated_at",
+        [
+            CompletenessSection(
+                "Laboratory values",
+                ["hb_gdl", "calcium", "albumin", "phosphate", "bicarbonate"],
+            ),
+        ],
+    ),
+]
+
+
+def get_completeness(institution_names):
+    """
+    Return the sections with, for every health institution ({id: name}, None for the patients
+    not registered) and in total, the number of rows and the percentage of missing values of every field.
+    """
+    sections = []
+    for table in COMPLETENESS_TABLES:
+        counts = table.get_cached_counts()
+        for index, section in enumerate(table.sections):
+            fields = [
+                table.model._meta.get_field(field).verbose_name
+                for field in section.fields
+            ]
+            rows = []
+            totals = dict.fromkeys([f"rows{index}", *section.fields], 0)
+            for institution_id, name in institution_names.items():
+                institution_counts = counts.get(institution_id)
+                if not institution_counts or not institution_counts[f"rows{index}"]:
+                    continue
+                totals[f"rows{index}"] += institution_counts[f"rows{index}"]
+                for field in section.fields:
+                    totals[field] += institution_counts[f"missing{index}_{field}"]
+                rows.append(
+                    get_completeness_row(
+                        name,
+                        institution_counts[f"rows{index}"],
+                        [
+                            institution_counts[f"missing{index}_{field}"]
+                            for field in section.fields
+                        ],
+                    )
+                )
+            sections.append(
+                {
+                    "title": section.title,
+                    "fields": fields,
+                    "rows": rows,
+                    "total": get_completeness_row(
+                        "Total",
+                        totals[f"rows{index}"],
+                        [totals[field] for field in section.fields],
+                    ),
+                }
+            )
+    return sections
+
+
+def get_completeness_row(name, rows, missing):
+    """
+    Return the number of rows and the percentage of missing values (rounded to one decimal) of a row
+    of the dashboard.
+    """
+    return {
+        "name": name,
+        "rows": rows,
+        "missing": [
+            round(100 * count / rows, 1) if rows else None for count in missing
+        ],
+    }
@@ -0,0 +1,65 @@
+"""
+This file contains the data quality report: the stored rows breaking the validation rules of the forms
+(e.g. legacy or imported records), counted with one scan of each table.
+"""
+from datetime import date
+
+from django.db.models import Count
+from renaldataregistry.models import (
+    Patient,
+    PatientRegistration,
+    PatientAKImeasurement,
+    PatientKRTModality,
+)
+from utils.mixin import (
+    PATIENT_RULES,
+    PATIENT_REGISTRATION_RULES,
+    AKI_MEASUREMENT_RULES,
+    KRT_MODALITY_RULES,
+)
+
+DATA_QUALITY_TABLES = {
+    "patients": (Patient, PATIENT_RULES),
+    "registrations": (PatientRegistration, PATIENT_REGISTRATION_RULES),
+    "aki_measurements": (PatientAKImeasurement, AKI_MEASUREMENT_RULES),
+    "modalities": (PatientKRTModality, KRT_MODALITY_RULES),
+}
+
+
+def get_data_quality_report(tables=None, samples=5, current_date=None):
+    """
+    Return, for every table, the number of rows and the number of rows breaking each rule with the ids of
+    the first ones. The rules are counted together with aggregates filtered by their SQL condition
+    (COUNT(*) FILTER (WHERE ...)), so each table is read once.
+    """
+    current_date = current_date or date.today()
+    report = []
+    for table in tables or DATA_QUALITY_TABLES:
+        model, rules = DATA_QUALITY_TABLES[table]
+        conditions = {rule.name: rule.get_condition(current_date) for rule in rules}
+        counts = model.objects.aggregate(
+            rows=Count("pk"),
+            **{
+                name: Count("pk", filter=condition)
+                for name, condition in conditions.items()
+            },
+        )
+        table_report = {"table": table, "rows": counts["rows"], "rules": []}
+        for rule in rules:
+            sample_ids = []
+            if counts[rule.name] and samples:
+                sample_ids = list(
+                    model.objects.filter(conditions[rule.name])
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[:samples]
+                )
+            table_report["rules"].append(
+                {
+                    "rule": rule.name,
+                    "field": rule.field,
+                    "broken": counts[rule.name],
+                    "sample_ids": sample_ids,
+                }
+            )
+        report.append(table_report)
+    return report
@@ -0,0 +1,129 @@
+"""
+This file contains the detection of duplicate patients: candidate pairs are generated within blocks of patients
+with the same date of birth, gender and phonetic surname, then scored by the similarity of their names.
+"""
+import difflib
+import unicodedata
+from collections import defaultdict
+from itertools import combinations, groupby
+
+from renaldataregistry.models import Patient, PatientDuplicate
+
+DUPLICATE_SCORE_THRESHOLD = 0.8
+# Larger blocks (e.g. a placeholder date of birth) are skipped rather than compared pair by pair
+DUPLICATE_MAX_BLOCK_SIZE = 100
+DUPLICATE_BATCH_SIZE = 500
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("BFPV", "1"),
+    **dict.fromkeys("CGJKQSXZ", "2"),
+    **dict.fromkeys("DT", "3"),
+    "L": "4",
+    **dict.fromkeys("MN", "5"),
+    "R": "6",
+}
+
+
+def normalize_name(value):
+    """
+    Return the name in upper case, without accents, punctuation or repeated spaces.
+    """
+    value = unicodedata.normalize("NFKD", value or "")
+    letters = "".join(
+        character if character.isalpha() else " "
+        for character in value
+        if not unicodedata.combining(character)
+    )
+    return " ".join(letters.upper().split())
+
+
+def soundex(value):
+    """
+    Return the American Soundex code of a name (e.g. Ramdin and Ramdeen are R535),
+    so that surnames spelt differently but pronounced alike fall in the same block.
+    """
+    letters = [
+        character for character in normalize_name(value) if "A" <= character <= "Z"
+    ]
+    if not letters:
+        return ""
+    code = letters[0]
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W do not separate letters with the same code, vowels do
+        if letter not in "HW":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def get_similarity(value1, value2):
+    """
+    Return the similarity (0 to 1) of two normalized names.
+    """
+    return difflib.SequenceMatcher(None, value1, value2).ratio()
+
+
+def score_pair(row1, row2):
+    """
+    Return the score of a candidate pair of (pk, name, surname) rows: the mean similarity of their names and surnames.
+    """
+    return round(
+        (
+            get_similarity(normalize_name(row1[1]), normalize_name(row2[1]))
+            + get_similarity(normalize_name(row1[2]), normalize_name(row2[2]))
+        )
+        / 2,
+        3,
+    )
+
+
+def iter_candidate_pairs(stats):
+    """
+    Yield the pairs of (pk, name, surname) rows of the patients with the same date of birth, gender and
+    Soundex surname. Patients are read once ordered by date of birth and gender, so the pairs are generated
+    in near-linear time instead of comparing all the patients with each other.
+    """
+    rows = (
+        Patient.objects.order_by("dob", "gender", "pk")
+        .values_list("dob", "gender", "pk", "name", "surname")
+        .iterator(chunk_size=2000)
+    )
+    for _, block_rows in groupby(rows, key=lambda row: (row[0], row[1])):
+        blocks = defaultdict(list)
+        for row in block_rows:
+            stats["patients"] += 1
+            blocks[soundex(row[4])].append(row[2:])
+        for block in blocks.values():
+            if len(block) > DUPLICATE_MAX_BLOCK_SIZE:
+                stats["skipped_blocks"] += 1
+                continue
+            yield from combinations(block, 2)
+
+
+def find_duplicates(threshold=DUPLICATE_SCORE_THRESHOLD):
+    """
+    Add to the review queue the candidate pairs scoring at least the threshold.
+    Pairs already in the queue (including the ones reviewed as not duplicates) are left unchanged.
+    Return the number of patients, pairs compared, pairs found and skipped blocks.
+    """
+    stats = {"patients": 0, "compared": 0, "found": 0, "skipped_blocks": 0}
+    duplicates = []
+    for row1, row2 in iter_candidate_pairs(stats):
+        stats["compared"] += 1
+        score = score_pair(row1, row2)
+        if score < threshold:
+            continue
+        stats["found"] += 1
+        duplicates.append(
+            PatientDuplicate(patient1_id=row1[0], patient2_id=row2[0], score=score)
+        )
+        if len(duplicates) >= DUPLICATE_BATCH_SIZE:
+            PatientDuplicate.objects.bulk_create(duplicates, ignore_conflicts=True)
+            duplicates = []
+    PatientDuplicate.objects.bulk_create(duplicates, ignore_conflicts=True)
+    return stats
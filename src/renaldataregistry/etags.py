@@ -0,0 +1,122 @@
+"""
+This file contains the ETags of the detail views, computed from the records' updated_at so that
+unchanged pages are answered with 304 Not Modified without rendering them.
+"""
+import hashlib
+import os
+
+from django.contrib.messages import get_messages
+from django.db.models import Max, OuterRef, Subquery
+from django.template.loader import get_template
+from renaldataregistry.models import (
+    Patient,
+    PatientKRTModality,
+    PatientAssessment,
+)
+from renaldataregistry.reference_data import get_reference_data_version
+
+
+def get_template_version(*template_names):
+    """
+    Return the last modification time of the templates, so that changing them changes the ETags.
+    """
+    return max(
+        os.path.getmtime(get_template(template_name).origin.name)
+        for template_name in template_names
+    )
+
+
+def get_patient_records_etag(request, patient_queryset, *template_names):
+    """
+    Return an ETag built from the updated_at of the patient, its registration, AKI measurement,
+    KRT modalities and assessments, in a single query.
+    The registration and assessment forms save the patient and the assessment together with their
+    renal diagnoses and assessment sub-records, so these are covered.
+    """
+    # Pages with pending messages (e.g. after saving a form) are rendered to show them
+    if len(get_messages(request)):
+        return None
+    modalities_updated_at = (
+        PatientKRTModality.objects.filter(patient=OuterRef("pk"))
+        .values("patient")
+        .annotate(last_updated_at=Max("updated_at"))
+        .values("last_updated_at")
+    )
+    assessments_updated_at = (
+        PatientAssessment.objects.filter(patient=OuterRef("pk"))
+        .values("patient")
+        .annotate(last_updated_at=Max("updated_at"))
+        .values("last_updated_at")
+    )
+    timestamps = (
+        patient_queryset.annotate(
+            modalities_updated_at=Subquery(modalities_updated_at),
+            assessments_updated_at=Subquery(assessments_updated_at),
+        )
+        .values_list(
+            "pk",
+            "updated_at",
+            "patientregistration__updated_at",
+            "patientakimeasurement__updated_at",
+            "modalities_updated_at",
+            "assessments_updated_at",
+        )
+        .first()
+    )
+    if timestamps is None:
+        # The view answers 404
+        return None
+    # The page shows the logged in user and reference data (e.g. the names of the HD units)
+    etag_data = [
+        request.user.pk,
+        get_template_version("base.html", *template_names),
+        get_reference_data_version(),
+    ]
+    etag_data.extend(
+        timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp
+        for timestamp in timestamps
+    )
+    return hashlib.sha1(repr(etag_data).encode()).hexdigest()  # nosec B324
+
+
+def patient_view_etag(request, *args, **kwargs):
+    """
+    ETag of renaldataregistry.views.PatientView.
+    """
+    return get_patient_records_etag(
+        request, Patient.objects.filter(pk=kwargs["pk"]), "patient_view.html"
+    )
+
+
+def patient_modality_detail_etag(request, *args, **kwargs):
+    """
+    ETag of renaldataregistry.views.PatientModalityDetailView, the page includes the patient's previous and first KRT modalities.
+    """
+    return get_patient_records_etag(
+        request,
+        Patient.objects.filter(
+            pk=Subquery(
+                PatientKRTModality.objects.filter(pk=kwargs["modality_id"]).values(
+                    "patient"
+                )
+            )
+        ),
+        "patientmodality_view.html",
+    )
+
+
+def patient_assessment_detail_etag(request, *args, **kwargs):
+    """
+    ETag of renaldataregistry.views.PatientAssessmentDetailView, the page includes the patient's current and first KRT modalities.
+    """
+    return get_patient_records_etag(
+        request,
+        Patient.objects.filter(
+            pk=Subquery(
+                PatientAssessment.objects.filter(pk=kwargs["assessment_id"]).values(
+                    "patient"
+                )
+            )
+        ),
+        "patientassessment_view.html",
+    )
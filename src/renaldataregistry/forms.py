@@ -2,6 +2,7 @@
 This file contains the forms used in the application.
 """
 from django import forms
+from django.urls import reverse
 from django.forms import (
     ModelForm,
     Textarea,
@@ -27,6 +28,38 @@ from .models import (
 )
 
 
+class LazySelect(forms.Select):
+    """
+    Select of a model choice field rendering only the empty and selected options, the other options
+    are loaded by the browser from the options_url view (see static/js/lazy_select.js).
+    """
+
+    def __init__(self, options_url, attrs=None):
+        super().__init__(attrs)
+        self.options_url = options_url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["attrs"]["data-options-url"] = reverse(self.options_url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        model_choices = self.choices
+        self.choices = []
+        if model_choices.field.empty_label is not None:
+            self.choices.append(("", model_choices.field.empty_label))
+        selected_pks = [pk for pk in value if pk and str(pk).isdigit()]
+        if selected_pks:
+            self.choices.extend(
+                model_choices.choice(obj)
+                for obj in model_choices.queryset.filter(pk__in=selected_pks)
+            )
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = model_choices
+
+
 class PatientRegistrationForm(PatientRegistrationFormValidationMixin):
     class Meta:
         model = PatientRegistration
@@ -99,6 +132,7 @@ class PatientKRTModalityForm(PatientKRTModalityFormValidationMixin):
         ]
         widgets = {
             "start_date": DatePickerInput(format="%d/%m/%Y"),
+            "hd_unit": LazySelect("renaldataregistry:unit_dropdownlist_options"),
         }
         # Remove label in order to set one when an HD modality is registered (in this case, the label is Access on first HD) and one when the patient is assessed (in this case, the label is Access used for last dialysis)
         labels = {"hd_initialaccess": ""}
@@ -131,6 +165,38 @@ class PatientAssessmentForm(ModelForm):
             "disability": forms.CheckboxSelectMultiple,
         }
 
+    def clean_comorbidity(self):
+        """
+        Return the selected comorbidities as a list, evaluated once for the validation, the comorbidity mask
+        and the M2M table.
+        """
+        return list(self.cleaned_data["comorbidity"])
+
+    def clean_disability(self):
+        """
+        Return the selected disabilities as a list, evaluated once for the validation and the M2M table.
+        """
+        return list(self.cleaned_data["disability"])
+
+    def save_m2m_in_bulk(self):
+        """
+        Save the comorbidities and disabilities of the saved assessment instead of save_m2m: the rows of a M2M
+        field changed are replaced with one DELETE (for an existing assessment) and one bulk INSERT. The signal
+        m2m_changed is not sent, the comorbidity mask is set with the assessment.
+        """
+        for field_name in ("comorbidity", "disability"):
+            if field_name not in self.changed_data:
+                continue
+            through = PatientAssessment._meta.get_field(field_name).remote_field.through
+            if self.initial.get(field_name):
+                through.objects.filter(patientassessment=self.instance).delete()
+            through.objects.bulk_create(
+                [
+                    through(patientassessment=self.instance, **{field_name: reference})
+                    for reference in self.cleaned_data[field_name]
+                ]
+            )
+
 
 class PatientAssessmentDialysisForm(ModelForm):
     class Meta:
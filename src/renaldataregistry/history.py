@@ -0,0 +1,38 @@
+"""
+This file contains helpers to present the historical records created by simple_history.
+"""
+
+# Fields of renaldataregistry.PatientRegistration shown in the registration history
+REGISTRATION_HISTORY_FIELDS = ["health_institution", "unit_no1", "unit_no2", "unit_no3"]
+
+
+def diff_history_rows(rows, previous_row=None, field_names=None):
+    """
+    Attach to every historical record a list of (verbose name, old value, new value) for the fields
+    that changed against the next older record.
+    rows must be ordered from newest to oldest, previous_row is the record immediately older than the last one in rows (if exists).
+    Every pair of consecutive versions is compared once, in a single pass over rows.
+    """
+    if field_names is None:
+        field_names = REGISTRATION_HISTORY_FIELDS
+    rows = list(rows)
+    if not rows:
+        return rows
+    fields = [rows[0]._meta.get_field(field_name) for field_name in field_names]
+
+    older_rows = rows[1:] + [previous_row]
+    for row, older_row in zip(rows, older_rows):
+        row.changes = []
+        if older_row is None:
+            continue
+        for field in fields:
+            # attname compares the raw column (e.g. health_institution_id) without loading related objects
+            if getattr(row, field.attname) != getattr(older_row, field.attname):
+                row.changes.append(
+                    (
+                        field.verbose_name,
+                        getattr(older_row, field.name),
+                        getattr(row, field.name),
+                    )
+                )
+    return rows
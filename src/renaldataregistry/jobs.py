@@ -0,0 +1,247 @@
+"""
+This file contains the background jobs: long-running tasks (exports, data quality scans, imports) queued in the
+Job table and run by the worker processes of the runjobs command, off the web workers.
+"""
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from renaldataregistry.bulk import BulkUpsert
+from renaldataregistry.changes import get_watermark, iter_changes, parse_watermark
+from renaldataregistry.dataquality import DATA_QUALITY_TABLES, get_data_quality_report
+from renaldataregistry.duplicates import DUPLICATE_SCORE_THRESHOLD, find_duplicates
+from renaldataregistry.models import Job
+from renaldataregistry.snapshots import create_snapshot
+
+# Seconds between the updates of the progress of a job in the database
+JOB_PROGRESS_INTERVAL = 1
+
+# Task name -> function(job, progress, **arguments) returning the message of the finished job
+JOB_TASKS = {}
+
+
+def job_task(name):
+    """
+    Register the decorated function as the task name (one of Job.TASK_CHOICES).
+    """
+
+    def register(function):
+        JOB_TASKS[name] = function
+        return function
+
+    return register
+
+
+class JobProgress:
+    """
+    Record the progress of a running job: calling it with the work done and the total updates the job at most
+    every JOB_PROGRESS_INTERVAL seconds, which also shows the worker is alive.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.updated = 0
+
+    def __call__(self, done, total, message=""):
+        if time.monotonic() - self.updated < JOB_PROGRESS_INTERVAL:
+            return
+        self.updated = time.monotonic()
+        Job.objects.filter(pk=self.job.pk).update(
+            progress=min(100, done * 100 // total) if total else 0,
+            message=message[:255],
+            updated_at=timezone.now(),
+        )
+
+
+def get_result_path(job, extension):
+    """
+    Return the name and the path of the result file of the job in JOB_RESULTS_DIR.
+    """
+    os.makedirs(settings.JOB_RESULTS_DIR, exist_ok=True)
+    name = f"job-{job.pk}-{job.task}.{extension}"
+    job.result_file = name
+    return name, os.path.join(settings.JOB_RESULTS_DIR, name)
+
+
+def get_import_path(path):
+    """
+    Return the path of a file to import, relative to JOB_IMPORTS_DIR. The jobs cannot read files outside it.
+    """
+    imports_dir = os.path.realpath(settings.JOB_IMPORTS_DIR)
+    import_path = os.path.realpath(os.path.join(imports_dir, path))
+    if os.path.commonpath([imports_dir, import_path]) != imports_dir:
+        raise ValueError(f"{path} is not in JOB_IMPORTS_DIR.")
+    return import_path
+
+
+def enqueue_job(task, arguments=None, user=None):
+    """
+    Queue a job running the task with the keyword arguments, and return it.
+    """
+    if task not in JOB_TASKS:
+        raise ValueError(f"Unknown task {task}.")
+    return Job.objects.create(task=task, arguments=arguments or {}, created_by=user)
+
+
+def get_worker_name(pid=None):
+    """
+    Return the name (host:pid) of a worker process, the current one by default.
+    """
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+def claim_job():
+    """
+    Mark the oldest queued job as running by the current process and return it, or None.
+    The row is locked with FOR UPDATE SKIP LOCKED, so concurrent workers claim different jobs without waiting
+    for each other, and the lock is released as soon as the job is marked as running.
+    """
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status="Q")
+            .order_by("created_at", "pk")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "R"
+        job.worker = get_worker_name()
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "worker", "started_at", "updated_at"])
+    return job
+
+
+def run_job(job):
+    """
+    Run the task of a claimed job and record its result, or its error when it fails.
+    """
+    try:
+        message = JOB_TASKS[job.task](job, JobProgress(job), **job.arguments)
+    except Exception:  # pylint: disable=broad-except
+        job.status = "F"
+        job.error = traceback.format_exc()
+        job.message = "Failed"
+    else:
+        job.status = "D"
+        job.progress = 100
+        job.message = (message or "Done")[:255]
+    job.finished_at = timezone.now()
+    job.save(
+        update_fields=[
+            "status",
+            "progress",
+            "message",
+            "result_file",
+            "error",
+            "finished_at",
+            "updated_at",
+        ]
+    )
+
+
+def fail_stopped_jobs(worker=None):
+    """
+    Mark as failed the running jobs of a worker process that stopped (e.g. it was killed) or, without worker,
+    the running jobs not updated for JOB_STALE_SECONDS. They are not queued again, a task that makes its
+    worker crash would otherwise run forever. Return the number of jobs marked.
+    """
+    jobs = Job.objects.filter(status="R")
+    if worker:
+        jobs = jobs.filter(worker=worker)
+    else:
+        jobs = jobs.filter(
+            updated_at__lt=timezone.now()
+            - timedelta(seconds=settings.JOB_STALE_SECONDS)
+        )
+    return jobs.update(
+        status="F",
+        error="The worker running the job stopped.",
+        message="Failed",
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+
+@job_task("dataquality")
+def run_data_quality(job, progress, tables=None, samples=5):
+    """
+    Write the data quality report (see the dataquality command) to a JSON file.
+    """
+    tables = tables or list(DATA_QUALITY_TABLES)
+    report = []
+    for done, table in enumerate(tables):
+        progress(done, len(tables), f"Checking {table}")
+        report.extend(get_data_quality_report([table], samples))
+    _, path = get_result_path(job, "json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    broken = sum(
+        rule_report["broken"]
+        for table_report in report
+        for rule_report in table_report["rules"]
+    )
+    return f"{broken} broken rules in {len(report)} tables"
+
+
+@job_task("changefeed")
+def run_change_feed(job, progress, since=None, resources=None):
+    """
+    Write the records changed since the watermark (see the changefeed command) to a NDJSON file.
+    """
+    since = parse_watermark(since) if since else None
+    until = get_watermark()
+    _, path = get_result_path(job, "ndjson")
+    lines = 0
+    with open(path, "w", encoding="utf-8") as file:
+        for line in iter_changes(since, until, resources):
+            file.write(line)
+            lines += 1
+            progress(0, 0, f"{lines} records exported")
+    # The last line is the watermark
+    return f"{lines - 1} records exported until {until.isoformat()}"
+
+
+@job_task("findduplicates")
+def run_find_duplicates(_job, progress, threshold=DUPLICATE_SCORE_THRESHOLD):
+    """
+    Add the possible duplicate patients to the review queue (see the findduplicates command).
+    """
+    progress(0, 0, "Comparing the patients")
+    stats = find_duplicates(threshold)
+    return (
+        f"{stats['found']} possible duplicates found in {stats['compared']} pairs "
+        f"of {stats['patients']} patients"
+    )
+
+
+@job_task("bulkimport")
+def run_bulk_import(job, progress, path):
+    """
+    Import the KRT modalities and assessments of a NDJSON file in JOB_IMPORTS_DIR (see the api/bulk/ endpoint)
+    in one transaction, and write the result of every record to a NDJSON file.
+    """
+    import_path = get_import_path(path)
+    progress(0, 0, f"Importing {os.path.basename(import_path)}")
+    with open(import_path, "rb") as file:
+        results = BulkUpsert(user=job.created_by).run(file)
+    _, result_path = get_result_path(job, "ndjson")
+    with open(result_path, "w", encoding="utf-8") as file:
+        file.writelines(json.dumps(result) + "\n" for result in results)
+    errors = sum(result["status"] == "error" for result in results)
+    return f"{len(results) - errors} records imported, {errors} errors"
+
+
+@job_task("snapshotstatistics")
+def run_snapshot_statistics(_job, progress):
+    """
+    Precompute the registry statistics into a new snapshot (see the snapshotstatistics command).
+    """
+    snapshot = create_snapshot(progress)
+    return f"Snapshot {snapshot.pk} completed"
@@ -0,0 +1,642 @@
+"""
+This file contains the load test of the registry (see the loadtest command): simulated clinicians log in, search the
+patients, open their records and enter registration, KRT modality and assessment forms with synthetic data, against
+a running server (e.g. the docker-compose deployment), and the throughput, latency and errors of each endpoint.
+"""
+import math
+import random
+import re
+import string
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from html.parser import HTMLParser
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import (
+    HTTPCookieProcessor,
+    HTTPRedirectHandler,
+    Request,
+    build_opener,
+)
+
+from django.urls import reverse
+
+# Seconds a request waits for the response
+LOAD_TEST_TIMEOUT = 30
+
+FIRST_NAMES = [
+    "Aarav",
+    "Ananya",
+    "Bruno",
+    "Chloe",
+    "Deepak",
+    "Emilie",
+    "Farah",
+    "Jean",
+    "Kavya",
+    "Li",
+    "Marie",
+    "Nitin",
+    "Priya",
+    "Rajesh",
+    "Sophie",
+    "Yusuf",
+]
+SURNAMES = [
+    "Appadoo",
+    "Bhujun",
+    "Chung",
+    "Dookhee",
+    "Gopaul",
+    "Jhurry",
+    "Lam",
+    "Li Wan Po",
+    "Moutou",
+    "Ramgoolam",
+    "Seegoolam",
+    "Sewraj",
+    "Valaydon",
+]
+STREETS = ["Royal Road", "Sir Seewoosagur Ramgoolam St", "Avenue des Palmiers"]
+
+
+class FormParser(HTMLParser):  # pylint: disable=abstract-method
+    """
+    Collect the fields of the forms of a page with their initial values, as the browser submits them, and the
+    choices of the selects, checkboxes and radio buttons.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.fields = {}
+        self.choices = defaultdict(list)
+        self.select = None
+        self.selected = False
+        self.textarea = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        name = attrs.get("name")
+        if tag == "input" and name:
+            input_type = attrs.get("type", "text")
+            if input_type in ("submit", "button", "file", "image", "reset"):
+                return
+            value = attrs.get("value") or ""
+            if input_type in ("checkbox", "radio"):
+                self.choices[name].append(value or "on")
+                if "checked" in attrs:
+                    self.fields.setdefault(name, []).append(value or "on")
+            else:
+                self.fields.setdefault(name, []).append(value)
+        elif tag == "select" and name:
+            self.select = name
+            self.selected = False
+            self.choices[name] = []
+        elif tag == "option" and self.select:
+            value = attrs.get("value") or ""
+            self.choices[self.select].append(value)
+            if "selected" in attrs:
+                self.fields.setdefault(self.select, []).append(value)
+                self.selected = True
+        elif tag == "textarea" and name:
+            self.textarea = name
+            self.fields[name] = [""]
+
+    def handle_endtag(self, tag):
+        if tag == "select" and self.select:
+            # The browser submits the first option of a select without a selected one
+            if not self.selected and self.choices[self.select]:
+                self.fields[self.select] = [self.choices[self.select][0]]
+            self.select = None
+        elif tag == "textarea":
+            self.textarea = None
+
+    def handle_data(self, data):
+        if self.textarea:
+            self.fields[self.textarea] = [data.strip()]
+
+
+def parse_form(html):
+    """
+    Return the fields (name -> list of values) and the choices of the forms of the page.
+    """
+    parser = FormParser()
+    parser.feed(html)
+    return parser.fields, parser.choices
+
+
+def url_pattern(url_name):
+    """
+    Return a regular expression matching the paths of the view (taking one id) and capturing the id.
+    """
+    path = reverse(url_name, args=[999999999])
+    return re.compile(re.escape(path).replace("999999999", r"(\d+)"))
+
+
+class LoadTestStats:
+    """
+    Record the latency and errors of the requests of the simulated clinicians (from several threads), by endpoint.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.errors = Counter()
+        self.started = time.monotonic()
+
+    def add(self, name, latency, error=None):
+        """
+        Record the latency of a request of the endpoint, and its error when it failed.
+        """
+        with self.lock:
+            self.latencies[name].append(latency)
+            if error:
+                self.failures[name] += 1
+                self.errors[(name, error)] += 1
+
+    def get_report(self):
+        """
+        Return the (endpoint, requests, failures, error %, requests/s, mean, p50, p95, p99, max ms) rows of the
+        endpoints, and of all of them (Aggregated).
+        """
+        elapsed = time.monotonic() - self.started
+        with self.lock:
+            latencies = {
+                name: sorted(values) for name, values in self.latencies.items()
+            }
+            failures = dict(self.failures)
+        latencies["Aggregated"] = sorted(
+            latency for values in latencies.values() for latency in values
+        )
+        failures["Aggregated"] = sum(failures.values())
+        rows = []
+        for name in sorted(latencies, key=lambda name: (name == "Aggregated", name)):
+            values = latencies[name]
+            if not values:
+                continue
+            rows.append(
+                (
+                    name,
+                    len(values),
+                    failures.get(name, 0),
+                    failures.get(name, 0) * 100 / len(values),
+                    len(values) / elapsed,
+                    sum(values) / len(values) * 1000,
+                    percentile(values, 50) * 1000,
+                    percentile(values, 95) * 1000,
+                    percentile(values, 99) * 1000,
+                    values[-1] * 1000,
+                )
+            )
+        return rows
+
+
+def percentile(sorted_values, percent):
+    """
+    Return the percentile of the sorted values (nearest rank).
+    """
+    rank = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class NoRedirectHandler(HTTPRedirectHandler):
+    """
+    Return the redirects as responses: a saved form answers with a redirect, an invalid one with the form.
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class RequestError(Exception):
+    """
+    Raised when a request of a task fails, to stop the task.
+    """
+
+
+# Tasks of the simulated clinicians: (method of Clinician, weight)
+CLINICIAN_TASKS = []
+
+
+def clinician_task(weight):
+    """
+    Register the decorated method of Clinician as a task run weight times as often as a task of weight 1.
+    """
+
+    def register(method):
+        CLINICIAN_TASKS.append((method, weight))
+        return method
+
+    return register
+
+
+class Clinician:  # pylint: disable=too-many-instance-attributes
+    """
+    A simulated clinician, with its own session: logs in with the login form, then runs tasks picked by weight,
+    waiting a think time between them. The patients listed by the pages are remembered for the next tasks.
+    """
+
+    def __init__(self, base_url, email, password, stats, rng, wait_time=(1, 5)):
+        self.base_url = base_url
+        self.email = email
+        self.password = password
+        self.stats = stats
+        self.rng = rng
+        self.wait_time = wait_time
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), NoRedirectHandler)
+        self.patient_ids = set()
+        # Patients whose KRT modality was started by this clinician, to assess them
+        self.dialysis_patient_ids = []
+        self.patient_pattern = url_pattern("renaldataregistry:PatientRecordView")
+        self.modality_pattern = url_pattern(
+            "renaldataregistry:PatientModalityDetailView"
+        )
+        self.assessment_pattern = url_pattern(
+            "renaldataregistry:PatientAssessmentDetailView"
+        )
+
+    def request(self, name, path, data=None, expect_redirect=False):
+        """
+        Send a GET (or a POST of data, with the CSRF token) and return the page. The failures (errors,
+        unexpected statuses, a form not saved) are recorded and raise RequestError.
+        """
+        url = urljoin(self.base_url, path)
+        body = None
+        headers = {"User-Agent": "renaldataregistry-loadtest"}
+        if data is not None:
+            body = urlencode(data, doseq=True).encode()
+            # The referer is checked by the CSRF protection of the HTTPS requests
+            headers["Referer"] = url
+        start = time.perf_counter()
+        error = None
+        try:
+            with self.opener.open(
+                Request(url, data=body, headers=headers), timeout=LOAD_TEST_TIMEOUT
+            ) as response:
+                status, content = response.status, response.read()
+        except HTTPError as http_error:
+            status, content = http_error.code, http_error.read()
+        except (URLError, OSError) as network_error:
+            status, content = None, b""
+            error = f"{type(network_error).__name__}: {network_error}"
+        latency = time.perf_counter() - start
+
+        if error is None:
+            if status >= 400:
+                error = f"HTTP {status}"
+            elif expect_redirect and status != 302:
+                error = f"Form not saved (HTTP {status})"
+        self.stats.add(
+            f"{'POST' if data is not None else 'GET'} {name}", latency, error
+        )
+        if error:
+            raise RequestError(error)
+        return content.decode("utf-8", "replace")
+
+    def submit(self, name, path, get_values):
+        """
+        Get the form page and post its fields, updated with get_values(choices of the form), with the CSRF token
+        of the page. Return the fields posted.
+        """
+        fields, choices = parse_form(self.request(f"{name} (form)", path))
+        fields.update(get_values(choices))
+        self.request(name, path, fields, expect_redirect=True)
+        return fields
+
+    def remember_patients(self, html):
+        """
+        Remember the patients linked by the page, and return their ids.
+        """
+        ids = {int(patient_id) for patient_id in self.patient_pattern.findall(html)}
+        self.patient_ids.update(ids)
+        return ids
+
+    def pick_patient(self):
+        """
+        Return the id of a random remembered patient (browsing the patient list first), or None.
+        """
+        if not self.patient_ids:
+            self.browse_patient_list()
+        return self.rng.choice(sorted(self.patient_ids)) if self.patient_ids else None
+
+    def login(self):
+        """
+        Log in with the login form.
+        """
+        self.submit(
+            "login",
+            reverse("login"),
+            lambda choices: {"username": self.email, "password": self.password},
+        )
+
+    def run(self, deadline):
+        """
+        Log in, then run tasks until the deadline (time.monotonic()).
+        """
+        methods = [method for method, _ in CLINICIAN_TASKS]
+        weights = [weight for _, weight in CLINICIAN_TASKS]
+        try:
+            self.login()
+        except RequestError:
+            return
+        while time.monotonic() < deadline:
+            method = self.rng.choices(methods, weights)[0]
+            try:
+                method(self)
+            except RequestError:
+                pass
+            time.sleep(
+                min(
+                    self.rng.uniform(*self.wait_time),
+                    max(deadline - time.monotonic(), 0),
+                )
+            )
+
+    @clinician_task(2)
+    def browse_patient_list(self):
+        """
+        Browse the patient list.
+        """
+        path = reverse("renaldataregistry:PatientRegistrationListView")
+        self.remember_patients(self.request("PatientRegistrationListView", path))
+
+    @clinician_task(4)
+    def search_patients(self):
+        """
+        Search the patient list by a first name or surname.
+        """
+        path = reverse("renaldataregistry:PatientRegistrationListView")
+        keyword = self.rng.choice(SURNAMES + FIRST_NAMES)
+        self.remember_patients(
+            self.request(
+                "PatientRegistrationListView (search)",
+                f"{path}?{urlencode({'search_keyword': keyword})}",
+            )
+        )
+
+    @clinician_task(4)
+    def view_patient(self):
+        """
+        View the record of a patient.
+        """
+        patient_id = self.pick_patient()
+        if patient_id is None:
+            return
+        self.request(
+            "PatientRecordView",
+            reverse("renaldataregistry:PatientRecordView", args=[patient_id]),
+        )
+
+    @clinician_task(1)
+    def view_patient_timeline(self):
+        """
+        View the timeline of a patient.
+        """
+        patient_id = self.pick_patient()
+        if patient_id is None:
+            return
+        self.request(
+            "PatientTimelineView",
+            reverse("renaldataregistry:PatientTimelineView", args=[patient_id]),
+        )
+
+    @clinician_task(2)
+    def view_modalities(self):
+        """
+        List the KRT modalities of a patient, then view one of them.
+        """
+        patient_id = self.pick_patient()
+        if patient_id is None:
+            return
+        html = self.request(
+            "PatientModalityListView",
+            reverse("renaldataregistry:PatientModalityListView", args=[patient_id]),
+        )
+        modality_ids = self.modality_pattern.findall(html)
+        if modality_ids:
+            self.request(
+                "PatientModalityDetailView",
+                reverse(
+                    "renaldataregistry:PatientModalityDetailView",
+                    args=[self.rng.choice(modality_ids)],
+                ),
+            )
+
+    @clinician_task(2)
+    def view_assessments(self):
+        """
+        List the assessments of a patient, then view one of them.
+        """
+        patient_id = self.pick_patient()
+        if patient_id is None:
+            return
+        html = self.request(
+            "PatientAssessmentListView",
+            reverse("renaldataregistry:PatientAssessmentListView", args=[patient_id]),
+        )
+        assessment_ids = self.assessment_pattern.findall(html)
+        if assessment_ids:
+            self.request(
+                "PatientAssessmentDetailView",
+                reverse(
+                    "renaldataregistry:PatientAssessmentDetailView",
+                    args=[self.rng.choice(assessment_ids)],
+                ),
+            )
+
+    @clinician_task(1)
+    def register_patient(self):
+        """
+        Register a new patient, then find it by its N.I.C. as the clinician does to continue with its record.
+        """
+        fields = self.submit(
+            "PatientRegistrationView",
+            reverse("renaldataregistry:PatientRegistrationView"),
+            lambda choices: get_registration_data(self.rng, choices),
+        )
+        list_path = reverse("renaldataregistry:PatientRegistrationListView")
+        patient_ids = self.remember_patients(
+            self.request(
+                "PatientRegistrationListView (search)",
+                f"{list_path}?{urlencode({'search_keyword': fields['pid']})}",
+            )
+        )
+        if patient_ids:
+            self.start_modality(patient_id=min(patient_ids))
+
+    def start_modality(self, patient_id):
+        """
+        Start a dialysis KRT modality (HD or PD) of a patient registered by this clinician.
+        """
+        # The HD units are loaded by the select of the form (LazySelect)
+        _, unit_choices = parse_form(
+            "<select name='hd_unit'>"
+            + self.request(
+                "unit_dropdownlist_options",
+                reverse("renaldataregistry:unit_dropdownlist_options"),
+            )
+            + "</select>"
+        )
+        self.submit(
+            "PatientModalityView",
+            reverse("renaldataregistry:PatientModalityView", args=[patient_id]),
+            lambda choices: get_modality_data(
+                self.rng, {**choices, "hd_unit": unit_choices["hd_unit"]}
+            ),
+        )
+        self.dialysis_patient_ids.append(patient_id)
+
+    @clinician_task(1)
+    def add_assessment(self):
+        """
+        Assess a dialysis patient of this clinician (registering one when there is none).
+        """
+        if not self.dialysis_patient_ids:
+            self.register_patient()
+            return
+        patient_id = self.rng.choice(self.dialysis_patient_ids)
+        self.submit(
+            "PatientAssessmentView",
+            reverse("renaldataregistry:PatientAssessmentView", args=[patient_id]),
+            lambda choices: get_assessment_data(self.rng, choices),
+        )
+
+
+def pick_choice(rng, choices, name):
+    """
+    Return a random non-empty choice of the field of the form.
+    """
+    values = [value for value in choices.get(name, []) if value]
+    return rng.choice(values) if values else ""
+
+
+def get_registration_data(rng, choices):
+    """
+    Return synthetic values of the registration form: a patient with a N.I.C., its registration in a health
+    institution, its primary renal diagnosis and AKI measurement.
+    """
+    today = date.today()
+    name = rng.choice(FIRST_NAMES)
+    surname = rng.choice(SURNAMES)
+    dob = today - timedelta(days=rng.randint(18 * 365, 90 * 365))
+    return {
+        "id_type": "1",
+        "pid": (
+            surname[0].upper()
+            + "".join(rng.choices(string.digits, k=12))
+            + rng.choice(string.ascii_uppercase + string.digits)
+        ),
+        "name": name,
+        "surname": surname,
+        "dob": dob.strftime("%d/%m/%Y"),
+        "gender": pick_choice(rng, choices, "gender"),
+        "ethnic": pick_choice(rng, choices, "ethnic"),
+        "maritalstatus": pick_choice(rng, choices, "maritalstatus"),
+        "occupationalstatus": pick_choice(rng, choices, "occupationalstatus"),
+        "health_institution": pick_choice(rng, choices, "health_institution"),
+        "unit_no1": str(rng.randint(1000, 999999)),
+        "street": f"{rng.randint(1, 200)} {rng.choice(STREETS)}",
+        "postcode": "".join(rng.choices(string.digits, k=5)),
+        "mobile_number": "5" + "".join(rng.choices(string.digits, k=7)),
+        "email": f"{name.lower()}.{surname.lower().replace(' ', '')}@example.mu",
+        "height": str(rng.randint(145, 195)),
+        "weight": f"{rng.uniform(45, 110):.1f}",
+        "primary-code": str(rng.randint(100, 999)),
+        "primary-description": "Diabetic nephropathy",
+        "creatinine": f"{rng.uniform(150, 900):.1f}",
+        "egfr": f"{rng.uniform(5, 45):.1f}",
+        "hb": f"{rng.uniform(7, 13):.1f}",
+        "measurement_date": (today - timedelta(days=rng.randint(0, 60))).strftime(
+            "%d/%m/%Y"
+        ),
+    }
+
+
+def get_modality_data(rng, choices):
+    """
+    Return synthetic values of the KRT modality form: a current HD (in an HD unit) or PD modality started recently.
+    """
+    modality = rng.choice(["2", "3"])
+    values = {
+        "modality": modality,
+        "is_current": "on",
+        "start_date": (date.today() - timedelta(days=rng.randint(0, 30))).strftime(
+            "%d/%m/%Y"
+        ),
+        "before_KRT": pick_choice(rng, choices, "before_KRT"),
+        "hepB_vac": pick_choice(rng, choices, "hepB_vac"),
+        "delay_start": pick_choice(rng, choices, "delay_start"),
+    }
+    if modality == "2":
+        values["hd_unit"] = pick_choice(rng, choices, "hd_unit")
+        values["hd_initialaccess"] = pick_choice(rng, choices, "hd_initialaccess")
+    return values
+
+
+def get_assessment_data(rng, choices):
+    """
+    Return synthetic values of the assessment form: laboratory values and a few comorbidities.
+    """
+    comorbidities = [value for value in choices.get("comorbidity", []) if value]
+    return {
+        "hb_gdl": f"{rng.uniform(7, 13):.1f}",
+        "calcium": f"{rng.uniform(2, 2.6):.2f}",
+        "albumin": f"{rng.uniform(28, 45):.1f}",
+        "phosphate": f"{rng.uniform(0.8, 2.4):.2f}",
+        "ferritin": f"{rng.uniform(100, 800):.0f}",
+        "tsat": f"{rng.uniform(15, 45):.0f}",
+        "bicarbonate": f"{rng.uniform(18, 28):.0f}",
+        "hba1c": f"{rng.uniform(5, 10):.1f}",
+        "pth": f"{rng.uniform(10, 80):.0f}",
+        "comorbidity": rng.sample(
+            comorbidities, min(len(comorbidities), rng.randint(0, 3))
+        ),
+    }
+
+
+def run_load_test(
+    base_url,
+    email,
+    password,
+    users,
+    spawn_rate,
+    duration,
+    wait_time=(1, 5),
+    seed=None,
+    progress=None,
+):
+    """
+    Run users simulated clinicians against the server for duration seconds, starting spawn_rate of them per
+    second, and return the LoadTestStats. progress(stats, running users) is called every second.
+    """
+    stats = LoadTestStats()
+    deadline = time.monotonic() + duration
+    threads = []
+    # The synthetic data and the tasks are not security sensitive
+    rng = random.Random(seed)  # nosec B311
+    for number in range(users):
+        if time.monotonic() >= deadline:
+            break
+        clinician = Clinician(
+            base_url,
+            email,
+            password,
+            stats,
+            random.Random(rng.random()),  # nosec B311
+            wait_time,
+        )
+        thread = threading.Thread(target=clinician.run, args=(deadline,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if number + 1 < users:
+            time.sleep(1 / spawn_rate)
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(1)
+        if progress:
+            progress(stats, sum(thread.is_alive() for thread in threads))
+    return stats
@@ -0,0 +1,157 @@
+"""
+This file contains the patient lookup of the search box: the patients whose N.I.C/passport number, name, surname
+or unit number starts with the typed prefix.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.urls import reverse
+from renaldataregistry.models import Patient, PatientRegistration
+
+PATIENT_LOOKUP_MIN_LENGTH = 2
+PATIENT_LOOKUP_LIMIT = 10
+PATIENT_LOOKUP_MAX_LIMIT = 50
+PATIENT_LOOKUP_CACHE_KEY = "renaldataregistry.patient_lookup"
+
+# The same values of the patients, from the patient and from the registration
+PATIENT_VALUES = [
+    "pk",
+    "pid",
+    "name",
+    "surname",
+    "dob",
+    "patientregistration__health_institution__name",
+    "patientregistration__unit_no1",
+    "patientregistration__unit_no2",
+    "patientregistration__unit_no3",
+]
+REGISTRATION_VALUES = [
+    "patient__pk",
+    "patient__pid",
+    "patient__name",
+    "patient__surname",
+    "patient__dob",
+    "health_institution__name",
+    "unit_no1",
+    "unit_no2",
+    "unit_no3",
+]
+
+
+def normalize_prefix(prefix):
+    """
+    Return the prefix in upper case, without repeated or surrounding spaces.
+    """
+    return " ".join(prefix.split()).upper()
+
+
+def serialize_match(
+    patient_id, pid, name, surname, dob, health_institution, *unit_numbers
+):  # pylint: disable=too-many-arguments
+    """
+    Return the JSON of a patient matching the prefix, from a row of PATIENT_VALUES or REGISTRATION_VALUES.
+    """
+    return {
+        "id": patient_id,
+        "pid": pid,
+        "name": name,
+        "surname": surname,
+        "dob": dob.isoformat() if dob else None,
+        "health_institution": health_institution,
+        "unit_numbers": [unit_number for unit_number in unit_numbers if unit_number],
+        "url": reverse(
+            "renaldataregistry:PatientRecordView", kwargs={"pk": patient_id}
+        ),
+    }
+
+
+def match_prefix(match, prefix):
+    """
+    Return whether a patient returned for a shorter prefix also matches the prefix.
+    """
+    return any(
+        value.upper().startswith(prefix)
+        for value in [match["pid"], match["name"], match["surname"]]
+        + match["unit_numbers"]
+    )
+
+
+def search_patients(prefix, limit):
+    """
+    Return the first patients (ordered by surname and name) matching the prefix.
+    Patients and unit numbers are searched in separate queries, each an OR of prefix conditions
+    answered from the UPPER(column) text_pattern_ops and unit number varchar_pattern_ops indexes.
+    """
+    # Patients without a registration are found too, hence the query starting from Patient
+    patient_rows = (
+        Patient.objects.filter(
+            Q(pid__istartswith=prefix)
+            | Q(name__istartswith=prefix)
+            | Q(surname__istartswith=prefix)
+        )
+        .order_by("surname", "name", "pk")
+        .values_list(*PATIENT_VALUES)[:limit]
+    )
+    matches = {row[0]: serialize_match(*row) for row in patient_rows}
+    # Unit numbers are digits only
+    if prefix.isdigit():
+        registration_rows = (
+            PatientRegistration.objects.filter(
+                Q(unit_no1__startswith=prefix)
+                | Q(unit_no2__startswith=prefix)
+                | Q(unit_no3__startswith=prefix)
+            )
+            .order_by("patient__surname", "patient__name", "patient__pk")
+            .values_list(*REGISTRATION_VALUES)[:limit]
+        )
+        matches.update((row[0], serialize_match(*row)) for row in registration_rows)
+    return sorted(
+        matches.values(),
+        key=lambda match: (
+            match["surname"].upper(),
+            match["name"].upper(),
+            match["id"],
+        ),
+    )[:limit]
+
+
+def get_cache_key(prefix, limit):
+    """
+    Return the cache key of the matches of a prefix.
+    """
+    digest = hashlib.sha1(prefix.encode()).hexdigest()  # nosec B324
+    return f"{PATIENT_LOOKUP_CACHE_KEY}:{limit}:{digest}"
+
+
+def lookup_patients(prefix, limit=PATIENT_LOOKUP_LIMIT):
+    """
+    Return the patients matching the prefix typed in the search box.
+    The matches of recent prefixes are cached: as the user types, a prefix which had fewer matches
+    than the limit is complete, so the matches of the longer prefix are filtered from it without a query.
+    """
+    prefix = normalize_prefix(prefix)
+    if len(prefix) < PATIENT_LOOKUP_MIN_LENGTH:
+        return []
+
+    cache_keys = {
+        get_cache_key(prefix[:length], limit): length
+        for length in range(PATIENT_LOOKUP_MIN_LENGTH, len(prefix) + 1)
+    }
+    cached = cache.get_many(cache_keys)
+    key = get_cache_key(prefix, limit)
+    if key in cached:
+        return cached[key]
+
+    matches = None
+    for cached_key in sorted(cached, key=cache_keys.get, reverse=True):
+        if len(cached[cached_key]) < limit:
+            matches = [
+                match for match in cached[cached_key] if match_prefix(match, prefix)
+            ]
+            break
+    if matches is None:
+        matches = search_patients(prefix, limit)
+    cache.set(key, matches, settings.PATIENT_LOOKUP_CACHE_TIMEOUT)
+    return matches
@@ -0,0 +1,232 @@
+"""
+This file contains the command to measure the latency of a page under concurrent requests, served by the
+class-based views through WSGI or by the asynchronous views through ASGI (see ASYNC_VIEWS).
+"""
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from renaldataregistry.models import PatientKRTModality
+
+
+class Command(BaseCommand):
+    help = (
+        "Request a page concurrently, in-process, as the application server does: with ASYNC_VIEWS through the "
+        "ASGI handler on one event loop (the asynchronous views, as uvicorn), otherwise through the WSGI handler "
+        "in a thread per concurrent request (the class-based views, as a threaded WSGI server). Report the "
+        "requests per second and the latency for each concurrency given. Run it with ASYNC_VIEWS=0 and "
+        "ASYNC_VIEWS=1 to compare both."
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Page requested, host and session cookie of the requests, set by handle()
+        self.path = None
+        self.host = None
+        self.session_cookie = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            help="Path of the page requested, the latest KRT modality's details by default.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Number of requests per run."
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[1, 10, 25],
+            help="Concurrent requests of each run (default 1 10 25).",
+        )
+        parser.add_argument(
+            "--host",
+            default="localhost",
+            help="Host header of the requests, one of ALLOWED_HOSTS.",
+        )
+        parser.add_argument(
+            "--query-latency",
+            type=float,
+            default=0,
+            help=(
+                "Milliseconds added to every query, e.g. the round trip to a database server on another host "
+                "when benchmarking with a local one."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path:
+            patientmodality = PatientKRTModality.objects.order_by("-pk").first()
+            if patientmodality is None:
+                raise CommandError("No KRT modality found, give a --path.")
+            path = reverse(
+                "renaldataregistry:PatientModalityDetailView",
+                kwargs={"modality_id": patientmodality.pk},
+            )
+        user = (
+            get_user_model().objects.filter(is_active=True, is_superuser=True).first()
+        )
+        if user is None:
+            raise CommandError("No active superuser found.")
+        client = Client()
+        client.force_login(user)
+        self.path = path
+        self.host = options["host"]
+        self.session_cookie = (
+            f"{settings.SESSION_COOKIE_NAME}="
+            f"{client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        )
+
+        if options["query_latency"]:
+            connections.close_all()
+            query_latency = options["query_latency"] / 1000
+
+            def delay_query(execute, sql, params, many, context):
+                time.sleep(query_latency)
+                return execute(sql, params, many, context)
+
+            # The connections are opened by the threads serving the requests
+            connection_created.connect(
+                lambda connection, **kwargs: connection.execute_wrappers.append(
+                    delay_query
+                ),
+                weak=False,
+            )
+
+        if settings.ASYNC_VIEWS:
+            server = "ASGI, asynchronous views"
+            run = self.run_asgi
+        else:
+            server = "WSGI, class-based views"
+            run = self.run_wsgi
+        self.stdout.write(
+            f"GET {path} ({server}), {options['requests']} requests per run, "
+            f"{options['query_latency']} ms added to every query"
+        )
+        self.stdout.write(
+            f"{'concurrency':>11} {'requests/s':>11} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}"
+        )
+        for concurrency in options["concurrency"]:
+            # The first requests fill the caches (templates, reference data) and open the connections
+            run(concurrency, concurrency)
+            start = time.perf_counter()
+            latencies = sorted(run(options["requests"], concurrency))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{concurrency:>11} {len(latencies) / elapsed:>11.1f} "
+                f"{statistics.mean(latencies) * 1000:>9.2f} "
+                f"{latencies[len(latencies) // 2] * 1000:>9.2f} "
+                f"{latencies[int(len(latencies) * 0.95)] * 1000:>9.2f}"
+            )
+
+    def check_status(self, status):
+        """
+        Stop the benchmark when the page is not returned (e.g. an error or a redirect to the login page).
+        """
+        if not status.startswith("200"):
+            raise CommandError(f"GET {self.path} returned {status}.")
+
+    def run_wsgi(self, requests, concurrency):
+        """
+        Send the requests through the WSGI handler from concurrency threads, and return their latencies.
+        """
+        handler = WSGIHandler()
+
+        def request(_):
+            statuses = []
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": self.path,
+                "QUERY_STRING": "",
+                "SERVER_NAME": self.host,
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": self.host,
+                "HTTP_COOKIE": self.session_cookie,
+                "wsgi.input": BytesIO(),
+                "wsgi.errors": sys.stderr,
+                "wsgi.url_scheme": "http",
+                "wsgi.multithread": True,
+                "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+            }
+            start = time.perf_counter()
+            response = handler(environ, lambda status, headers: statuses.append(status))
+            b"".join(response)
+            # Sends request_finished, which closes the connections older than CONN_MAX_AGE
+            response.close()
+            latency = time.perf_counter() - start
+            self.check_status(statuses[0])
+            return latency
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(request, range(requests)))
+
+    def run_asgi(self, requests, concurrency):
+        """
+        Send the requests through the ASGI handler from concurrency tasks of one event loop, and return their
+        latencies.
+        """
+        handler = ASGIHandler()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": self.path,
+            "raw_path": self.path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"host", self.host.encode()),
+                (b"cookie", self.session_cookie.encode()),
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": (self.host, 80),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def request():
+            statuses = []
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    statuses.append(str(message["status"]))
+
+            start = time.perf_counter()
+            await handler(dict(scope), receive, send)
+            latency = time.perf_counter() - start
+            self.check_status(statuses[0])
+            return latency
+
+        async def client(remaining, latencies):
+            while remaining:
+                remaining.pop()
+                latencies.append(await request())
+
+        async def run():
+            remaining = list(range(requests))
+            latencies = []
+            await asyncio.gather(
+                *(client(remaining, latencies) for _ in range(concurrency))
+            )
+            return latencies
+
+        return asyncio.run(run())
@@ -0,0 +1,103 @@
+"""
+This file contains the command to measure the requests per second of a page with and without persistent
+database connections.
+"""
+import sys
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = (
+        "Request a page through the WSGI handler as the application server does, so the database connections are "
+        "closed or kept between requests according to CONN_MAX_AGE, and report the requests per second for each "
+        "CONN_MAX_AGE given (0 opens a connection per request)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            help="Path of the page requested, the patient list by default.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Number of requests per run."
+        )
+        parser.add_argument(
+            "--conn-max-age",
+            type=int,
+            nargs="+",
+            default=[0, 60],
+            help="CONN_MAX_AGE of each run (default 0 60).",
+        )
+        parser.add_argument(
+            "--host",
+            default="localhost",
+            help="Host header of the requests, one of ALLOWED_HOSTS.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or reverse(
+            "renaldataregistry:PatientRegistrationListView"
+        )
+        user = (
+            get_user_model().objects.filter(is_active=True, is_superuser=True).first()
+        )
+        if user is None:
+            raise CommandError("No active superuser found.")
+        client = Client()
+        client.force_login(user)
+        session_cookie = (
+            f"{settings.SESSION_COOKIE_NAME}="
+            f"{client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        )
+        handler = WSGIHandler()
+
+        def request():
+            statuses = []
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "QUERY_STRING": "",
+                "SERVER_NAME": options["host"],
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": options["host"],
+                "HTTP_COOKIE": session_cookie,
+                "wsgi.input": BytesIO(),
+                "wsgi.errors": sys.stderr,
+                "wsgi.url_scheme": "http",
+                "wsgi.multithread": False,
+                "wsgi.multiprocess": True,
+                "wsgi.run_once": False,
+            }
+            response = handler(environ, lambda status, headers: statuses.append(status))
+            b"".join(response)
+            # Sends request_finished, which closes the connections older than CONN_MAX_AGE
+            response.close()
+            if not statuses[0].startswith("200"):
+                raise CommandError(f"GET {path} returned {statuses[0]}.")
+
+        self.stdout.write(f"GET {path}, {options['requests']} requests per run")
+        self.stdout.write(f"{'CONN_MAX_AGE':>12} {'requests/s':>12} {'mean ms':>10}")
+        for conn_max_age in options["conn_max_age"]:
+            connections.close_all()
+            for connection in connections.all():
+                connection.settings_dict["CONN_MAX_AGE"] = conn_max_age
+            # The first request fills the caches (templates, reference data)
+            request()
+            start = time.perf_counter()
+            for _ in range(options["requests"]):
+                request()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{conn_max_age:>12} {options['requests'] / elapsed:>12.1f} "
+                f"{elapsed / options['requests'] * 1000:>10.2f}"
+            )
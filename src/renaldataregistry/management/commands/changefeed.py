@@ -0,0 +1,63 @@
+"""
+This file contains the command to export as NDJSON the records changed since a watermark.
+"""
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from renaldataregistry.changes import (
+    CHANGE_FEED_SOURCES,
+    get_watermark,
+    iter_changes,
+    parse_watermark,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Write as NDJSON the patients, registrations, KRT modalities, assessments and stops changed since a watermark, "
+        "and the tombstones of the patients merged. The last line has the watermark to use as --since in the next run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="ISO 8601 watermark of the previous sync, all the records are exported when omitted.",
+        )
+        parser.add_argument(
+            "--watermark-file",
+            help="File holding the watermark: read as --since when it exists and rewritten after a successful export.",
+        )
+        parser.add_argument(
+            "--resources",
+            nargs="+",
+            choices=list(CHANGE_FEED_SOURCES),
+            help="Types of records exported, all by default.",
+        )
+        parser.add_argument(
+            "--output", help="File written, the standard output by default."
+        )
+
+    def handle(self, *args, **options):
+        since = options["since"]
+        watermark_file = options["watermark_file"]
+        if since is None and watermark_file and os.path.exists(watermark_file):
+            with open(watermark_file, encoding="utf-8") as file:
+                since = file.read().strip()
+        try:
+            since = parse_watermark(since) if since else None
+        except ValueError as error:
+            raise CommandError(error) from error
+
+        until = get_watermark()
+        lines = iter_changes(since, until, options["resources"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
+
+        if watermark_file:
+            # Written last, an interrupted export is repeated from the previous watermark
+            with open(watermark_file, "w", encoding="utf-8") as file:
+                file.write(until.isoformat())
@@ -0,0 +1,48 @@
+"""
+This file contains the command to list the patients of a cohort.
+"""
+import json
+import time
+
+from django.core.exceptions import FieldDoesNotExist, FieldError
+from django.core.management.base import BaseCommand, CommandError
+from renaldataregistry.cohorts import parse_cohort
+from renaldataregistry.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "List the patients of a cohort defined in JSON, e.g. "
+        '\'{"and": [{"modality": {"modality": "HD", "start_date__year": 2023}}, {"lab": {"hb_gdl__lt": 10}}]}\' '
+        "(see renaldataregistry/cohorts.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("definition", help="JSON definition of the cohort.")
+        parser.add_argument(
+            "--pids", action="store_true", help="List the PIDs of the patients."
+        )
+        parser.add_argument(
+            "--sql", action="store_true", help="Show the SQL query of the cohort."
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            cohort = parse_cohort(json.loads(options["definition"]))
+            if options["sql"]:
+                self.stdout.write(str(cohort.get_queryset().values("pk").query))
+            ids = cohort.get_ids()
+        except (ValueError, FieldError, FieldDoesNotExist) as error:
+            raise CommandError(f"Invalid cohort: {error}") from error
+
+        if options["pids"]:
+            for pid in (
+                Patient.objects.filter(pk__in=ids)
+                .order_by("pid")
+                .values_list("pid", flat=True)
+            ):
+                self.stdout.write(pid)
+        self.stdout.write(
+            f"{len(ids)} patients in the cohort ({time.perf_counter() - start:.2f}s)."
+        )
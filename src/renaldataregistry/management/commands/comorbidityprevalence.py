@@ -0,0 +1,81 @@
+"""
+This file contains the command to report the prevalence of the comorbidities and of their combinations.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from renaldataregistry.comorbidities import (
+    count_patients_with,
+    get_comorbidity_bits,
+    get_comorbidity_prevalence,
+    get_mask,
+    get_mask_comorbidities,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the number of patients with each comorbidity and with each combination of comorbidities in their "
+        "latest assessment, counted from the comorbidity masks of the assessments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--with",
+            nargs="+",
+            dest="comorbidities",
+            metavar="COMORBIDITY",
+            help="Only count the patients with all these comorbidities (names).",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=20,
+            help="Most frequent combinations listed (default 20).",
+        )
+
+    def handle(self, *args, **options):
+        comorbidity_bits = get_comorbidity_bits()
+        prevalence = get_comorbidity_prevalence()
+        total = sum(prevalence.values())
+        self.stdout.write(f"{total} patients with an assessment.")
+        if not total:
+            return
+
+        def write_count(label, patients):
+            self.stdout.write(
+                f"  {patients:>8} {patients * 100 / total:6.1f}%  {label}"
+            )
+
+        if options["comorbidities"]:
+            names = {
+                comorbidity.comorbidity.lower(): comorbidity
+                for comorbidity in comorbidity_bits.values()
+            }
+            unknown = [
+                name for name in options["comorbidities"] if name.lower() not in names
+            ]
+            if unknown:
+                raise CommandError(f"Unknown comorbidities: {', '.join(unknown)}.")
+            comorbidities = [names[name.lower()] for name in options["comorbidities"]]
+            write_count(
+                " + ".join(str(comorbidity) for comorbidity in comorbidities),
+                count_patients_with(prevalence, get_mask(comorbidities)),
+            )
+            return
+
+        self.stdout.write("Comorbidities:")
+        for comorbidity in sorted(
+            comorbidity_bits.values(),
+            key=lambda comorbidity: -count_patients_with(
+                prevalence, get_mask([comorbidity])
+            ),
+        ):
+            write_count(
+                comorbidity, count_patients_with(prevalence, get_mask([comorbidity]))
+            )
+        self.stdout.write("Combinations:")
+        for mask, patients in prevalence.most_common(options["top"]):
+            comorbidities = get_mask_comorbidities(mask, comorbidity_bits)
+            write_count(
+                " + ".join(str(comorbidity) for comorbidity in comorbidities) or "None",
+                patients,
+            )
@@ -0,0 +1,52 @@
+"""
+This file contains the command to report the stored rows breaking the validation rules of the forms.
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from renaldataregistry.dataquality import DATA_QUALITY_TABLES, get_data_quality_report
+from utils.routers import use_replica
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the stored patients, registrations, AKI measurements and KRT modalities against the validation "
+        "rules of the forms (e.g. records imported or saved before a rule existed) and report the rows breaking them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tables",
+            nargs="+",
+            choices=list(DATA_QUALITY_TABLES),
+            help="Tables checked, all by default.",
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=5,
+            help="Ids of rows breaking each rule listed in the report (default 5).",
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Write the report as JSON."
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with use_replica():
+            report = get_data_quality_report(options["tables"], options["samples"])
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for table_report in report:
+            self.stdout.write(f"{table_report['table']}: {table_report['rows']} rows")
+            for rule_report in table_report["rules"]:
+                line = f"  {rule_report['rule']:<18} {rule_report['broken']:>8} broken"
+                if rule_report["sample_ids"]:
+                    line += f" (ids {', '.join(str(pk) for pk in rule_report['sample_ids'])})"
+                if rule_report["broken"]:
+                    line = self.style.WARNING(line)
+                self.stdout.write(line)
+        self.stdout.write(f"Checked in {time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,38 @@
+"""
+This file contains the command to add the pairs of patients that may be duplicates to the review queue.
+"""
+from django.core.management.base import BaseCommand
+from renaldataregistry.duplicates import (
+    DUPLICATE_MAX_BLOCK_SIZE,
+    DUPLICATE_SCORE_THRESHOLD,
+    find_duplicates,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the patients with the same date of birth, gender and Soundex surname and add the pairs "
+        "with similar names to the duplicate review queue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=DUPLICATE_SCORE_THRESHOLD,
+            help=f"Minimum name similarity, from 0 to 1 (default {DUPLICATE_SCORE_THRESHOLD}).",
+        )
+
+    def handle(self, *args, **options):
+        stats = find_duplicates(options["threshold"])
+        self.stdout.write(
+            f"{stats['patients']} patients, {stats['compared']} pairs compared, "
+            f"{stats['found']} possible duplicates."
+        )
+        if stats["skipped_blocks"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{stats['skipped_blocks']} blocks of more than {DUPLICATE_MAX_BLOCK_SIZE} patients "
+                    "with the same date of birth, gender and surname sound were skipped."
+                )
+            )
@@ -0,0 +1,326 @@
+"""
+This file contains the command to partition, maintain and archive the historical tables created by simple_history.
+"""
+import gzip
+import os
+import re
+from datetime import date
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from psycopg2 import sql
+
+PARTITION_SUFFIX_PATTERN = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def add_months(month_start, months):
+    """
+    Return the first day of the month that is the given number of months away from month_start.
+    """
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def get_historical_tables():
+    """
+    Return the database tables of the historical models registered by simple_history.
+    """
+    return [
+        model._meta.db_table
+        for model in apps.get_models()
+        if hasattr(model, "instance_type")
+    ]
+
+
+def is_partitioned(cursor, table):
+    """
+    Check if the table is already a partitioned table.
+    """
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [table])
+    return cursor.fetchone()[0] == "p"
+
+
+def get_partitions(cursor, table):
+    """
+    Return (partition name, first day of the month) of the monthly partitions of the table.
+    """
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = %s::regclass",
+        [table],
+    )
+    partitions = []
+    for (partition,) in cursor.fetchall():
+        match = PARTITION_SUFFIX_PATTERN.search(partition)
+        if match:
+            partitions.append(
+                (partition, date(int(match.group(1)), int(match.group(2)), 1))
+            )
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def get_default_partition(cursor, table):
+    """
+    Return the name of the default partition of the table (None without one).
+    """
+    cursor.execute(
+        "SELECT pg_class.relname FROM pg_partitioned_table "
+        "JOIN pg_class ON pg_class.oid = pg_partitioned_table.partdefid "
+        "WHERE pg_partitioned_table.partrelid = %s::regclass",
+        [table],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Partition historical tables by history_date (PostgreSQL declarative partitioning), "
+        "create the upcoming monthly partitions and archive the ones older than the retention window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action",
+            choices=["setup", "maintain", "archive"],
+            help="setup: convert historical tables to partitioned tables; "
+            "maintain: create the upcoming monthly partitions; "
+            "archive: compress to files and drop the partitions older than the retention window.",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.HISTORY_PARTITION_MONTHS_AHEAD,
+            help="Number of monthly partitions to create after the current month.",
+        )
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            default=settings.HISTORY_RETENTION_MONTHS,
+            help="Months of history kept in the database.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=settings.HISTORY_ARCHIVE_DIR,
+            help="Directory where archived partitions are written.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning of historical tables requires PostgreSQL.")
+
+        current_month = timezone.now().date().replace(day=1)
+        for table in get_historical_tables():
+            if options["action"] == "setup":
+                self.setup(table, current_month, options["months_ahead"])
+            elif options["action"] == "maintain":
+                self.maintain(table, current_month, options["months_ahead"])
+            else:
+                self.archive(
+                    table,
+                    add_months(current_month, -options["retention_months"]),
+                    options["archive_dir"],
+                )
+
+    def create_partitions(self, cursor, table, from_month, to_month):
+        """
+        Create the missing monthly partitions between from_month and to_month (both included).
+        PostgreSQL does not create a partition whose rows are in the default partition (e.g. a month not
+        created in time): the default partition is detached, its rows of the month moved to the new
+        partition, and it is attached again.
+        """
+        existing_months = {month for _, month in get_partitions(cursor, table)}
+        default_partition = get_default_partition(cursor, table)
+        month = from_month
+        while month <= to_month:
+            if month not in existing_months:
+                partition = f"{table}_p{month.strftime('%Y%m')}"
+                bounds = [month, add_months(month, 1)]
+                in_default = False
+                if default_partition:
+                    cursor.execute(
+                        sql.SQL(
+                            "SELECT EXISTS (SELECT 1 FROM {} "
+                            "WHERE history_date >= %s AND history_date < %s)"
+                        ).format(sql.Identifier(default_partition)),
+                        bounds,
+                    )
+                    in_default = cursor.fetchone()[0]
+                if in_default:
+                    cursor.execute(
+                        sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                            sql.Identifier(table), sql.Identifier(default_partition)
+                        )
+                    )
+                cursor.execute(
+                    sql.SQL(
+                        "CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)"
+                    ).format(sql.Identifier(partition), sql.Identifier(table)),
+                    bounds,
+                )
+                self.stdout.write(f"Created partition {partition}.")
+                if in_default:
+                    cursor.execute(
+                        sql.SQL(
+                            "WITH moved AS (DELETE FROM {} "
+                            "WHERE history_date >= %s AND history_date < %s RETURNING *) "
+                            "INSERT INTO {} SELECT * FROM moved"
+                        ).format(
+                            sql.Identifier(default_partition), sql.Identifier(partition)
+                        ),
+                        bounds,
+                    )
+                    moved_rows = cursor.rowcount
+                    cursor.execute(
+                        sql.SQL("ALTER TABLE {} ATTACH PARTITION {} DEFAULT").format(
+                            sql.Identifier(table), sql.Identifier(default_partition)
+                        )
+                    )
+                    self.stdout.write(
+                        f"Moved {moved_rows} rows of the default partition to {partition}."
+                    )
+            month = add_months(month, 1)
+
+    def maintain(self, table, current_month, months_ahead):
+        """
+        Create the partitions of the current month and the following ones.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not is_partitioned(cursor, table):
+                raise CommandError(
+                    f"{table} is not partitioned, run the setup action first."
+                )
+            self.create_partitions(
+                cursor, table, current_month, add_months(current_month, months_ahead)
+            )
+
+    def setup(self, table, current_month, months_ahead):
+        """
+        Convert a historical table into a table partitioned by month of history_date, in a single transaction.
+        The primary key becomes (history_id, history_date) since PostgreSQL requires it to include the partition key.
+        """
+        old_table = f"{table}_unpartitioned"
+        with transaction.atomic(), connection.cursor() as cursor:
+            if is_partitioned(cursor, table):
+                self.stdout.write(f"{table} is already partitioned.")
+                return
+
+            # Indexes and foreign keys are not copied by CREATE TABLE ... LIKE, keep them to recreate them
+            cursor.execute(
+                "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+                "WHERE indrelid = %s::regclass AND NOT indisprimary",
+                [table],
+            )
+            index_definitions = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [table],
+            )
+            foreign_keys = cursor.fetchall()
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'history_id')", [table])
+            history_id_sequence = cursor.fetchone()[0]
+            cursor.execute(
+                sql.SQL("SELECT min(history_date) FROM {}").format(
+                    sql.Identifier(table)
+                )
+            )
+            oldest_history_date = cursor.fetchone()[0]
+
+            cursor.execute(
+                sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                    sql.Identifier(table), sql.Identifier(old_table)
+                )
+            )
+            cursor.execute(
+                sql.SQL(
+                    "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                    "PARTITION BY RANGE (history_date)"
+                ).format(sql.Identifier(table), sql.Identifier(old_table))
+            )
+            # Rows outside the monthly partitions, "maintain" creates the new months before they are needed
+            cursor.execute(
+                sql.SQL("CREATE TABLE {} PARTITION OF {} DEFAULT").format(
+                    sql.Identifier(f"{table}_default"), sql.Identifier(table)
+                )
+            )
+            from_month = current_month
+            if oldest_history_date:
+                from_month = min(
+                    from_month,
+                    timezone.localtime(oldest_history_date).date().replace(day=1),
+                )
+            self.create_partitions(
+                cursor, table, from_month, add_months(current_month, months_ahead)
+            )
+
+            cursor.execute(
+                sql.SQL("INSERT INTO {} SELECT * FROM {}").format(
+                    sql.Identifier(table), sql.Identifier(old_table)
+                )
+            )
+            if history_id_sequence:
+                cursor.execute(
+                    sql.SQL("ALTER SEQUENCE {} OWNED BY {}.history_id").format(
+                        sql.SQL(history_id_sequence), sql.Identifier(table)
+                    )
+                )
+            cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(old_table)))
+
+            # Index and constraint names are free once the old table is dropped.
+            # Indexes created on the partitioned table are created on every partition.
+            cursor.execute(
+                sql.SQL(
+                    "ALTER TABLE {} ADD PRIMARY KEY (history_id, history_date)"
+                ).format(sql.Identifier(table))
+            )
+            for index_definition in index_definitions:
+                cursor.execute(index_definition)
+            for constraint_name, constraint_definition in foreign_keys:
+                cursor.execute(
+                    sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}").format(
+                        sql.Identifier(table),
+                        sql.Identifier(constraint_name),
+                        sql.SQL(constraint_definition),
+                    )
+                )
+        self.stdout.write(self.style.SUCCESS(f"Partitioned {table}."))
+
+    def archive(self, table, cutoff_month, archive_dir):
+        """
+        Write the partitions that end before cutoff_month to gzip compressed CSV files and drop them.
+        Every partition is detached, written and dropped in its own transaction.
+        """
+        os.makedirs(archive_dir, exist_ok=True)
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor, table):
+                raise CommandError(
+                    f"{table} is not partitioned, run the setup action first."
+                )
+            partitions = get_partitions(cursor, table)
+
+        for partition, month in partitions:
+            if add_months(month, 1) > cutoff_month:
+                continue
+            archive_path = os.path.join(archive_dir, f"{partition}.csv.gz")
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                        sql.Identifier(table), sql.Identifier(partition)
+                    )
+                )
+                with gzip.open(archive_path, "wb") as archive_file:
+                    cursor.copy_expert(
+                        sql.SQL("COPY {} TO STDOUT WITH CSV HEADER").format(
+                            sql.Identifier(partition)
+                        ),
+                        archive_file,
+                    )
+                cursor.execute(
+                    sql.SQL("DROP TABLE {}").format(sql.Identifier(partition))
+                )
+            self.stdout.write(f"Archived {partition} to {archive_path}.")
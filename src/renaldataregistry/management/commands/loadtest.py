@@ -0,0 +1,136 @@
+"""
+This file contains the command to load test a running server with simulated clinicians entering data.
+"""
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from renaldataregistry.loadtest import run_load_test
+
+REPORT_COLUMNS = [
+    "Endpoint",
+    "Requests",
+    "Failures",
+    "Error %",
+    "Requests/s",
+    "Mean ms",
+    "p50 ms",
+    "p95 ms",
+    "p99 ms",
+    "Max ms",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test a running server (e.g. the docker-compose deployment on port 8000) with simulated clinicians: "
+        "each logs in, then searches and opens patients and registers patients, starts KRT modalities and "
+        "enters assessments with synthetic data, waiting a think time between tasks. The registered patients "
+        "are kept, run it against a test database. Report the throughput, the p50/p95/p99 latency and the error "
+        "rate of each endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://localhost:8000",
+            help="Base URL of the server (default http://localhost:8000).",
+        )
+        parser.add_argument(
+            "--email",
+            default=os.environ.get("DJANGO_SUPERUSER_EMAIL"),
+            help="Email of the user logging in, DJANGO_SUPERUSER_EMAIL by default.",
+        )
+        parser.add_argument(
+            "--password",
+            default=os.environ.get("DJANGO_SUPERUSER_PASSWORD"),
+            help="Password of the user, DJANGO_SUPERUSER_PASSWORD by default.",
+        )
+        parser.add_argument(
+            "--users", type=int, default=10, help="Simulated clinicians (default 10)."
+        )
+        parser.add_argument(
+            "--spawn-rate",
+            type=float,
+            default=1,
+            help="Clinicians started per second (default 1).",
+        )
+        parser.add_argument(
+            "--duration",
+            type=int,
+            default=60,
+            help="Seconds of the test (default 60).",
+        )
+        parser.add_argument(
+            "--wait",
+            type=float,
+            nargs=2,
+            default=[1, 5],
+            metavar=("MIN", "MAX"),
+            help="Think time in seconds between the tasks of a clinician (default 1 5).",
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed of the synthetic data and of the tasks."
+        )
+        parser.add_argument("--csv", help="Write the report to this CSV file.")
+
+    def handle(self, *args, **options):
+        if not options["email"] or not options["password"]:
+            raise CommandError("Give the --email and --password of a user.")
+        if options["users"] < 1 or options["spawn_rate"] <= 0:
+            raise CommandError("--users and --spawn-rate must be positive.")
+
+        last_progress = time.monotonic()
+
+        def progress(stats, users):
+            nonlocal last_progress
+            rows = stats.get_report()
+            if rows and time.monotonic() - last_progress >= 10:
+                last_progress = time.monotonic()
+                _, requests, failures, _, requests_per_second, *_ = rows[-1]
+                self.stdout.write(
+                    f"{users} clinicians, {requests} requests ({failures} failed), "
+                    f"{requests_per_second:.1f} requests/s"
+                )
+
+        self.stdout.write(
+            f"Load testing {options['url']} with {options['users']} clinicians for {options['duration']}s"
+        )
+        stats = run_load_test(
+            options["url"],
+            options["email"],
+            options["password"],
+            options["users"],
+            options["spawn_rate"],
+            options["duration"],
+            wait_time=options["wait"],
+            seed=options["seed"],
+            progress=progress,
+        )
+        rows = stats.get_report()
+        if not rows:
+            raise CommandError("No request was sent.")
+
+        width = max(len(row[0]) for row in rows)
+        self.stdout.write(
+            f"{REPORT_COLUMNS[0]:<{width}} "
+            + " ".join(f"{column:>10}" for column in REPORT_COLUMNS[1:])
+        )
+        for name, requests, failures, error_rate, *timings in rows:
+            line = (
+                f"{name:<{width}} {requests:>10} {failures:>10} {error_rate:>10.1f} "
+                + " ".join(f"{timing:>10.1f}" for timing in timings)
+            )
+            self.stdout.write(self.style.WARNING(line) if failures else line)
+        if stats.errors:
+            self.stdout.write("Failures:")
+            for (name, error), count in stats.errors.most_common():
+                self.stdout.write(f"  {count:>6} {name}: {error}")
+
+        if options["csv"]:
+            with open(options["csv"], "w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                writer.writerow(REPORT_COLUMNS)
+                writer.writerows(rows)
+            self.stdout.write(f"Report written to {options['csv']}.")
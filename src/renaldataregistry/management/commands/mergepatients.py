@@ -0,0 +1,86 @@
+"""
+This file contains the command to merge duplicate patients into other patients.
+"""
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from renaldataregistry.merge import (
+    MERGE_BATCH_SIZE,
+    MergeError,
+    merge_patient_batch,
+    resolve_merges,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge duplicate patients into the patients kept: their records are reassigned with set-based updates, "
+        "the merges are recorded and the duplicates deleted. Give one pair of ids, or a CSV file of "
+        "patient_id,duplicate_id lines merged in batches of one transaction each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "patient_id", type=int, nargs="?", help="Id of the patient kept."
+        )
+        parser.add_argument(
+            "duplicate_id",
+            type=int,
+            nargs="?",
+            help="Id of the duplicate patient, deleted.",
+        )
+        parser.add_argument(
+            "--file", help="CSV file of patient_id,duplicate_id lines to merge."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=MERGE_BATCH_SIZE,
+            help=f"Merges per transaction (default {MERGE_BATCH_SIZE}).",
+        )
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            merges = self.read_merges(options["file"])
+        elif options["patient_id"] and options["duplicate_id"]:
+            merges = [(options["patient_id"], options["duplicate_id"])]
+        else:
+            raise CommandError("Give a patient_id and a duplicate_id, or --file.")
+        # Chains (A <- B, B <- C) are resolved before splitting the merges in batches
+        try:
+            merges = [
+                (patient_id, duplicate_id)
+                for duplicate_id, patient_id in resolve_merges(merges).items()
+            ]
+        except MergeError as error:
+            raise CommandError(error) from error
+
+        merged = 0
+        for start in range(0, len(merges), options["batch_size"]):
+            batch = merges[start : start + options["batch_size"]]
+            try:
+                merged += merge_patient_batch(batch)
+            except MergeError as error:
+                raise CommandError(
+                    f"{error} {merged} patients were merged before the error."
+                ) from error
+        self.stdout.write(f"{merged} patients merged.")
+
+    @staticmethod
+    def read_merges(path):
+        """
+        Return the (patient kept id, duplicate id) pairs of the CSV file.
+        """
+        merges = []
+        with open(path, newline="", encoding="utf-8") as file:
+            for line_number, row in enumerate(csv.reader(file), start=1):
+                try:
+                    merges.append((int(row[0]), int(row[1])))
+                except (IndexError, ValueError) as error:
+                    if line_number == 1:
+                        # Header
+                        continue
+                    raise CommandError(
+                        f"Line {line_number} is not patient_id,duplicate_id."
+                    ) from error
+        return merges
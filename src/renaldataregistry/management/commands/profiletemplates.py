@@ -0,0 +1,111 @@
+"""
+This file contains the command to measure the rendering time of the registration, assessment and patient pages.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template.backends.django import Template
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from renaldataregistry.models import Patient
+from renaldataregistry.views import (
+    PatientRegistrationView,
+    PatientAssessmentView,
+    PatientView,
+)
+
+
+@contextmanager
+def measure_template_time(timings):
+    """
+    Append to timings the seconds spent rendering each top-level template (included templates are part of it).
+    """
+    render = Template.render
+    depth = 0
+
+    def timed_render(template, context=None, request=None):
+        nonlocal depth
+        depth += 1
+        start = time.perf_counter()
+        try:
+            return render(template, context, request)
+        finally:
+            depth -= 1
+            if depth == 0:
+                timings.append(time.perf_counter() - start)
+
+    with mock.patch.object(Template, "render", timed_render):
+        yield
+
+
+class Command(BaseCommand):
+    help = (
+        "Render patient_register.html, patient_assess.html and patient_view.html through their views "
+        "and report the template rendering time and queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patient",
+            type=int,
+            help="Id of the patient rendered, the first patient by default.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Number of renders per page."
+        )
+
+    def handle(self, *args, **options):
+        patient = (
+            Patient.objects.filter(pk=options["patient"]).first()
+            if options["patient"]
+            else Patient.objects.order_by("pk").first()
+        )
+        if patient is None:
+            raise CommandError("No patient found.")
+        user = get_user_model().objects.filter(is_active=True).first()
+        pages = [
+            ("patient_register.html (new)", PatientRegistrationView, {}),
+            (
+                "patient_register.html (edit)",
+                PatientRegistrationView,
+                {"patient_id": patient.pk},
+            ),
+            (
+                "patient_assess.html (new)",
+                PatientAssessmentView,
+                {"patient_id": patient.pk},
+            ),
+            ("patient_view.html", PatientView, {"pk": patient.pk}),
+        ]
+
+        factory = RequestFactory()
+        cache.clear()
+        self.stdout.write(
+            f"{'Page':<30} {'first ms':>10} {'mean ms':>10} {'min ms':>10} {'queries':>8}"
+        )
+        for name, view_class, kwargs in pages:
+            view = view_class.as_view()
+            timings = []
+            queries = 0
+            for _ in range(options["repeat"]):
+                request = factory.get("/")
+                request.user = user
+                with measure_template_time(timings), CaptureQueriesContext(
+                    connection
+                ) as captured:
+                    response = view(request, **kwargs)
+                    if hasattr(response, "render"):
+                        response.render()
+                queries = len(captured)
+            # The first render loads and compiles the templates and fills the fragment cache
+            self.stdout.write(
+                f"{name:<30} {timings[0] * 1000:>10.1f} "
+                f"{statistics.mean(timings[1:] or timings) * 1000:>10.1f} "
+                f"{min(timings) * 1000:>10.1f} {queries:>8}"
+            )
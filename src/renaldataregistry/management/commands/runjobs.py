@@ -0,0 +1,113 @@
+"""
+This file contains the command running the queued background jobs.
+"""
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from renaldataregistry.jobs import (
+    claim_job,
+    fail_stopped_jobs,
+    get_worker_name,
+    run_job,
+)
+
+
+def work(stopping, poll_interval, burst):
+    """
+    Run the queued jobs one after the other until stopping is set (or, in burst mode, until none is queued).
+    """
+    while not stopping.is_set():
+        job = claim_job()
+        if job is not None:
+            run_job(job)
+            continue
+        if burst:
+            return
+        # Closed while idle, a new connection is opened for the next job
+        connections.close_all()
+        stopping.wait(poll_interval)
+
+
+def work_in_process(stopping, poll_interval, burst):
+    """
+    Run work in a worker process, which finishes its current job when the command is stopped.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    work(stopping, poll_interval, burst)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the queued background jobs (exports, data quality scans, imports...) in a pool of worker processes. "
+        "On SIGINT or SIGTERM the workers finish their current job and stop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.JOB_WORKER_PROCESSES,
+            help=f"Number of worker processes (default {settings.JOB_WORKER_PROCESSES}).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help=f"Seconds between the checks for queued jobs (default {settings.JOB_POLL_INTERVAL}).",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Stop when no job is queued instead of waiting for new jobs.",
+        )
+
+    def handle(self, *args, **options):
+        stopped = fail_stopped_jobs()
+        if stopped:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{stopped} jobs of stopped workers marked as failed."
+                )
+            )
+        # The worker processes are forked, so they share the set up of Django (not supported on Windows)
+        context = multiprocessing.get_context("fork")
+        stopping = context.Event()
+
+        def stop(*_args):
+            self.stdout.write("Stopping after the current jobs...")
+            stopping.set()
+
+        def start_process():
+            process = context.Process(
+                target=work_in_process,
+                args=(stopping, options["poll_interval"], options["burst"]),
+            )
+            process.start()
+            return process
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        # The worker processes open their own database connections
+        connections.close_all()
+        processes = [start_process() for _ in range(options["processes"])]
+        self.stdout.write(f"{len(processes)} worker processes started.")
+        while any(process.is_alive() for process in processes):
+            time.sleep(1)
+            # A worker process killed (e.g. out of memory) is replaced, its job is marked as failed
+            for index, process in enumerate(processes):
+                if process.exitcode not in (None, 0) and not stopping.is_set():
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"Worker process {process.pid} exited with code {process.exitcode}, restarting it."
+                        )
+                    )
+                    fail_stopped_jobs(get_worker_name(process.pid))
+                    connections.close_all()
+                    processes[index] = start_process()
+        self.stdout.write("Worker processes stopped.")
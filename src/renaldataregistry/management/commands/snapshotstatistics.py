@@ -0,0 +1,21 @@
+"""
+This file contains the command to precompute the registry statistics into a new snapshot.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from renaldataregistry.snapshots import create_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the patients per health institution and KRT modality, the survival tables and the data "
+        "quality metrics into a new snapshot, read by the statistics dashboard. Run it nightly, e.g. with cron."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        snapshot = create_snapshot()
+        self.stdout.write(
+            f"Snapshot {snapshot.pk} completed in {time.perf_counter() - start:.1f}s."
+        )
@@ -0,0 +1,61 @@
+"""
+This file contains the command to download the third-party front-end assets vendored in the app's static files.
+"""
+import base64
+import hashlib
+import os
+import urllib.error
+import urllib.request
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from renaldataregistry.vendor import VENDOR_ASSETS
+
+
+def check_integrity(content, integrity):
+    """
+    Check the content against a subresource integrity hash (e.g. sha384-<base64 digest>).
+    """
+    algorithm, expected_digest = integrity.split("-", 1)
+    digest = base64.b64encode(hashlib.new(algorithm, content).digest()).decode()
+    return digest == expected_digest
+
+
+class Command(BaseCommand):
+    help = (
+        "Download Bootstrap, Popper, jQuery and Bootstrap-icons into renaldataregistry/static/vendor "
+        "so pages do not depend on external CDNs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Download the assets even if they already exist.",
+        )
+
+    def handle(self, *args, **options):
+        static_dir = os.path.join(
+            apps.get_app_config("renaldataregistry").path, "static"
+        )
+        for url, path, integrity in VENDOR_ASSETS:
+            destination = os.path.join(static_dir, path)
+            if os.path.exists(destination) and not options["force"]:
+                with open(destination, "rb") as file:
+                    if integrity is None or check_integrity(file.read(), integrity):
+                        continue
+
+            try:
+                # The URLs are the constant https URLs above
+                with urllib.request.urlopen(url, timeout=30) as response:  # nosec B310
+                    content = response.read()
+            except urllib.error.URLError as error:
+                raise CommandError(
+                    f"Could not download {url}: {error.reason}"
+                ) from error
+            if integrity and not check_integrity(content, integrity):
+                raise CommandError(f"Integrity check failed for {url}.")
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with open(destination, "wb") as file:
+                file.write(content)
+            self.stdout.write(f"Downloaded {path}.")
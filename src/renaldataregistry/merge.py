@@ -0,0 +1,283 @@
+"""
+This file contains the merge of duplicate patients into the patients kept: the duplicates' records are
+reassigned to the patients kept with set-based UPDATE statements and the duplicates are deleted.
+"""
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from psycopg2 import sql
+from renaldataregistry.models import (
+    Patient,
+    PatientRegistration,
+    PatientRenalDiagnosis,
+    PatientKRTModality,
+    PatientAKImeasurement,
+    PatientAssessment,
+    PatientStop,
+    PatientDuplicate,
+    PatientMerge,
+)
+
+MERGE_BATCH_SIZE = 1000
+
+# Records reassigned to the patient kept, the assessments' sub-records follow their assessment
+MERGED_MODELS = [PatientKRTModality, PatientAssessment]
+# Records reassigned to the patient kept without updating it: the merges into a duplicate (its audit trail)
+UNCHANGED_MERGED_MODELS = [PatientMerge]
+# Records of which a patient has one (the renal diagnoses are a primary and a secondary one): when both patients
+# have one, the most recently updated is kept, the patient kept's on a tie
+ONE_PER_PATIENT_MODELS = {
+    "registration": PatientRegistration,
+    "aki_measurement": PatientAKImeasurement,
+    "stop": PatientStop,
+    "renal_diagnoses": PatientRenalDiagnosis,
+}
+
+
+class MergeError(Exception):
+    """
+    Error raised when patients cannot be merged.
+    """
+
+
+def resolve_merges(merges):
+    """
+    Return the {duplicate id: patient kept id} of the (patient kept id, duplicate id) pairs,
+    following chains (A <- B, B <- C merges C into A).
+    """
+    patient_ids = {}
+    for patient_id, duplicate_id in merges:
+        if patient_id == duplicate_id:
+            raise MergeError(f"Patient {patient_id} cannot be merged with itself.")
+        if patient_ids.get(duplicate_id, patient_id) != patient_id:
+            raise MergeError(f"Patient {duplicate_id} is merged into two patients.")
+        patient_ids[duplicate_id] = patient_id
+    resolved_patient_ids = {}
+    for duplicate_id, patient_id in patient_ids.items():
+        seen = {duplicate_id}
+        while patient_id in patient_ids:
+            if patient_id in seen:
+                raise MergeError(f"Patient {duplicate_id} is merged in a cycle.")
+            seen.add(patient_id)
+            patient_id = patient_ids[patient_id]
+        resolved_patient_ids[duplicate_id] = patient_id
+    return resolved_patient_ids
+
+
+def reassign(model, patient_ids, now=None):
+    """
+    Reassign the model's rows of the duplicates to the patients kept in one UPDATE ... FROM (VALUES ...) statement.
+    Return the number of rows reassigned.
+    """
+    if not patient_ids:
+        return 0
+    column = model._meta.get_field("patient").column
+    assignments = [
+        sql.SQL("{} = merge.patient_id").format(sql.Identifier(column)),
+    ]
+    params = []
+    if now is not None:
+        assignments.append(sql.SQL("updated_at = %s"))
+        params.append(now)
+    for duplicate_id, patient_id in patient_ids.items():
+        params.extend([duplicate_id, patient_id])
+    query = sql.SQL(
+        "UPDATE {table} SET {assignments} "
+        "FROM (VALUES {values}) AS merge (duplicate_id, patient_id) "
+        "WHERE {table}.{column} = merge.duplicate_id"
+    ).format(
+        table=sql.Identifier(model._meta.db_table),
+        assignments=sql.SQL(", ").join(assignments),
+        values=sql.SQL(", ").join([sql.SQL("(%s, %s)")] * len(patient_ids)),
+        column=sql.Identifier(column),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.rowcount
+
+
+def resolve_one_per_patient(model, patient_ids):
+    """
+    Keep, for every patient kept, the most recently updated of its and its duplicates' records of the model
+    (the patient kept's on a tie) and delete the others.
+    Return the {duplicate id: patient kept id} of the duplicates whose records are kept.
+    """
+    # Renal diagnoses are not updated in place, the last created are the most recent
+    updated_at = "id" if model is PatientRenalDiagnosis else "updated_at"
+    last_updated = dict(
+        model.objects.filter(patient__in=[*patient_ids, *patient_ids.values()])
+        .values("patient")
+        .annotate(last_updated=Max(updated_at))
+        .values_list("patient", "last_updated")
+    )
+    candidates = {}
+    for duplicate_id, patient_id in patient_ids.items():
+        if duplicate_id in last_updated:
+            candidates.setdefault(patient_id, []).append(duplicate_id)
+    deleted_patient_ids = []
+    taken_patient_ids = {}
+    for patient_id, duplicate_ids in candidates.items():
+        if patient_id in last_updated:
+            duplicate_ids.append(patient_id)
+        kept_id = max(
+            duplicate_ids,
+            key=lambda candidate_id, patient_id=patient_id: (
+                last_updated[candidate_id],
+                candidate_id == patient_id,
+            ),
+        )
+        deleted_patient_ids.extend(
+            candidate_id for candidate_id in duplicate_ids if candidate_id != kept_id
+        )
+        if kept_id != patient_id:
+            taken_patient_ids[kept_id] = patient_id
+    if deleted_patient_ids:
+        model.objects.filter(patient__in=deleted_patient_ids).delete()
+    return taken_patient_ids
+
+
+def reassign_duplicate_pairs(patient_ids):
+    """
+    Reassign the possible duplicate pairs (PatientDuplicate) of the duplicates to the patients kept, keeping
+    their review status. The pairs of two patients merged together are deleted, as are the pairs that would
+    repeat a pair of the patient kept (the patient kept's is kept).
+    Return the number of pairs reassigned.
+    """
+    affected_ids = [*patient_ids, *set(patient_ids.values())]
+    pairs = PatientDuplicate.objects.filter(
+        Q(patient1__in=affected_ids) | Q(patient2__in=affected_ids)
+    ).order_by("pk")
+    # The pairs of the patients kept do not change, the duplicates are always resolved to a patient kept
+    existing_pairs = set()
+    moved_pairs = []
+    for pair in pairs:
+        if pair.patient1_id in patient_ids or pair.patient2_id in patient_ids:
+            moved_pairs.append(pair)
+        else:
+            existing_pairs.add((pair.patient1_id, pair.patient2_id))
+    deleted_ids = []
+    updated_pairs = []
+    for pair in moved_pairs:
+        patient1_id, patient2_id = sorted(
+            (
+                patient_ids.get(pair.patient1_id, pair.patient1_id),
+                patient_ids.get(pair.patient2_id, pair.patient2_id),
+            )
+        )
+        if patient1_id == patient2_id or (patient1_id, patient2_id) in existing_pairs:
+            deleted_ids.append(pair.pk)
+            continue
+        existing_pairs.add((patient1_id, patient2_id))
+        pair.patient1_id = patient1_id
+        pair.patient2_id = patient2_id
+        updated_pairs.append(pair)
+    if deleted_ids:
+        PatientDuplicate.objects.filter(pk__in=deleted_ids).delete()
+    PatientDuplicate.objects.bulk_update(
+        updated_pairs, ["patient1", "patient2"], batch_size=MERGE_BATCH_SIZE
+    )
+    return len(updated_pairs)
+
+
+def merge_patient_batch(merges, user=None):
+    """
+    Merge the (patient kept id, duplicate id) pairs in one transaction: the duplicates' records (and the merges
+    into them and their possible duplicate pairs) are reassigned with one UPDATE statement per table for the whole
+    batch, the merges are recorded and the duplicates deleted.
+    Return the number of patients merged.
+    """
+    patient_ids = resolve_merges(merges)
+    if not patient_ids:
+        return 0
+    kept_patient_ids = set(patient_ids.values())
+
+    with transaction.atomic():
+        patients = Patient.objects.select_for_update().in_bulk(
+            [*patient_ids, *kept_patient_ids]
+        )
+        missing_ids = (set(patient_ids) | kept_patient_ids) - set(patients)
+        if missing_ids:
+            raise MergeError(
+                f"Patients {', '.join(str(pk) for pk in sorted(missing_ids))} do not exist."
+            )
+        now = timezone.now()
+
+        records_taken = {duplicate_id: [] for duplicate_id in patient_ids}
+        for name, model in ONE_PER_PATIENT_MODELS.items():
+            taken_patient_ids = resolve_one_per_patient(model, patient_ids)
+            reassign(
+                model,
+                taken_patient_ids,
+                None if model is PatientRenalDiagnosis else now,
+            )
+            for duplicate_id in taken_patient_ids:
+                records_taken[duplicate_id].append(name)
+        for model in MERGED_MODELS:
+            reassign(model, patient_ids, now)
+        for model in UNCHANGED_MERGED_MODELS:
+            reassign(model, patient_ids)
+        reassign_duplicate_pairs(patient_ids)
+
+        # Only the latest of the current modalities of a patient stays current
+        latest_current_modalities = (
+            PatientKRTModality.objects.filter(
+                patient__in=kept_patient_ids, is_current=True
+            )
+            .order_by("patient", "-start_date", "-pk")
+            .distinct("patient")
+            .values("pk")
+        )
+        PatientKRTModality.objects.filter(
+            patient__in=kept_patient_ids, is_current=True
+        ).exclude(pk__in=latest_current_modalities).update(
+            is_current=False, updated_at=now
+        )
+        Patient.objects.filter(pk__in=kept_patient_ids).update(
+            updated_by=user, updated_at=now
+        )
+        Patient.objects.filter(
+            pk__in={
+                patient_id
+                for duplicate_id, patient_id in patient_ids.items()
+                if patients[duplicate_id].in_krt_modality == "Y"
+            }
+        ).update(in_krt_modality="Y")
+
+        # The registration history shows the registrations taken from a merged patient
+        taken_registrations = PatientRegistration.objects.filter(
+            pk__in=[
+                patient_ids[duplicate_id]
+                for duplicate_id, names in records_taken.items()
+                if "registration" in names
+            ]
+        )
+        PatientRegistration.history.bulk_history_create(  # pylint: disable=no-member
+            list(taken_registrations),
+            update=True,
+            default_user=user,
+            default_change_reason="Merged from a duplicate patient",
+            default_date=now,
+        )
+        PatientMerge.objects.bulk_create(
+            PatientMerge(
+                patient_id=patient_id,
+                merged_patient_id=duplicate_id,
+                merged_pid=patients[duplicate_id].pid,
+                merged_id_type=patients[duplicate_id].id_type,
+                merged_name=patients[duplicate_id].name,
+                merged_surname=patients[duplicate_id].surname,
+                merged_dob=patients[duplicate_id].dob,
+                records_taken=records_taken[duplicate_id],
+                created_by=user,
+            )
+            for duplicate_id, patient_id in patient_ids.items()
+        )
+        Patient.objects.filter(pk__in=patient_ids).delete()
+    return len(patient_ids)
+
+
+def merge_patients(patient, duplicate, user=None):
+    """
+    Merge duplicate into patient (see merge_patient_batch).
+    """
+    merge_patient_batch([(patient.pk, duplicate.pk)], user)
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("renaldataregistry", "0009_alter_patientregistration_unit"),
+    ]
+
+    operations = [
+        # simple_history does not expose Meta.indexes for the historical model,
+        # so the composite index used by the registration history view is created with SQL.
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX IF NOT EXISTS renaldataregistry_hpr_patient_date_idx "
+                "ON renaldataregistry_historicalpatientregistration "
+                "(patient_id, history_date DESC);"
+            ),
+            reverse_sql="DROP INDEX IF EXISTS renaldataregistry_hpr_patient_date_idx;",
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.6 on 2026-10-19 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "renaldataregistry",
+            "0010_historicalpatientregistration_patient_history_date_idx",
+        ),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(
+                fields=["updated_at", "id"], name="patient_updated_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientassessment",
+            index=models.Index(
+                fields=["updated_at", "id"], name="patientassess_updated_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientkrtmodality",
+            index=models.Index(
+                fields=["updated_at", "id"], name="patientkrtmod_updated_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientregistration",
+            index=models.Index(
+                fields=["updated_at", "patient"], name="patientreg_updated_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientstop",
+            index=models.Index(
+                fields=["updated_at", "patient"], name="patientstop_updated_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.6 on 2026-10-19 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("renaldataregistry", "0011_updated_at_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="patientregistration",
+            index=models.Index(
+                fields=["unit_no1"],
+                name="patientreg_unit_no1_like_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientregistration",
+            index=models.Index(
+                fields=["unit_no2"],
+                name="patientreg_unit_no2_like_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patientregistration",
+            index=models.Index(
+                fields=["unit_no3"],
+                name="patientreg_unit_no3_like_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        # Django 3.2 cannot set an operator class on an expression index, so the indexes of the
+        # case-insensitive prefix lookups (UPPER(column) LIKE 'X%') are created with SQL.
+        migrations.RunSQL(
+            sql=[
+                "CREATE INDEX IF NOT EXISTS patient_upper_pid_like_idx "
+                "ON renaldataregistry_patient (UPPER(pid) text_pattern_ops);",
+                "CREATE INDEX IF NOT EXISTS patient_upper_name_like_idx "
+                "ON renaldataregistry_patient (UPPER(name) text_pattern_ops);",
+                "CREATE INDEX IF NOT EXISTS patient_upper_surname_like_idx "
+                "ON renaldataregistry_patient (UPPER(surname) text_pattern_ops);",
+            ],
+            reverse_sql=[
+                "DROP INDEX IF EXISTS patient_upper_pid_like_idx;",
+                "DROP INDEX IF EXISTS patient_upper_name_like_idx;",
+                "DROP INDEX IF EXISTS patient_upper_surname_like_idx;",
+            ],
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 3.2.6 on 2026-10-19 12:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("renaldataregistry", "0012_patient_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientDuplicate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField(verbose_name="Name similarity")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("P", "Pending review"), ("N", "Not duplicates")],
+                        default="P",
+                        max_length=1,
+                        verbose_name="Status",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "patient1",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="duplicates1",
+                        to="renaldataregistry.patient",
+                    ),
+                ),
+                (
+                    "patient2",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="duplicates2",
+                        to="renaldataregistry.patient",
+                    ),
+                ),
+                (
+                    "updated_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="dup_updated_by",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="patientduplicate",
+            index=models.Index(
+                fields=["status", "-score"], name="patientduplicate_queue_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="patientduplicate",
+            constraint=models.UniqueConstraint(
+                fields=("patient1", "patient2"), name="patientduplicate_pair_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.6 on 2026-10-19 12:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("renaldataregistry", "0013_patientduplicate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientMerge",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "merged_patient_id",
+                    models.BigIntegerField(verbose_name="Id of the merged patient"),
+                ),
+                (
+                    "merged_pid",
+                    models.CharField(
+                        max_length=14,
+                        verbose_name="N.I.C no. (or passport no.) of the merged patient",
+                    ),
+                ),
+                (
+                    "merged_id_type",
+                    models.PositiveSmallIntegerField(
+                        choices=[(1, "N.I.C"), (2, "Passport")],
+                        verbose_name="Unique identifier type of the merged patient",
+                    ),
+                ),
+                ("merged_name", models.CharField(max_length=100)),
+                ("merged_surname", models.CharField(max_length=100)),
+                ("merged_dob", models.DateField()),
+                ("records_taken", models.JSONField(blank=True, default=list)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="merge_created_by",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="merges",
+                        to="renaldataregistry.patient",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 3.2.6 on 2026-10-19 12:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("renaldataregistry", "0014_patientmerge"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Job",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "task",
+                    models.CharField(
+                        choices=[
+                            ("dataquality", "Data quality scan"),
+                            ("changefeed", "Change feed export"),
+                            ("findduplicates", "Duplicate patients detection"),
+                            ("bulkimport", "Import of KRT modalities and assessments"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("arguments", models.JSONField(blank=True, default=dict)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Q", "Queued"),
+                            ("R", "Running"),
+                            ("D", "Done"),
+                            ("F", "Failed"),
+                        ],
+                        default="Q",
+                        max_length=1,
+                    ),
+                ),
+                (
+                    "progress",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="Progress (%)"
+                    ),
+                ),
+                ("message", models.CharField(blank=True, max_length=255)),
+                ("result_file", models.CharField(blank=True, max_length=255)),
+                ("error", models.TextField(blank=True)),
+                ("worker", models.CharField(blank=True, max_length=100)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="job_created_by",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(fields=["status", "created_at"], name="job_queue_idx"),
+        ),
+    ]
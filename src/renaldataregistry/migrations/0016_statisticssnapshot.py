@@ -0,0 +1,171 @@
+# Generated by Django 3.2.6 on 2026-10-19 12:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("renaldataregistry", "0015_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataQualityStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("table", models.CharField(max_length=50)),
+                ("rule", models.CharField(max_length=50)),
+                ("field", models.CharField(max_length=50)),
+                ("rows", models.PositiveIntegerField()),
+                ("broken", models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="InstitutionStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "modality",
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        choices=[(1, "NK"), (2, "HD"), (3, "PD"), (4, "TX")],
+                        null=True,
+                    ),
+                ),
+                ("patients", models.PositiveIntegerField()),
+                (
+                    "new_patients",
+                    models.PositiveIntegerField(
+                        verbose_name="Patients registered in the last 12 months"
+                    ),
+                ),
+                ("deceased", models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="StatisticsSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("R", "Running"), ("C", "Completed"), ("F", "Failed")],
+                        default="R",
+                        max_length=1,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="job",
+            name="task",
+            field=models.CharField(
+                choices=[
+                    ("dataquality", "Data quality scan"),
+                    ("changefeed", "Change feed export"),
+                    ("findduplicates", "Duplicate patients detection"),
+                    ("bulkimport", "Import of KRT modalities and assessments"),
+                    ("snapshotstatistics", "Snapshot of the registry statistics"),
+                ],
+                max_length=50,
+            ),
+        ),
+        migrations.CreateModel(
+            name="SurvivalStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "modality",
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        choices=[(1, "NK"), (2, "HD"), (3, "PD"), (4, "TX")],
+                        null=True,
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField()),
+                ("at_risk", models.PositiveIntegerField()),
+                ("deaths", models.PositiveIntegerField()),
+                ("censored", models.PositiveIntegerField()),
+                ("survival", models.FloatField()),
+                (
+                    "snapshot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="survival",
+                        to="renaldataregistry.statisticssnapshot",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="statisticssnapshot",
+            index=models.Index(
+                fields=["status", "-completed_at"], name="statssnapshot_latest_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="institutionstatistics",
+            name="health_institution",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="renaldataregistry.healthinstitution",
+            ),
+        ),
+        migrations.AddField(
+            model_name="institutionstatistics",
+            name="snapshot",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="institutions",
+                to="renaldataregistry.statisticssnapshot",
+            ),
+        ),
+        migrations.AddField(
+            model_name="dataqualitystatistics",
+            name="snapshot",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="data_quality",
+                to="renaldataregistry.statisticssnapshot",
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.6 on 2026-10-19 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("renaldataregistry", "0016_statisticssnapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comorbidity",
+            name="bit",
+            field=models.PositiveSmallIntegerField(
+                blank=True, editable=False, null=True, unique=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="patientassessment",
+            name="comorbidity_mask",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        # Bits assigned in the order of the comorbidities (at most 63, see COMORBIDITY_MASK_BITS)
+        migrations.RunSQL(
+            sql=[
+                "UPDATE renaldataregistry_comorbidity SET bit = numbered.bit "
+                "FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS bit "
+                "FROM renaldataregistry_comorbidity) AS numbered "
+                "WHERE renaldataregistry_comorbidity.id = numbered.id AND numbered.bit < 63;",
+                "UPDATE renaldataregistry_patientassessment SET comorbidity_mask = masks.mask "
+                "FROM (SELECT assessment_comorbidity.patientassessment_id, "
+                "BIT_OR(1::bigint << comorbidity.bit) AS mask "
+                "FROM renaldataregistry_patientassessment_comorbidity AS assessment_comorbidity "
+                "JOIN renaldataregistry_comorbidity AS comorbidity "
+                "ON comorbidity.id = assessment_comorbidity.comorbidity_id "
+                "WHERE comorbidity.bit IS NOT NULL "
+                "GROUP BY assessment_comorbidity.patientassessment_id) AS masks "
+                "WHERE renaldataregistry_patientassessment.id = masks.patientassessment_id;",
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
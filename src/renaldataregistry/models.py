@@ -185,6 +185,14 @@ class Patient(models.Model):
     )
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Change feed: rows changed since a watermark, in (updated_at, pk) order
+        # The UPPER(pid), UPPER(name) and UPPER(surname) indexes of the patient lookup are created
+        # in migration 0012_patient_lookup_indexes
+        indexes = [
+            models.Index(fields=["updated_at", "id"], name="patient_updated_at_idx"),
+        ]
+
 
 class PatientRegistration(models.Model):
     """
@@ -238,6 +246,29 @@ class PatientRegistration(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     history = HistoricalRecords()
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["updated_at", "patient"], name="patientreg_updated_at_idx"
+            ),
+            # Patient lookup: unit number prefixes (LIKE 'x%')
+            models.Index(
+                fields=["unit_no1"],
+                name="patientreg_unit_no1_like_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+            models.Index(
+                fields=["unit_no2"],
+                name="patientreg_unit_no2_like_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+            models.Index(
+                fields=["unit_no3"],
+                name="patientreg_unit_no3_like_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
+
 
 class HealthInstitution(models.Model):
     """
@@ -316,6 +347,10 @@ class Comorbidity(models.Model):
     """
 
     comorbidity = models.CharField(max_length=100)
+    # Bit of the comorbidity in PatientAssessment.comorbidity_mask, assigned when it is created (see comorbidities.py)
+    bit = models.PositiveSmallIntegerField(
+        unique=True, blank=True, null=True, editable=False
+    )
     created_by = models.ForeignKey(
         CustomUser,
         on_delete=models.SET_NULL,
@@ -563,6 +598,13 @@ class PatientKRTModality(models.Model):
     )
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["updated_at", "id"], name="patientkrtmod_updated_at_idx"
+            ),
+        ]
+
 
 class PatientAKImeasurement(models.Model):
     """
@@ -665,6 +707,8 @@ class PatientAssessment(models.Model):
         blank=True,
         verbose_name="Disabilities",
     )
+    # Bitset of the comorbidities (bit Comorbidity.bit), kept up to date with the M2M table (see comorbidities.py)
+    comorbidity_mask = models.BigIntegerField(default=0, editable=False)
     smokingstatus = models.PositiveSmallIntegerField(
         choices=SMOKINGSTATUS_CHOICES,
         default=0,
@@ -713,6 +757,13 @@ class PatientAssessment(models.Model):
     )
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["updated_at", "id"], name="patientassess_updated_at_idx"
+            ),
+        ]
+
 
 class PatientDialysisAssessment(models.Model):
     """
@@ -1087,3 +1138,222 @@ class PatientStop(models.Model):
 
     class Meta:
         db_table = "renaldataregistry_patientendoftreatment"
+        indexes = [
+            models.Index(
+                fields=["updated_at", "patient"], name="patientstop_updated_at_idx"
+            ),
+        ]
+
+
+class PatientDuplicate(models.Model):
+    """
+    Define a pair of patients that may be the same person (e.g. registered with a passport and later a N.I.C,
+    or with a spelling variant of the name), found by the findduplicates command and reviewed in the
+    duplicate review queue. patient1 is the patient with the lower id.
+    """
+
+    STATUS_CHOICES = (
+        ("P", "Pending review"),
+        ("N", "Not duplicates"),
+    )
+
+    patient1 = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="duplicates1"
+    )
+    patient2 = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="duplicates2"
+    )
+    score = models.FloatField(verbose_name="Name similarity")
+    status = models.CharField(
+        max_length=1,
+        choices=STATUS_CHOICES,
+        default="P",
+        verbose_name="Status",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        related_name="dup_updated_by",
+        blank=True,
+        null=True,
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["patient1", "patient2"], name="patientduplicate_pair_unique"
+            ),
+        ]
+        indexes = [
+            # Review queue: pending pairs, most similar first
+            models.Index(
+                fields=["status", "-score"], name="patientduplicate_queue_idx"
+            ),
+        ]
+
+
+class PatientMerge(models.Model):
+    """
+    Define the merge of a duplicate patient into the patient kept, recording the identity of the deleted duplicate
+    and which of its one-per-patient records replaced the patient's.
+    """
+
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="merges"
+    )
+    merged_patient_id = models.BigIntegerField(verbose_name="Id of the merged patient")
+    merged_pid = models.CharField(
+        max_length=14, verbose_name="N.I.C no. (or passport no.) of the merged patient"
+    )
+    merged_id_type = models.PositiveSmallIntegerField(
+        choices=Patient.TYPE_CHOICES,
+        verbose_name="Unique identifier type of the merged patient",
+    )
+    merged_name = models.CharField(max_length=100)
+    merged_surname = models.CharField(max_length=100)
+    merged_dob = models.DateField()
+    # Names of the one-per-patient records (e.g. registration) taken from the merged patient
+    records_taken = models.JSONField(default=list, blank=True)
+    created_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        related_name="merge_created_by",
+        blank=True,
+        null=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Job(models.Model):
+    """
+    Define a long-running task (e.g. a data quality scan or an import) queued to run in the background
+    by the runjobs command, with its progress and its result file.
+    """
+
+    TASK_CHOICES = (
+        ("dataquality", "Data quality scan"),
+        ("changefeed", "Change feed export"),
+        ("findduplicates", "Duplicate patients detection"),
+        ("bulkimport", "Import of KRT modalities and assessments"),
+        ("snapshotstatistics", "Snapshot of the registry statistics"),
+    )
+    STATUS_CHOICES = (
+        ("Q", "Queued"),
+        ("R", "Running"),
+        ("D", "Done"),
+        ("F", "Failed"),
+    )
+    task = models.CharField(max_length=50, choices=TASK_CHOICES)
+    # Keyword arguments of the task (e.g. {"tables": ["patients"]})
+    arguments = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default="Q")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="Progress (%)")
+    message = models.CharField(max_length=255, blank=True)
+    # Name of the file written by the task in JOB_RESULTS_DIR
+    result_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    # host:pid of the worker process running the task
+    worker = models.CharField(max_length=100, blank=True)
+    created_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        related_name="job_created_by",
+        blank=True,
+        null=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Also updated by the progress of the running task, the jobs of workers that stopped are not updated
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_task_display()} #{self.pk}"
+
+
+class StatisticsSnapshot(models.Model):
+    """
+    Define a snapshot of the registry statistics, precomputed by the snapshotstatistics command (e.g. nightly).
+    Its rows are written in one transaction with its completion, the dashboards read the latest completed one.
+    """
+
+    STATUS_CHOICES = (
+        ("R", "Running"),
+        ("C", "Completed"),
+        ("F", "Failed"),
+    )
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default="R")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "-completed_at"], name="statssnapshot_latest_idx"
+            ),
+        ]
+
+
+class InstitutionStatistics(models.Model):
+    """
+    Define the number of patients of a health institution (None for the patients not registered) with a current
+    KRT modality (None for the patients without one) in a snapshot.
+    """
+
+    snapshot = models.ForeignKey(
+        StatisticsSnapshot, on_delete=models.CASCADE, related_name="institutions"
+    )
+    health_institution = models.ForeignKey(
+        HealthInstitution, on_delete=models.SET_NULL, blank=True, null=True
+    )
+    modality = models.PositiveSmallIntegerField(
+        choices=PatientKRTModality.MOD_CHOICES, blank=True, null=True
+    )
+    patients = models.PositiveIntegerField()
+    new_patients = models.PositiveIntegerField(
+        verbose_name="Patients registered in the last 12 months"
+    )
+    deceased = models.PositiveIntegerField()
+
+
+class SurvivalStatistics(models.Model):
+    """
+    Define a year of the life table of the patients by their first KRT modality (None for all the patients)
+    in a snapshot: the patients followed at the start of the year, who died or were censored during the year,
+    and the cumulative survival at its end.
+    """
+
+    snapshot = models.ForeignKey(
+        StatisticsSnapshot, on_delete=models.CASCADE, related_name="survival"
+    )
+    modality = models.PositiveSmallIntegerField(
+        choices=PatientKRTModality.MOD_CHOICES, blank=True, null=True
+    )
+    year = models.PositiveSmallIntegerField()
+    at_risk = models.PositiveIntegerField()
+    deaths = models.PositiveIntegerField()
+    censored = models.PositiveIntegerField()
+    survival = models.FloatField()
+
+
+class DataQualityStatistics(models.Model):
+    """
+    Define the number of rows of a table breaking a validation rule in a snapshot (see dataquality.py).
+    """
+
+    snapshot = models.ForeignKey(
+        StatisticsSnapshot, on_delete=models.CASCADE, related_name="data_quality"
+    )
+    table = models.CharField(max_length=50)
+    rule = models.CharField(max_length=50)
+    field = models.CharField(max_length=50)
+    rows = models.PositiveIntegerField()
+    broken = models.PositiveIntegerField()
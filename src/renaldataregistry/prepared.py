@@ -0,0 +1,160 @@
+"""
+This file contains the queries run on nearly every request (current and first KRT modality of a patient, assessment
+of a registration or modality form) as named prepared statements: PostgreSQL parses and plans them once per
+connection (then reuses a generic plan) instead of at every execution.
+"""
+import asyncio
+import re
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+from renaldataregistry.models import PatientKRTModality, PatientAssessment
+
+re_planning_time = re.compile(r"Planning Time: ([\d.]+) ms")
+
+# Counters of the prepared statements executed in the current request, and their planning time measured without
+# preparing them (a dict, shared with the threads running the concurrent queries of the async views)
+prepared_state = Local()
+
+
+class PreparedQuery:
+    """
+    Define a query whose first row is read with a named prepared statement. get_queryset returns the ordered
+    queryset of the arguments: it is compiled at every call (which also converts the arguments as the ORM does)
+    and the statement is prepared on each connection from the first SQL compiled there. A call compiling to
+    another SQL (e.g. an argument None compiles to IS NULL) runs the queryset as usual.
+    """
+
+    def __init__(self, name, get_queryset):
+        self.name = name
+        self.get_queryset = get_queryset
+        # Planning time (ms) of the query not prepared, measured once with EXPLAIN
+        self.planning_time = None
+
+    def get(self, *arguments):
+        """
+        Return the first row of the query for the arguments, or None.
+        """
+        queryset = self.get_queryset(*arguments)[:1]
+        connection = connections[queryset.db]
+        if not connection.settings_dict.get("PREPARED_STATEMENTS"):
+            return next(iter(queryset), None)
+
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        if not self.prepare(connection, sql, params):
+            return next(iter(queryset), None)
+        execute_sql = f"EXECUTE {self.name}"
+        if params:
+            execute_sql += f"({', '.join(['%s'] * len(params))})"
+        rows = list(
+            queryset.model.objects.db_manager(queryset.db).raw(execute_sql, params)
+        )
+
+        counters = getattr(prepared_state, "counters", None)
+        if counters is not None:
+            counters["executions"] += 1
+            counters["planning_time"] += self.planning_time
+        return rows[0] if rows else None
+
+    def prepare(self, connection, sql, params):
+        """
+        Prepare the statement on the connection if it is not yet. Return whether the statement prepared there
+        is sql.
+        """
+        connection.ensure_connection()
+        # The statements prepared are tracked per database session: they are lost when it is reopened
+        if (
+            getattr(connection, "prepared_connection", None)
+            is not connection.connection
+        ):
+            connection.prepared_connection = connection.connection
+            connection.prepared_statements = {}
+        if self.name not in connection.prepared_statements:
+            with connection.cursor() as cursor:
+                if self.planning_time is None:
+                    cursor.execute(f"EXPLAIN (SUMMARY) {sql}", params)
+                    plan = "\n".join(row[0] for row in cursor.fetchall())
+                    match = re_planning_time.search(plan)
+                    self.planning_time = float(match.group(1)) if match else 0
+                # The parameters are numbered $1, $2... in a prepared statement
+                parts = [part.replace("%%", "%") for part in sql.split("%s")]
+                prepared_sql = "".join(
+                    f"{part}${number}" if number < len(parts) else part
+                    for number, part in enumerate(parts, start=1)
+                )
+                cursor.execute(f"PREPARE {self.name} AS {prepared_sql}")
+            connection.prepared_statements[self.name] = sql
+        return connection.prepared_statements[self.name] == sql
+
+
+class PreparedStatementMiddleware:
+    """
+    Count the prepared statements executed by a request and, in DEBUG, send in a Server-Timing header
+    (shown by the browser's developer tools) their number and the planning time they saved, an upper bound
+    as PostgreSQL still plans the first executions of a prepared statement.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Under ASGI the middleware is a coroutine, so the async views do not run in a thread (as MiddlewareMixin)
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        prepared_state.counters = {"executions": 0, "planning_time": 0}
+        response = self.get_response(request)
+        self.add_server_timing(response)
+        return response
+
+    async def __acall__(self, request):
+        prepared_state.counters = {"executions": 0, "planning_time": 0}
+        response = await self.get_response(request)
+        self.add_server_timing(response)
+        return response
+
+    @staticmethod
+    def add_server_timing(response):
+        """
+        Add the Server-Timing header of the prepared statements executed, in DEBUG.
+        """
+        executions = prepared_state.counters["executions"]
+        planning_time = prepared_state.counters["planning_time"]
+        if settings.DEBUG and executions:
+            response["Server-Timing"] = (
+                f'prepared;desc="{executions} prepared statements, '
+                f'planning time saved";dur={planning_time:.3f}'
+            )
+
+
+CURRENT_KRT_MODALITY = PreparedQuery(
+    "current_krtmodality",
+    lambda patient: PatientKRTModality.objects.filter(
+        patient=patient, is_current=True
+    ).order_by("pk"),
+)
+# Locked until the transaction commits, e.g. while an assessment saving HD fields of the modality is saved
+CURRENT_KRT_MODALITY_FOR_UPDATE = PreparedQuery(
+    "current_krtmodality_for_update",
+    lambda patient: PatientKRTModality.objects.select_for_update()
+    .filter(patient=patient, is_current=True)
+    .order_by("pk"),
+)
+FIRST_KRT_MODALITY = PreparedQuery(
+    "first_krtmodality",
+    lambda patient: PatientKRTModality.objects.filter(patient=patient).order_by(
+        "start_date"
+    ),
+)
+# The assessment saved with a registration or KRT modality form has its created_at
+FORM_ASSESSMENT = PreparedQuery(
+    "form_assessment",
+    lambda patient, created_at: PatientAssessment.objects.filter(
+        patient=patient, created_at=created_at
+    ).order_by("pk"),
+)
@@ -0,0 +1,56 @@
+"""
+This file contains the versioning of the reference data (health institutions, HD units, comorbidities and disabilities)
+listed in the forms' choices, used to expire what is cached from them, and the in-memory index of the HD unit options.
+"""
+import functools
+import hashlib
+
+from django.db import connection
+from django.template.loader import render_to_string
+from psycopg2 import sql
+from renaldataregistry.models import Comorbidity, Disability, HDUnit, HealthInstitution
+
+
+def get_table_version(*models):
+    """
+    Return a version of the models' tables: a digest of the last updated_at and the number of rows of each (the
+    number changes when rows are deleted), in one query. The version is read from the database, so that it
+    changes in every process when another one updates the tables.
+    """
+    query = sql.SQL(" UNION ALL ").join(
+        sql.SQL("SELECT {name}, MAX(updated_at), COUNT(*) FROM {table}").format(
+            name=sql.Literal(model._meta.db_table),
+            table=sql.Identifier(model._meta.db_table),
+        )
+        for model in models
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        rows = sorted(cursor.fetchall())
+    return hashlib.sha1(repr(rows).encode()).hexdigest()  # nosec B324
+
+
+def get_reference_data_version():
+    """
+    Return the current version of the reference data.
+    """
+    return get_table_version(HealthInstitution, HDUnit, Comorbidity, Disability)
+
+
+@functools.lru_cache(maxsize=1)
+def build_hd_unit_options(version):
+    """
+    Return the ETag and the rendered <option> list of the HD units for a version of the HD units table.
+    Only the last version is kept, so the index is rebuilt once after HD units change.
+    """
+    units = HDUnit.objects.order_by("name").only("pk", "name")
+    options = render_to_string("unit_dropdownlist_options.html", {"units": units})
+    etag = hashlib.sha1(f"{version}:{options}".encode()).hexdigest()  # nosec B324
+    return f'"{etag}"', options
+
+
+def get_hd_unit_options():
+    """
+    Return the ETag and the rendered <option> list of the HD units from the in-memory index.
+    """
+    return build_hd_unit_options(get_table_version(HDUnit))
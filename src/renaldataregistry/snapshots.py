@@ -0,0 +1,264 @@
+"""
+This file contains the precomputation of the registry statistics into snapshot tables (see the snapshotstatistics
+command), so the dashboards read the latest completed snapshot instead of computing them at request time.
+"""
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.utils import timezone
+from renaldataregistry.dataquality import get_data_quality_report
+from renaldataregistry.models import (
+    Patient,
+    PatientKRTModality,
+    StatisticsSnapshot,
+    InstitutionStatistics,
+    SurvivalStatistics,
+    DataQualityStatistics,
+)
+
+SNAPSHOT_BATCH_SIZE = 1000
+# Years of the life tables
+SURVIVAL_YEARS = 10
+
+
+def get_institution_statistics(snapshot, now):
+    """
+    Return the InstitutionStatistics of the patients grouped by health institution and current KRT modality.
+    """
+    current_modality = PatientKRTModality.objects.filter(
+        patient=OuterRef("pk"), is_current=True
+    ).order_by("pk")
+    rows = (
+        Patient.objects.values(
+            institution_id=F("patientregistration__health_institution"),
+            modality=Subquery(current_modality.values("modality")[:1]),
+        )
+        .annotate(
+            patients=Count("pk"),
+            new_patients=Count(
+                "pk", filter=Q(created_at__gte=now - timedelta(days=365))
+            ),
+            deceased=Count("pk", filter=Q(patientstop__stop_reason="D")),
+        )
+        .order_by()
+    )
+    return [
+        InstitutionStatistics(
+            snapshot=snapshot,
+            health_institution_id=row["institution_id"],
+            modality=row["modality"],
+            patients=row["patients"],
+            new_patients=row["new_patients"],
+            deceased=row["deceased"],
+        )
+        for row in rows
+    ]
+
+
+def get_life_table(followups, years=SURVIVAL_YEARS):
+    """
+    Return the (year, at risk, deaths, censored, survival) rows of the actuarial life table of the
+    (years followed, died) follow-ups: the patients censored during a year count as followed half of it.
+    """
+    deaths = defaultdict(int)
+    censored = defaultdict(int)
+    for followed, died in followups:
+        year = int(followed)
+        if year >= years:
+            continue
+        if died:
+            deaths[year] += 1
+        else:
+            censored[year] += 1
+    at_risk = len(followups)
+    survival = 1.0
+    table = []
+    for year in range(years):
+        if at_risk == 0:
+            break
+        exposed = at_risk - censored[year] / 2
+        survival *= 1 - deaths[year] / exposed if exposed else 1
+        table.append((year, at_risk, deaths[year], censored[year], survival))
+        at_risk -= deaths[year] + censored[year]
+    return table
+
+
+def get_survival_statistics(snapshot, now):
+    """
+    Return the SurvivalStatistics of the patients from the start of their first KRT modality, by first modality
+    and for all the patients. The patients who stopped for another reason than death are censored at their
+    last dialysis, the others followed until now.
+    """
+    first_modality = PatientKRTModality.objects.filter(
+        patient=OuterRef("pk"), start_date__isnull=False
+    ).order_by("start_date", "pk")
+    patients = (
+        Patient.objects.annotate(
+            start_date=Subquery(first_modality.values("start_date")[:1]),
+            first_modality=Subquery(first_modality.values("modality")[:1]),
+        )
+        .filter(start_date__isnull=False)
+        .values_list(
+            "start_date",
+            "first_modality",
+            "patientstop__stop_reason",
+            "patientstop__dod",
+            "patientstop__last_dialysis_date",
+        )
+    )
+    today = now.date()
+    followups = defaultdict(list)
+    for start_date, modality, stop_reason, dod, last_dialysis_date in patients:
+        died = stop_reason == "D"
+        if died:
+            end_date = dod or last_dialysis_date or today
+        elif stop_reason:
+            end_date = last_dialysis_date or today
+        else:
+            end_date = today
+        followup = (max((end_date - start_date).days, 0) / 365.25, died)
+        followups[modality].append(followup)
+        followups[None].append(followup)
+    return [
+        SurvivalStatistics(
+            snapshot=snapshot,
+            modality=modality,
+            year=year,
+            at_risk=at_risk,
+            deaths=deaths,
+            censored=censored,
+            survival=survival,
+        )
+        for modality, modality_followups in followups.items()
+        for year, at_risk, deaths, censored, survival in get_life_table(
+            modality_followups
+        )
+    ]
+
+
+def get_data_quality_statistics(snapshot, now):
+    """
+    Return the DataQualityStatistics of the data quality report.
+    """
+    return [
+        DataQualityStatistics(
+            snapshot=snapshot,
+            table=table_report["table"],
+            rule=rule_report["rule"],
+            field=rule_report["field"],
+            rows=table_report["rows"],
+            broken=rule_report["broken"],
+        )
+        for table_report in get_data_quality_report(samples=0, current_date=now.date())
+        for rule_report in table_report["rules"]
+    ]
+
+
+SNAPSHOT_STATISTICS = [
+    (InstitutionStatistics, get_institution_statistics),
+    (SurvivalStatistics, get_survival_statistics),
+    (DataQualityStatistics, get_data_quality_statistics),
+]
+
+
+def create_snapshot(progress=None):
+    """
+    Compute the statistics into a new snapshot and return it. The snapshot is recorded as running, then its
+    rows are written in one transaction that marks it completed, so a snapshot being computed (or failed) is
+    never read. The completed snapshots older than the last STATISTICS_SNAPSHOTS_KEPT are deleted,
+    the failed ones are kept with their error.
+    """
+    snapshot = StatisticsSnapshot.objects.create()
+    now = snapshot.created_at
+    try:
+        with transaction.atomic():
+            for done, (model, get_statistics) in enumerate(SNAPSHOT_STATISTICS):
+                if progress:
+                    progress(
+                        done,
+                        len(SNAPSHOT_STATISTICS),
+                        f"Computing {model._meta.verbose_name_plural}",
+                    )
+                model.objects.bulk_create(
+                    get_statistics(snapshot, now), batch_size=SNAPSHOT_BATCH_SIZE
+                )
+            snapshot.status = "C"
+            snapshot.completed_at = timezone.now()
+            snapshot.save(update_fields=["status", "completed_at"])
+    except Exception:
+        snapshot.status = "F"
+        snapshot.error = traceback.format_exc()
+        snapshot.save(update_fields=["status", "error"])
+        raise
+
+    kept_ids = StatisticsSnapshot.objects.filter(status="C").order_by("-completed_at")[
+        : settings.STATISTICS_SNAPSHOTS_KEPT
+    ]
+    StatisticsSnapshot.objects.filter(status="C").exclude(
+        pk__in=kept_ids.values("pk")
+    ).delete()
+    return snapshot
+
+
+def get_latest_snapshot():
+    """
+    Return the latest completed snapshot, or None.
+    """
+    return (
+        StatisticsSnapshot.objects.filter(status="C").order_by("-completed_at").first()
+    )
+
+
+def get_snapshot_tables(snapshot):
+    """
+    Return the tables of a snapshot shown by the statistics dashboard: the patients per health institution and
+    current KRT modality (with the totals), the life tables by first KRT modality and the data quality rules.
+    """
+    modalities = [(None, "No modality")] + list(PatientKRTModality.MOD_CHOICES)
+    institutions = {}
+    total = {
+        "name": "Total",
+        "patients": [0] * len(modalities),
+        "new_patients": 0,
+        "deceased": 0,
+    }
+    for row in snapshot.institutions.select_related("health_institution").order_by(
+        "health_institution__name"
+    ):
+        name = (
+            row.health_institution.name if row.health_institution else "Not registered"
+        )
+        institution = institutions.setdefault(
+            name,
+            {
+                "name": name,
+                "patients": [0] * len(modalities),
+                "new_patients": 0,
+                "deceased": 0,
+            },
+        )
+        column = [modality for modality, _ in modalities].index(row.modality)
+        for counts in (institution, total):
+            counts["patients"][column] += row.patients
+            counts["new_patients"] += row.new_patients
+            counts["deceased"] += row.deceased
+
+    survival = defaultdict(list)
+    for row in snapshot.survival.order_by("modality", "year"):
+        survival[row.get_modality_display() if row.modality else "All patients"].append(
+            row
+        )
+
+    return {
+        "modalities": [label for _, label in modalities],
+        "institutions": list(institutions.values()),
+        "total": total,
+        "survival": sorted(
+            survival.items(), key=lambda item: item[0] != "All patients"
+        ),
+        "data_quality": snapshot.data_quality.order_by("table", "rule", "field"),
+    }
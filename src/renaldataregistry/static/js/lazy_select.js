@@ -0,0 +1,20 @@
+$(document).ready(function () {
+    // Selects rendered by the LazySelect widget only have their empty and selected options,
+    // load the other options once per URL (the response is cached by the browser)
+    var selects = {};
+    $("select[data-options-url]").each(function () {
+        var url = $(this).attr("data-options-url");
+        selects[url] = (selects[url] || []).concat(this);
+    });
+    $.each(selects, function (url, elements) {
+        $.get(url, function (data) {
+            $.each(elements, function (index, element) {
+                var select = $(element);
+                var value = select.val();
+                select.find("option[value!='']").remove();
+                select.append(data);
+                select.val(value);
+            });
+        });
+    });
+});
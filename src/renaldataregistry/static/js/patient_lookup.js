@@ -0,0 +1,39 @@
+$(document).ready(function () {
+    // Suggest the patients matching the typed N.I.C/passport number, name, surname or unit number
+    var search = $("#record_search");
+    var matches = $("#record_search_matches");
+    var timer = null;
+    var request = null;
+
+    search.on("input", function () {
+        // Wait until the user stops typing, and drop the answer of a previous prefix
+        clearTimeout(timer);
+        if (request) {
+            request.abort();
+        }
+        var prefix = $.trim(search.val());
+        if (prefix.length < 2) {
+            matches.empty();
+            return;
+        }
+        timer = setTimeout(function () {
+            request = $.getJSON(search.attr("data-lookup-url"), { q: prefix }, function (data) {
+                matches.empty();
+                $.each(data.results, function (index, patient) {
+                    var label = patient.surname + " " + patient.name + " (" + patient.pid + ")";
+                    if (patient.unit_numbers.length) {
+                        label += " - Unit " + patient.unit_numbers.join(", ");
+                    }
+                    matches.append($("<a>", { href: patient.url, "class": "list-group-item list-group-item-action", text: label }));
+                });
+            });
+        }, 250);
+    });
+
+    search.on("blur", function () {
+        // Let a click on a match follow its link first
+        setTimeout(function () {
+            matches.empty();
+        }, 200);
+    });
+});
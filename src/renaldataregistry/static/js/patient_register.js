@@ -72,21 +72,6 @@ $(document).ready(function () {
         }
     });
 
-    $("#id_health_institution").change(function (event) {
-        var url = $("#mrr_form").attr("data-units-url");
-        var hi_id = $(this).val();
-
-        $.ajax({
-            url: url,
-            data: {
-                'hi_id': hi_id
-            },
-            success: function (data) {
-                $("#id_unit").html(data);
-            }
-        });
-    });
-
     
     $('[data-bs-toggle="tooltip"]').tooltip();
 
@@ -0,0 +1,62 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from renaldataregistry.reference_data import get_reference_data_version
+
+register = template.Library()
+
+
+def is_blank_form(form):
+    """
+    Check if the form renders the same for every request: not bound to submitted data and without an existing instance.
+    """
+    instance = getattr(form, "instance", None)
+    return not form.is_bound and (instance is None or instance.pk is None)
+
+
+class FormCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, forms):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.forms = forms
+
+    def render(self, context):
+        forms = [form.resolve(context) for form in self.forms]
+        if not all(is_blank_form(form) for form in forms):
+            return self.nodelist.render(context)
+        # The version is read from the database once per rendering of the page
+        version = context.render_context.get("reference_data_version")
+        if version is None:
+            version = get_reference_data_version()
+            context.render_context["reference_data_version"] = version
+        key = make_template_fragment_key(
+            self.fragment_name, [form.prefix for form in forms] + [version]
+        )
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = self.nodelist.render(context)
+            cache.set(key, fragment, settings.FORM_FRAGMENT_CACHE_TIMEOUT)
+        return fragment
+
+
+@register.tag
+def formcache(parser, token):
+    """
+    Cache the rendering of blank forms, keyed on the fragment name, the forms' prefixes and the version of the
+    reference data.
+    Forms bound to data or editing an existing record are rendered as usual.
+    Usage: {% formcache "fragment name" form1 form2 %} ... {% endformcache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires a fragment name and at least one form."
+        )
+    nodelist = parser.parse(("endformcache",))
+    parser.delete_first_token()
+    return FormCacheNode(
+        nodelist,
+        bits[1].strip("\"'"),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
@@ -0,0 +1,221 @@
+"""
+This file contains the timeline of a patient: the registration, KRT modality starts, AKI measurements, assessments and
+stop of dialysis in chronological order, read with one UNION ALL query over their tables and paginated by keyset.
+"""
+import base64
+import binascii
+from datetime import date
+
+from django.db.models import (
+    BigIntegerField,
+    Case,
+    DateField,
+    F,
+    IntegerField,
+    Q,
+    TextField,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from renaldataregistry.models import (
+    PatientRegistration,
+    PatientAKImeasurement,
+    PatientKRTModality,
+    PatientAssessment,
+    PatientStop,
+)
+
+TIMELINE_PAGE_SIZE = 50
+
+
+class TimelineSource:
+    """
+    Define a type of event of the timeline: its table, the date of the event, up to three values shown with it and
+    the view of the record (taking its primary key). The rank orders the events of a same date, e.g. the
+    registration first.
+    """
+
+    def __init__(self, rank, title, model, event_date, values, url_name):
+        self.rank = rank
+        self.title = title
+        self.model = model
+        self.event_date = event_date
+        # (label, field path or expression, choices)
+        self.values = values
+        self.url_name = url_name
+
+    def get_queryset(self, patient_id, after=None):
+        """
+        Return the events of the patient after the keyset (date, rank, id), as the columns of the UNION ALL.
+        """
+        queryset = self.model.objects.filter(patient=patient_id).annotate(
+            event_date=Cast(self.event_date, DateField())
+        )
+        if after is not None:
+            after_date, after_rank, after_id = after
+            condition = Q(event_date__gt=after_date)
+            if self.rank > after_rank:
+                condition |= Q(event_date=after_date)
+            elif self.rank == after_rank:
+                condition |= Q(event_date=after_date, pk__gt=after_id)
+            queryset = queryset.filter(condition)
+        columns = {
+            "rank": Value(self.rank, output_field=IntegerField()),
+            "object_id": Cast("pk", BigIntegerField()),
+            "date": F("event_date"),
+        }
+        for index in range(3):
+            expression = (
+                self.values[index][1] if index < len(self.values) else Value(None)
+            )
+            columns[f"value{index}"] = Cast(expression, TextField())
+        return queryset.values(**columns)
+
+
+class TimelineEvent:
+    """
+    An event of the timeline, built from a row of the UNION ALL.
+    """
+
+    def __init__(self, row):
+        self.source = TIMELINE_SOURCES[row["rank"]]
+        self.title = self.source.title
+        self.object_id = row["object_id"]
+        self.date = row["date"]
+        self.values = []
+        for index, (label, _, choices) in enumerate(self.source.values):
+            value = row[f"value{index}"]
+            if value is not None:
+                self.values.append((label, dict(choices or ()).get(value, value)))
+        self.url_name = self.source.url_name
+        self.key = (self.date, row["rank"], self.object_id)
+
+
+def text_choices(choices):
+    """
+    Return the choices with their values as text, as read from the UNION ALL.
+    """
+    return [(str(value), label) for value, label in choices]
+
+
+TIMELINE_SOURCES = [
+    TimelineSource(
+        0,
+        "Registration",
+        PatientRegistration,
+        TruncDate("created_at"),
+        [
+            ("Health institution", F("health_institution__name"), None),
+            ("Unit number", F("unit_no1"), None),
+        ],
+        "renaldataregistry:PatientRecordView",
+    ),
+    TimelineSource(
+        1,
+        "KRT modality start",
+        PatientKRTModality,
+        Coalesce("start_date", TruncDate("created_at")),
+        [
+            (
+                "Modality",
+                F("modality"),
+                text_choices(PatientKRTModality.MOD_CHOICES),
+            ),
+            ("HD unit", F("hd_unit__name"), None),
+            ("Current", F("is_current"), [("true", "Yes"), ("false", "No")]),
+        ],
+        "renaldataregistry:PatientModalityDetailView",
+    ),
+    TimelineSource(
+        2,
+        "AKI measurement",
+        PatientAKImeasurement,
+        Coalesce("measurement_date", TruncDate("created_at")),
+        [
+            ("Creatinine", F("creatinine"), None),
+            ("eGFR", F("egfr"), None),
+            ("Hb", F("hb"), None),
+        ],
+        "renaldataregistry:PatientRecordView",
+    ),
+    TimelineSource(
+        3,
+        "Assessment",
+        PatientAssessment,
+        TruncDate("created_at"),
+        [
+            ("Hb g/dl", F("patientlpassessment__hb_gdl"), None),
+            ("Albumin g/l", F("patientlpassessment__albumin"), None),
+            ("Phosphate mmol/l", F("patientlpassessment__phosphate"), None),
+        ],
+        "renaldataregistry:PatientAssessmentDetailView",
+    ),
+    TimelineSource(
+        4,
+        "Stop of dialysis",
+        PatientStop,
+        Coalesce("dod", "last_dialysis_date", TruncDate("created_at")),
+        [
+            ("Reason", F("stop_reason"), PatientStop.ENDREASON_CHOICES),
+            # The cause of death has a default ("D", not one of the choices), it is only shown when the patient
+            # died and a cause was chosen
+            (
+                "Cause of death",
+                Case(
+                    When(
+                        stop_reason="D",
+                        cause_of_death__in=[
+                            cause for cause, _ in PatientStop.DEATHCAUSE_CHOICES
+                        ],
+                        then=F("cause_of_death"),
+                    )
+                ),
+                PatientStop.DEATHCAUSE_CHOICES,
+            ),
+            ("Last dialysis", F("last_dialysis_date"), None),
+        ],
+        "renaldataregistry:PatientStopUpdateView",
+    ),
+]
+
+
+def get_timeline(patient_id, after=None, page_size=TIMELINE_PAGE_SIZE):
+    """
+    Return the events of the patient after the keyset (see encode_cursor) in chronological order, at most page_size,
+    and whether there are more.
+    """
+    first, *others = [
+        source.get_queryset(patient_id, after) for source in TIMELINE_SOURCES
+    ]
+    rows = list(
+        first.union(*others, all=True).order_by("date", "rank", "object_id")[
+            : page_size + 1
+        ]
+    )
+    return [TimelineEvent(row) for row in rows[:page_size]], len(rows) > page_size
+
+
+def encode_cursor(key):
+    """
+    Encode the keyset (date, rank, id) of the last event of a page.
+    """
+    event_date, rank, object_id = key
+    return base64.urlsafe_b64encode(
+        f"{event_date.isoformat()}|{rank}|{object_id}".encode()
+    ).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode the keyset after which the page starts.
+    """
+    if not cursor:
+        return None
+    try:
+        event_date, rank, object_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+        return date.fromisoformat(event_date), int(rank), int(object_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise ValueError("Invalid cursor.") from error
@@ -13,28 +13,53 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.urls import path
 
+from .api import (
+    ApiResourceListView,
+    ApiResourceDetailView,
+    ApiBulkUpsertView,
+    ApiChangeFeedView,
+    ApiPatientLookupView,
+)
+from . import async_views
 from .views import (
     PatientRegistrationListView,
     PatientRegistrationView,
     PatientStopView,
     PatientRegistrationHistoryView,
     PatientView,
+    PatientTimelineView,
     PatientModalityListView,
     PatientModalityView,
     PatientAssessmentListView,
     PatientAssessmentView,
     PatientModalityDetailView,
     PatientAssessmentDetailView,
+    PatientDuplicateListView,
+    PatientDuplicateReviewView,
+    CompletenessDashboardView,
+    RegistryStatisticsView,
+    JobResultView,
 )
 
 app_name = "renaldataregistry"
 
+
+def read_only_view(view_class, async_view):
+    """
+    Return the asynchronous variant of a read-only view with ASYNC_VIEWS, the class-based view otherwise.
+    """
+    return async_view if settings.ASYNC_VIEWS else view_class.as_view()
+
+
 urlpatterns = [
     path(
         "patientregistration/list/",
-        PatientRegistrationListView.as_view(),
+        read_only_view(
+            PatientRegistrationListView, async_views.patient_registration_list
+        ),
         name="PatientRegistrationListView",
     ),
     path(
@@ -49,14 +74,21 @@ urlpatterns = [
     ),
     path(
         "patientregistration/<int:patient_id>/viewhistory/",
-        PatientRegistrationHistoryView.as_view(),
+        read_only_view(
+            PatientRegistrationHistoryView, async_views.patient_registration_history
+        ),
         name="PatientRegistrationHistoryView",
     ),
     path(
         "patient/<pk>/view/",
-        PatientView.as_view(),
+        read_only_view(PatientView, async_views.patient_view),
         name="PatientRecordView",
     ),
+    path(
+        "patient/<int:patient_id>/timeline/",
+        read_only_view(PatientTimelineView, async_views.patient_timeline),
+        name="PatientTimelineView",
+    ),
     path(
         "patientmodality/<int:patient_id>/list/",
         PatientModalityListView.as_view(),
@@ -94,12 +126,69 @@ urlpatterns = [
     ),
     path(
         "patientmodality/<int:modality_id>/view/",
-        PatientModalityDetailView.as_view(),
+        read_only_view(PatientModalityDetailView, async_views.patient_modality_detail),
         name="PatientModalityDetailView",
     ),
     path(
         "patientassessment/<int:assessment_id>/view/",
-        PatientAssessmentDetailView.as_view(),
+        read_only_view(
+            PatientAssessmentDetailView, async_views.patient_assessment_detail
+        ),
         name="PatientAssessmentDetailView",
     ),
+    path(
+        "patientduplicate/list/",
+        PatientDuplicateListView.as_view(),
+        name="PatientDuplicateListView",
+    ),
+    path(
+        "patientduplicate/<int:duplicate_id>/review/",
+        PatientDuplicateReviewView.as_view(),
+        name="PatientDuplicateReviewView",
+    ),
+    path(
+        "completeness/",
+        CompletenessDashboardView.as_view(),
+        name="CompletenessDashboardView",
+    ),
+    path(
+        "statistics/",
+        RegistryStatisticsView.as_view(),
+        name="RegistryStatisticsView",
+    ),
+    path(
+        "job/<int:job_id>/result/",
+        JobResultView.as_view(),
+        name="JobResultView",
+    ),
+    path(
+        "hdunit/options/",
+        async_views.unit_dropdownlist_options,
+        name="unit_dropdownlist_options",
+    ),
+    path(
+        "api/bulk/",
+        ApiBulkUpsertView.as_view(),
+        name="ApiBulkUpsertView",
+    ),
+    path(
+        "api/changes/",
+        ApiChangeFeedView.as_view(),
+        name="ApiChangeFeedView",
+    ),
+    path(
+        "api/patients/lookup/",
+        ApiPatientLookupView.as_view(),
+        name="ApiPatientLookupView",
+    ),
+    path(
+        "api/<str:resource>/",
+        ApiResourceListView.as_view(),
+        name="ApiResourceListView",
+    ),
+    path(
+        "api/<str:resource>/<int:pk>/",
+        ApiResourceDetailView.as_view(),
+        name="ApiResourceDetailView",
+    ),
 ]
@@ -0,0 +1,53 @@
+"""
+This file contains the third-party front-end assets (Bootstrap, Popper, jQuery and Bootstrap-icons) vendored in the
+app's static files, and the check reporting the missing ones.
+"""
+from django.contrib.staticfiles import finders
+from django.core import checks
+
+# (URL, path in renaldataregistry/static, subresource integrity hash when published by the project)
+# The files are committed, the vendorstatic command downloads them again when the pinned versions change.
+VENDOR_ASSETS = [
+    (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css",
+        "vendor/bootstrap/css/bootstrap.min.css",
+        "sha384-1BmE4kWBq78iYhFldvKuhfTAU6auU8tT94WrHftjDbrCEXSU1oBoqyl2QvZ6jIW3",
+    ),
+    (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.min.js",
+        "vendor/bootstrap/js/bootstrap.min.js",
+        "sha384-QJHtvGhmr9XOIpI6YVutG+2QOK9T+ZnN4kzFN1RtK3zEFEIsxhlmWl5/YESvpZ13",
+    ),
+    (
+        "https://cdn.jsdelivr.net/npm/@popperjs/core@2.10.2/dist/umd/popper.min.js",
+        "vendor/popper/popper.min.js",
+        "sha384-7+zCNj/IqJ95wo16oMtfsKbZ9ccEh31eOz1HGyDuCQ6wgnyJNSYdrPa03rtR1zdB",
+    ),
+    (
+        "https://code.jquery.com/jquery-3.7.1.min.js",
+        "vendor/jquery/jquery-3.7.1.min.js",
+        "sha256-/JqT3SQfawRcv/BIHPThkBvs0OEvtFFmqPF/lYI/Cxo=",
+    ),
+    (
+        "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.7.2/bootstrap-icons.svg",
+        "vendor/bootstrap-icons/bootstrap-icons.svg",
+        None,
+    ),
+]
+
+
+@checks.register(checks.Tags.staticfiles)
+def check_vendor_assets(**kwargs):
+    """
+    Report the vendored assets missing from the static files: the pages would load without styles or scripts.
+    """
+    return [
+        checks.Error(
+            f"The vendored asset {path} is missing from the static files.",
+            hint="Run python src/manage.py vendorstatic and commit the downloaded files.",
+            obj=url,
+            id="renaldataregistry.E001",
+        )
+        for url, path, _ in VENDOR_ASSETS
+        if not finders.find(path)
+    ]
@@ -1,13 +1,21 @@
 """
 This file contains the class-based views that take a web request and returns a web response.
 """
+import os
+
+from django.conf import settings
 from django.utils import timezone
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic import ListView, UpdateView, DetailView
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.views import View
+from django.views.generic import ListView, UpdateView, DetailView, TemplateView
 from django.shortcuts import get_object_or_404, render
+from django.http import FileResponse, Http404
 from django.contrib import messages
 from django.shortcuts import redirect
+from django.db import transaction
 from django.db.models import Q
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from renaldataregistry.models import (
     PatientRegistration,
     Patient,
@@ -19,6 +27,9 @@ from renaldataregistry.models import (
     PatientMedicationAssessment,
     PatientStop,
     PatientDialysisAssessment,
+    PatientDuplicate,
+    HealthInstitution,
+    Job,
 )
 from renaldataregistry.forms import (
     PatientRegistrationForm,
@@ -32,11 +43,29 @@ from renaldataregistry.forms import (
     PatientKRTModalityForm,
     PatientAssessmentDialysisForm,
 )
+from renaldataregistry.history import diff_history_rows
+from renaldataregistry.completeness import get_completeness
+from renaldataregistry.comorbidities import get_mask
+from renaldataregistry.snapshots import get_latest_snapshot, get_snapshot_tables
+from renaldataregistry.timeline import decode_cursor, encode_cursor, get_timeline
+from renaldataregistry.merge import MergeError, merge_patients
+from renaldataregistry.prepared import (
+    CURRENT_KRT_MODALITY,
+    CURRENT_KRT_MODALITY_FOR_UPDATE,
+    FIRST_KRT_MODALITY,
+    FORM_ASSESSMENT,
+)
+from renaldataregistry.etags import (
+    patient_view_etag,
+    patient_modality_detail_etag,
+    patient_assessment_detail_etag,
+)
 
 
 # pylint: disable=too-many-statements, too-many-boolean-expressions, too-many-branches, too-many-lines
 
 
+@method_decorator(condition(etag_func=patient_view_etag), name="get")
 class PatientView(LoginRequiredMixin, DetailView):
     """
     View a single patient's registration form details, related to the models:
@@ -68,9 +97,7 @@ class PatientView(LoginRequiredMixin, DetailView):
             context["patient_krtmodalities"] = patient_krtmodalities
 
         # assessment
-        patient_assessement = PatientAssessment.objects.filter(
-            patient=patient, created_at=patient.created_at
-        ).first()
+        patient_assessement = FORM_ASSESSMENT.get(patient, patient.created_at)
 
         if patient_assessement:
             context["patient_assessement"] = patient_assessement
@@ -86,6 +113,53 @@ class PatientView(LoginRequiredMixin, DetailView):
         return context
 
 
+class PatientTimelineView(LoginRequiredMixin, TemplateView):
+    """
+    View a patient's registration, KRT modality starts, AKI measurements, assessments and stop of dialysis
+    in chronological order, paginated with a cursor (the last event of the previous page).
+    """
+
+    template_name = "patient_timeline.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        patient = get_object_or_404(Patient, id=self.kwargs["patient_id"])
+        try:
+            after = decode_cursor(self.request.GET.get("cursor"))
+        except ValueError as error:
+            raise Http404("Invalid cursor.") from error
+        events, has_more = get_timeline(patient.id, after)
+        context["patient"] = patient
+        context["events"] = events
+        context["is_first_page"] = after is None
+        if has_more:
+            context["next_cursor"] = encode_cursor(events[-1].key)
+        return context
+
+
+def search_patientregistrations(search_word=None):
+    """
+    Return the patient registrations matching the search word (N.I.C or passport number, name, surname, health
+    institution or unit number), or all of them, ordered by the patient's name.
+    """
+    if search_word:
+        return PatientRegistration.objects.filter(
+            Q(health_institution__name__icontains=search_word)
+            | Q(patient__name__icontains=search_word)
+            | Q(patient__surname__icontains=search_word)
+            | Q(patient__pid__icontains=search_word)
+            | Q(unit_no1__icontains=search_word)
+            | Q(unit_no2__icontains=search_word)
+            | Q(unit_no3__icontains=search_word)
+        ).order_by("patient__name")
+
+    return (
+        PatientRegistration.objects.prefetch_related("patient")
+        .all()
+        .order_by("patient__name")
+    )
+
+
 class PatientRegistrationListView(LoginRequiredMixin, ListView):
     """
     List all registered patients, related to the model renaldataregistry.PatientRegistration.
@@ -107,26 +181,9 @@ class PatientRegistrationListView(LoginRequiredMixin, ListView):
         except KeyError:
             search_word = None
 
-        if search_word:
-            result_patients = PatientRegistration.objects.filter(
-                Q(health_institution__name__icontains=search_word)
-                | Q(patient__name__icontains=search_word)
-                | Q(patient__surname__icontains=search_word)
-                | Q(patient__pid__icontains=search_word)
-                | Q(unit_no1__icontains=search_word)
-                | Q(unit_no2__icontains=search_word)
-                | Q(unit_no3__icontains=search_word)
-            ).order_by("patient__name")
-            self.count = result_patients.count()
-            return result_patients
-
-        all_patientregistrations = (
-            PatientRegistration.objects.prefetch_related("patient")
-            .all()
-            .order_by("patient__name")
-        )
-        self.count = all_patientregistrations.count()
-        return all_patientregistrations
+        patientregistrations = search_patientregistrations(search_word)
+        self.count = patientregistrations.count()
+        return patientregistrations
 
     def get_context_data(self, **kwargs):
         """
@@ -280,9 +337,7 @@ class PatientRegistrationView(LoginRequiredMixin, UpdateView):
                 patientakimeasurement_form = PatientAKIMeasurementForm()
 
             # Choosing only the one created in the registration form (if exists) since more assessments can be added in the Assessment form view
-            patient_assessement = PatientAssessment.objects.filter(
-                patient=patient, created_at=patient.created_at
-            ).first()
+            patient_assessement = FORM_ASSESSMENT.get(patient, patient.created_at)
             try:
                 patientassessment_form = PatientAssessmentForm(
                     instance=patient_assessement
@@ -448,9 +503,7 @@ class PatientRegistrationView(LoginRequiredMixin, UpdateView):
                 patientakimeasurement_form = PatientAKIMeasurementForm(request.POST)
 
             # Choosing only the one created in the registration form (if exists) since more assessments can be added in the Assessment form view
-            patient_assessement = PatientAssessment.objects.filter(
-                patient=patient, created_at=patient.created_at
-            ).first()
+            patient_assessement = FORM_ASSESSMENT.get(patient, patient.created_at)
 
             try:
                 patientassessment_form = PatientAssessmentForm(
@@ -600,12 +653,12 @@ class PatientRegistrationView(LoginRequiredMixin, UpdateView):
                 for item in ["modality", "start_date", "hd_unit"]
             ):
                 # if there is any current krt modality, set this to false since the new one is the current one now
-                patient_current_krtmodality = PatientKRTModality.objects.filter(
-                    patient=patient, is_current=True
-                ).first()
+                patient_current_krtmodality = CURRENT_KRT_MODALITY.get(patient)
                 if patient_current_krtmodality:
                     patient_current_krtmodality.is_current = False
-                    patient_current_krtmodality.save(update_fields=["is_current"])
+                    patient_current_krtmodality.save(
+                        update_fields=["is_current", "updated_at"]
+                    )
                 # new current krt modality
                 patientkrtmodality_present = patientkrtmodality_present_form.save(
                     commit=False
@@ -689,6 +742,7 @@ class PatientModalityListView(LoginRequiredMixin, ListView):
         return all_patientkrtmodalities
 
 
+@method_decorator(condition(etag_func=patient_modality_detail_etag), name="get")
 class PatientModalityDetailView(LoginRequiredMixin, DetailView):
     """
     View a patient's modality form details, related to the models:
@@ -712,9 +766,7 @@ class PatientModalityDetailView(LoginRequiredMixin, DetailView):
         patientakimeasurement = PatientAKImeasurement.objects.filter(
             patient=patient, created_at=patientmodality.created_at
         ).first()
-        patient_assessement = PatientAssessment.objects.filter(
-            patient=patient, created_at=patientmodality.created_at
-        ).first()
+        patient_assessement = FORM_ASSESSMENT.get(patient, patientmodality.created_at)
         previouspatientmodality = (
             PatientKRTModality.objects.filter(
                 patient=patient, start_date__lt=patientmodality.start_date
@@ -723,11 +775,7 @@ class PatientModalityDetailView(LoginRequiredMixin, DetailView):
             .first()
         )
         # checking if this is the first KRT modality
-        patient_first_krtmodality = (
-            PatientKRTModality.objects.filter(patient=patient)
-            .order_by("start_date")[:1]
-            .first()
-        )
+        patient_first_krtmodality = FIRST_KRT_MODALITY.get(patient)
         if patientmodality == patient_first_krtmodality:
             is_first_modality = "Yes"
 
@@ -791,11 +839,7 @@ class PatientModalityView(LoginRequiredMixin, UpdateView):
                 patient = modality.patient
 
                 # patient's first KRT modality
-                patient_first_krtmodality = (
-                    PatientKRTModality.objects.filter(patient=patient)
-                    .order_by("start_date")[:1]
-                    .first()
-                )
+                patient_first_krtmodality = FIRST_KRT_MODALITY.get(patient)
                 if modality == patient_first_krtmodality:
                     krt_is_first = True
 
@@ -810,9 +854,7 @@ class PatientModalityView(LoginRequiredMixin, UpdateView):
                     patientakimeasurement_form = PatientAKIMeasurementForm()
 
                 # The patient assessment linked to the KRT modality form
-                patient_assessement = PatientAssessment.objects.filter(
-                    patient=patient, created_at=modality.created_at
-                ).first()
+                patient_assessement = FORM_ASSESSMENT.get(patient, modality.created_at)
                 try:
                     patientassessment_form = PatientAssessmentForm(
                         instance=patient_assessement
@@ -870,9 +912,7 @@ class PatientModalityView(LoginRequiredMixin, UpdateView):
                     first_aki = True
 
                 # The patient assessment linked to the KRT modality form
-                patient_assessement = PatientAssessment.objects.filter(
-                    patient=patient, created_at=modality.created_at
-                ).first()
+                patient_assessement = FORM_ASSESSMENT.get(patient, modality.created_at)
                 if not patient_assessement:
                     first_assess_for_krt = True
                 try:
@@ -890,9 +930,7 @@ class PatientModalityView(LoginRequiredMixin, UpdateView):
                 # Creation of new current KRT modality
                 # Existing current KRT modality becomes part of the chronology
                 # Note. This means that the registration form included a current krt modality
-                patient_current_krtmodality = PatientKRTModality.objects.filter(
-                    patient=patient, is_current=True
-                ).first()
+                patient_current_krtmodality = CURRENT_KRT_MODALITY.get(patient)
                 if patient_current_krtmodality:
                     patient_current_krtmodality.is_current = False
                     patient_current_krtmodality.save()
@@ -998,15 +1036,17 @@ class PatientAssessmentListView(LoginRequiredMixin, ListView):
         if patient_id:
             patient = get_object_or_404(Patient, id=patient_id)
 
-            patient_current_krtmodality = PatientKRTModality.objects.filter(
-                patient=patient, is_current=True
-            ).first()
+            patient_current_krtmodality = CURRENT_KRT_MODALITY.get(patient)
 
             # Showing only dialysis assessments in this view
             # created_at__gt=patient.created_at ignores the initial assessment created in the registration form (if exists)
-            all_patientassessments = PatientAssessment.objects.filter(
-                patient=patient_id, created_at__gt=patient.created_at
-            ).order_by("created_at")
+            all_patientassessments = (
+                PatientAssessment.objects.filter(
+                    patient=patient_id, created_at__gt=patient.created_at
+                )
+                .prefetch_related("comorbidity", "disability")
+                .order_by("created_at")
+            )
 
             if patient_current_krtmodality:
                 # KRT modes 2, 3
@@ -1021,6 +1061,7 @@ class PatientAssessmentListView(LoginRequiredMixin, ListView):
         return context
 
 
+@method_decorator(condition(etag_func=patient_assessment_detail_etag), name="get")
 class PatientAssessmentDetailView(LoginRequiredMixin, DetailView):
     """
     View a patient's dialysis assessment form details, related to the models:
@@ -1041,16 +1082,10 @@ class PatientAssessmentDetailView(LoginRequiredMixin, DetailView):
         patientassesment = get_object_or_404(PatientAssessment, pk=assessment_id)
         patient = patientassesment.patient
 
-        patient_current_krtmodality = PatientKRTModality.objects.filter(
-            patient=patient, is_current=True
-        ).first()
+        patient_current_krtmodality = CURRENT_KRT_MODALITY.get(patient)
 
         # patient's first KRT modality
-        patient_first_krtmodality = (
-            PatientKRTModality.objects.filter(patient=patient)
-            .order_by("start_date")[:1]
-            .first()
-        )
+        patient_first_krtmodality = FIRST_KRT_MODALITY.get(patient)
 
         # HD, modality 2
         # PD, modality 3
@@ -1106,9 +1141,7 @@ class PatientAssessmentView(LoginRequiredMixin, UpdateView):
             # There are assessments parameters linked to the current KRT modality. They depend on HD or PD.
             # Example, Sessions/week or Mins/session for HD modality
             # Exchanges/day or Fluid litres/day for PD modality
-            patient_current_krtmodality = PatientKRTModality.objects.filter(
-                patient=patient, is_current=True
-            ).first()
+            patient_current_krtmodality = CURRENT_KRT_MODALITY.get(patient)
             patientkrtmodality_form = PatientKRTModalityForm(
                 instance=patient_current_krtmodality
             )
@@ -1124,9 +1157,7 @@ class PatientAssessmentView(LoginRequiredMixin, UpdateView):
 
                 patientassessment_form = PatientAssessmentForm(instance=assessment)
 
-                patient_current_krtmodality = PatientKRTModality.objects.filter(
-                    patient=patient, is_current=True
-                ).first()
+                patient_current_krtmodality = CURRENT_KRT_MODALITY.get(patient)
                 patientkrtmodality_form = PatientKRTModalityForm(
                     instance=patient_current_krtmodality
                 )
@@ -1165,6 +1196,8 @@ class PatientAssessmentView(LoginRequiredMixin, UpdateView):
     def post(self, request, *args, **kwargs):
         """
         Handle data validation and persistence for the creation and edition of the patient's dialysis assessment form.
+        The forms are validated and saved in one transaction, with the current KRT modality locked until it commits,
+        so the HD fields saved with the assessment are not overwritten by a concurrent change of modality.
         """
         try:
             assessment_id = kwargs["assessment_id"]
@@ -1179,110 +1212,93 @@ class PatientAssessmentView(LoginRequiredMixin, UpdateView):
         if patient_id:
             # Adding new assessment
             patient = get_object_or_404(Patient, id=patient_id)
+            assessment = None
+        else:
+            # Edit existing assessment, loaded with its patient and sub-records in one query
+            assessment = get_object_or_404(
+                PatientAssessment.objects.select_related(
+                    "patient",
+                    "patientlpassessment",
+                    "patientmedicationassessment",
+                    "patientdialysisassessment",
+                ),
+                id=assessment_id,
+            )
+            patient = assessment.patient
 
-            patient_current_krtmodality = PatientKRTModality.objects.filter(
-                patient=patient, is_current=True
-            ).first()
+        with transaction.atomic():
+            patient_current_krtmodality = CURRENT_KRT_MODALITY_FOR_UPDATE.get(patient)
 
             # existing patient KRT modality (dialysis modality)
             patientkrtmodality_form = PatientKRTModalityForm(
                 request.POST, instance=patient_current_krtmodality
             )
-            patientassessmentlp_form = PatientAssessmentLPForm(request.POST)
-            patientassessmentmed_form = PatientAssessmentMedicationForm(request.POST)
-            patientassessment_form = PatientAssessmentForm(request.POST)
-            patientassessmentdia_form = PatientAssessmentDialysisForm(request.POST)
-        else:
-            if assessment_id:
-                # Edit existing assessment
-                assessment = get_object_or_404(PatientAssessment, id=assessment_id)
-                patient = assessment.patient
-
-                patientassessment_form = PatientAssessmentForm(
-                    request.POST, instance=assessment
-                )
-
-                patient_current_krtmodality = PatientKRTModality.objects.filter(
-                    patient=patient, is_current=True
-                ).first()
-                patientkrtmodality_form = PatientKRTModalityForm(
-                    request.POST, instance=patient_current_krtmodality
-                )
-
-                try:
-                    patientassessmentlp_form = PatientAssessmentLPForm(
-                        request.POST, instance=assessment.patientlpassessment
-                    )
-                except PatientLPAssessment.DoesNotExist:
-                    patientassessmentlp_form = PatientAssessmentLPForm(request.POST)
-
-                try:
-                    patientassessmentmed_form = PatientAssessmentMedicationForm(
-                        request.POST, instance=assessment.patientmedicationassessment
-                    )
-                except PatientMedicationAssessment.DoesNotExist:
-                    patientassessmentmed_form = PatientAssessmentMedicationForm(
-                        request.POST
-                    )
-
-                try:
-                    patientassessmentdia_form = PatientAssessmentDialysisForm(
-                        request.POST, instance=assessment.patientdialysisassessment
-                    )
-                except PatientDialysisAssessment.DoesNotExist:
-                    patientassessmentdia_form = PatientAssessmentDialysisForm(
-                        request.POST
+            patientassessment_form = PatientAssessmentForm(
+                request.POST, instance=assessment
+            )
+            patientassessmentlp_form = PatientAssessmentLPForm(
+                request.POST,
+                instance=getattr(assessment, "patientlpassessment", None),
+            )
+            patientassessmentmed_form = PatientAssessmentMedicationForm(
+                request.POST,
+                instance=getattr(assessment, "patientmedicationassessment", None),
+            )
+            patientassessmentdia_form = PatientAssessmentDialysisForm(
+                request.POST,
+                instance=getattr(assessment, "patientdialysisassessment", None),
+            )
+            forms_valid = (
+                patientkrtmodality_form.is_valid()
+                and patientassessmentlp_form.is_valid()
+                and patientassessmentmed_form.is_valid()
+                and patientassessment_form.is_valid()
+                and patientassessmentdia_form.is_valid()
+            )
+            if forms_valid:
+                # The KRT modality already exists, update correspondant fields for HD modality
+                # modality 2, HD
+                if patient_current_krtmodality.modality == 2:
+                    patient_current_krtmodality.save(
+                        update_fields=[
+                            "hd_unit",
+                            "hd_initialaccess",
+                            "hd_tc_ntc_reason",
+                        ]
                     )
-        if (
-            patientkrtmodality_form.is_valid()
-            and patientassessmentlp_form.is_valid()
-            and patientassessmentmed_form.is_valid()
-            and patientassessment_form.is_valid()
-            and patientassessmentdia_form.is_valid()
-        ):
-            if patient_id:
-                # fot the creation of a new assessment
-                creation_date = timezone.now()
 
-            # The KRT modality already exists, update correspondant fields for HD modality
-            # modality 2, HD
-            if patient_current_krtmodality.modality == 2:
-                patient_current_krtmodality.save(
-                    update_fields=["hd_unit", "hd_initialaccess", "hd_tc_ntc_reason"]
+                patientassessment = patientassessment_form.save(commit=False)
+                patientassessment.patient = patient
+                if patient_id:
+                    # creating a new assessment
+                    patientassessment.created_at = timezone.now()
+                patientassessment.comorbidity_mask = get_mask(
+                    patientassessment_form.cleaned_data["comorbidity"]
                 )
-
-            patientassessment = patientassessment_form.save(commit=False)
-            patientassessment.patient = patient
-            if patient_id:
-                # creating a new assessment
-                patientassessment.created_at = creation_date
-            patientassessment.save()
-            patientassessment_form.save_m2m()
-
-            if patientassessmentlp_form.has_changed():
-                patientassessmentlp = patientassessmentlp_form.save(commit=False)
-                patientassessmentlp.patientassessment = patientassessment
-                patientassessmentlp.save()
-
-            if patientassessmentmed_form.has_changed():
-                patientassessmentmed = patientassessmentmed_form.save(commit=False)
-                patientassessmentmed.patientassessment = patientassessment
-                patientassessmentmed.save()
-
-            if patientassessmentdia_form.has_changed():
-                patientassessmentdia = patientassessmentdia_form.save(commit=False)
-                patientassessmentdia.patientassessment = patientassessment
-                patientassessmentdia.save()
+                patientassessment.save()
+                patientassessment_form.save_m2m_in_bulk()
+
+                # The sub-records are inserted without the UPDATE that save() tries first for a primary key set.
+                # A sub-form built without an existing sub-record has no primary key (the assessment) yet
+                for sub_form in (
+                    patientassessmentlp_form,
+                    patientassessmentmed_form,
+                    patientassessmentdia_form,
+                ):
+                    if sub_form.has_changed():
+                        sub_record = sub_form.save(commit=False)
+                        created = sub_record.pk is None
+                        sub_record.patientassessment = patientassessment
+                        sub_record.save(force_insert=created)
+
+        if forms_valid:
             messages.success(
                 self.request,
                 "Completed.",
                 extra_tags="alert",
             )
-
-            if not patient_id:
-                patient_id = patient.id
             return redirect(
-                "renaldataregistry:PatientAssessmentListView", patient_id=patient_id
+                "renaldataregistry:PatientAssessmentListView", patient_id=patient.id
             )
         messages.error(
             self.request,
@@ -1327,9 +1343,7 @@ class PatientStopView(LoginRequiredMixin, UpdateView):
             patientstop_form = PatientStopForm(instance=patient.patientstop)
             patient_current_krt_is_dialysis = True
         except PatientStop.DoesNotExist:
-            patient_current_krtmodality = PatientKRTModality.objects.filter(
-                patient=patient, is_current=True
-            ).first()
+            patient_current_krtmodality = CURRENT_KRT_MODALITY.get(patient)
             # check if patient is in dialysis mode (HD or PD)
             if patient_current_krtmodality.modality in (2, 3):
                 patient_current_krt_is_dialysis = True
@@ -1372,12 +1386,12 @@ class PatientStopView(LoginRequiredMixin, UpdateView):
                 patientstop.patient = patient
                 patientstop.save()
 
-                patient_current_krtmodality = PatientKRTModality.objects.filter(
-                    patient=patient, is_current=True
-                ).first()
+                patient_current_krtmodality = CURRENT_KRT_MODALITY.get(patient)
                 if patient_current_krtmodality:
                     patient_current_krtmodality.is_current = False
-                    patient_current_krtmodality.save(update_fields=["is_current"])
+                    patient_current_krtmodality.save(
+                        update_fields=["is_current", "updated_at"]
+                    )
 
             messages.success(
                 self.request,
@@ -1397,26 +1411,179 @@ class PatientStopView(LoginRequiredMixin, UpdateView):
         )
 
 
-class PatientRegistrationHistoryView(LoginRequiredMixin, DetailView):
+class PatientRegistrationHistoryView(LoginRequiredMixin, ListView):
     """
     View a patient's registration history, related to the models:
     renaldataregistry.Patient
     renaldataregistry.PatientRegistration
     """
 
-    def get(self, request, *args, **kwargs):
+    paginate_by = 15
+    template_name = "patientregistration_history.html"
+    context_object_name = "patientregistration_history"
+    patientregistration = None
+
+    def get_queryset(self):
         """
-        Present page to list history of health institutions were the patient has been registered.
+        Get the history of health institutions were the patient has been registered, newest first.
+        The lookup uses the (patient_id, history_date) index of the historical table.
         """
         try:
-            patient_id = kwargs["patient_id"]
+            patient_id = self.kwargs["patient_id"]
         except KeyError:
             patient_id = None
 
-        patientregistration = get_object_or_404(PatientRegistration, pk=patient_id)
+        self.patientregistration = get_object_or_404(PatientRegistration, pk=patient_id)
+        return (
+            PatientRegistration.history.filter(  # pylint: disable=no-member
+                patient_id=patient_id
+            )
+            .select_related("health_institution")
+            .order_by("-history_date", "-history_id")
+        )
 
-        return render(
-            request,
-            "patientregistration_history.html",
-            context={"patientregistration": patientregistration},
+    def get_context_data(self, **kwargs):
+        """
+        Add the fields changed between consecutive versions of the registration.
+        """
+        context = super().get_context_data(**kwargs)
+        history_rows = list(context["object_list"])
+        previous_row = None
+        if history_rows:
+            # The version preceding the oldest one of the page, to compare it too
+            oldest_row = history_rows[-1]
+            previous_row = self.object_list.filter(
+                Q(history_date__lt=oldest_row.history_date)
+                | Q(
+                    history_date=oldest_row.history_date,
+                    history_id__lt=oldest_row.history_id,
+                )
+            ).first()
+        context["patientregistration"] = self.patientregistration
+        context["patientregistration_history"] = diff_history_rows(
+            history_rows, previous_row
+        )
+        return context
+
+
+class PatientDuplicateListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+    """
+    List the pairs of patients that may be duplicates (found by the findduplicates command), most similar first,
+    for superusers to merge them or mark them as not duplicates.
+    """
+
+    paginate_by = 15
+    template_name = "patientduplicate_list.html"
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def get_queryset(self):
+        return (
+            PatientDuplicate.objects.filter(status="P")
+            .select_related(
+                "patient1__patientregistration__health_institution",
+                "patient2__patientregistration__health_institution",
+            )
+            .order_by("-score", "pk")
         )
+
+
+class PatientDuplicateReviewView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Merge a pair of duplicate patients, keeping the one chosen, or mark them as not duplicates.
+    """
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def post(self, request, *args, **kwargs):
+        """
+        Apply the review action (not_duplicates, keep1 or keep2) to a pending pair of patients.
+        """
+        patientduplicate = get_object_or_404(
+            PatientDuplicate.objects.select_related("patient1", "patient2"),
+            pk=kwargs["duplicate_id"],
+            status="P",
+        )
+        action = request.POST.get("action")
+        if action == "not_duplicates":
+            patientduplicate.status = "N"
+            patientduplicate.updated_by = request.user
+            patientduplicate.save(update_fields=["status", "updated_by", "updated_at"])
+            messages.success(request, "The patients were marked as not duplicates.")
+        elif action in ("keep1", "keep2"):
+            patient, duplicate = patientduplicate.patient1, patientduplicate.patient2
+            if action == "keep2":
+                patient, duplicate = duplicate, patient
+            try:
+                merge_patients(patient, duplicate, request.user)
+            except MergeError as error:
+                messages.error(request, str(error))
+            else:
+                messages.success(
+                    request,
+                    f"Patient {duplicate.pid} was merged into patient {patient.pid}.",
+                )
+        return redirect("renaldataregistry:PatientDuplicateListView")
+
+
+class CompletenessDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    """
+    Show the percentage of missing values of the optional fields per health institution and form section,
+    for superusers to chase the incomplete submissions.
+    """
+
+    template_name = "completeness_dashboard.html"
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        institution_names = dict(
+            HealthInstitution.objects.order_by("name").values_list("id", "name")
+        )
+        institution_names[None] = "Not registered"
+        context["sections"] = get_completeness(institution_names)
+        return context
+
+
+class RegistryStatisticsView(LoginRequiredMixin, TemplateView):
+    """
+    Show the registry statistics of the latest completed snapshot (see the snapshotstatistics command),
+    so the page does not compute them at request time.
+    """
+
+    template_name = "registry_statistics.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["snapshot"] = get_latest_snapshot()
+        if context["snapshot"]:
+            context.update(get_snapshot_tables(context["snapshot"]))
+        return context
+
+
+class JobResultView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Download the result file of a background job.
+    """
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return the result file of the job as an attachment.
+        """
+        job = get_object_or_404(Job, pk=kwargs["job_id"])
+        if not job.result_file:
+            raise Http404("The job has no result file.")
+        try:
+            result_file = open(  # pylint: disable=consider-using-with
+                os.path.join(settings.JOB_RESULTS_DIR, job.result_file), "rb"
+            )
+        except FileNotFoundError as error:
+            raise Http404("The result file was deleted.") from error
+        return FileResponse(result_file, as_attachment=True, filename=job.result_file)
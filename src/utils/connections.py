@@ -0,0 +1,22 @@
+"""
+This file contains the health check of the persistent database connections (CONN_MAX_AGE).
+"""
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+
+@receiver(request_started)
+def check_persistent_connections(**kwargs):
+    """
+    Close, at the start of a request, the persistent connections that were broken while idle (e.g. the database
+    or pgbouncer restarted) when their CONN_HEALTH_CHECKS setting is true, so the request opens a new connection
+    instead of failing on the broken one. Django only closes the connections that reported an error.
+    """
+    for connection in connections.all():
+        if (
+            connection.settings_dict.get("CONN_HEALTH_CHECKS")
+            and connection.connection is not None
+            and not connection.is_usable()
+        ):
+            connection.close()
@@ -0,0 +1,60 @@
+"""
+This file contains the middleware compressing the responses.
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, responses are compressed with gzip without it
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses with brotli when the browser accepts it and the brotli package is installed,
+    otherwise with gzip (as GZipMiddleware). Streaming responses are compressed with gzip.
+    The responses to requests with query parameters other than COMPRESSION_SAFE_PARAMETERS (e.g. the search
+    keyword of the patient list) are not compressed: a page reflecting input chosen by an attacker next to
+    secrets (the patients' data) would let the attacker guess them from the compressed size (BREACH).
+    """
+
+    @staticmethod
+    def reflects_input(request):
+        """
+        Check if the response may reflect query parameters chosen by another site.
+        """
+        return any(
+            name not in settings.COMPRESSION_SAFE_PARAMETERS for name in request.GET
+        )
+
+    def process_response(self, request, response):
+        if self.reflects_input(request):
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or len(response.content) < 200
+            or response.has_header("Content-Encoding")
+            or not re_accepts_brotli.search(
+                request.META.get("HTTP_ACCEPT_ENCODING", "")
+            )
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed_content = brotli.compress(response.content)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers["Content-Length"] = str(len(response.content))
+        # A strong ETag is made weak as the content is transformed (see GZipMiddleware)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
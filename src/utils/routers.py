@@ -0,0 +1,145 @@
+"""
+This file contains the database router sending the read queries of the registry to the read replica, when one
+is configured (see the replica database in settings.py), and the middleware choosing the requests using it.
+"""
+import asyncio
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+# Only the registry's records are read from the replica: the sessions and users are read right after
+# they are written (e.g. at login), the replication lag would log users out
+REPLICA_APP_LABELS = {"renaldataregistry"}
+REPLICA_PIN_COOKIE = "use_primary"
+
+# Routing of the current request or command (asgiref's Local follows the async views across threads)
+routing_state = Local()
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """
+    Read the registry's records from the replica (when configured) in the block, until a record is written.
+    The reports and exports (e.g. the dataquality and changefeed commands) use it.
+    """
+    previous = (
+        getattr(routing_state, "use_replica", False),
+        getattr(routing_state, "written", False),
+    )
+    routing_state.use_replica = enabled
+    routing_state.written = False
+    try:
+        yield
+    finally:
+        routing_state.use_replica, routing_state.written = previous
+
+
+def has_written():
+    """
+    Return whether a record was written in the current use_replica block.
+    """
+    return getattr(routing_state, "written", False)
+
+
+class ReplicaRouter:
+    """
+    Send the reads of the registry's records to the replica in use_replica blocks. Writes go to the primary
+    and, so that a request reads what it wrote, the reads following a write and the reads in a transaction
+    go to the primary too.
+    """
+
+    @staticmethod
+    def db_for_read(model, **_hints):
+        """
+        Return the replica for the registry's records in a use_replica block before any write, the primary
+        otherwise.
+        """
+        if (
+            getattr(routing_state, "use_replica", False)
+            and not getattr(routing_state, "written", False)
+            and model._meta.app_label in REPLICA_APP_LABELS
+            and REPLICA_DB_ALIAS in settings.DATABASES
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    @staticmethod
+    def db_for_write(*_args, **_hints):
+        """
+        Return the primary, and send the following reads of the use_replica block to the primary.
+        """
+        routing_state.written = True
+        return DEFAULT_DB_ALIAS
+
+    @staticmethod
+    def allow_relation(*_args, **_hints):
+        """
+        Allow all relations: the replica has the same data as the primary.
+        """
+        return True
+
+    @staticmethod
+    def allow_migrate(database, *_args, **_hints):
+        """
+        Only migrate the primary: the replica is migrated by the replication.
+        """
+        return database == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """
+    Read from the replica in the GET and HEAD requests (lists, details, exports, reports), the data entry
+    (POST) reads from the primary. After a request wrote, the browser reads from the primary for
+    DATABASE_REPLICA_PIN_SECONDS seconds, so that it sees its changes despite the replication lag
+    (e.g. the redirect after a form is saved).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Under ASGI the middleware is a coroutine, so the async views do not run in a thread (as MiddlewareMixin)
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with use_replica(self.is_replica_request(request)):
+            response = self.get_response(request)
+            self.pin_primary(response)
+        return response
+
+    async def __acall__(self, request):
+        with use_replica(self.is_replica_request(request)):
+            response = await self.get_response(request)
+            self.pin_primary(response)
+        return response
+
+    @staticmethod
+    def is_replica_request(request):
+        """
+        Return whether the request reads from the replica.
+        """
+        return request.method in ("GET", "HEAD") and not request.COOKIES.get(
+            REPLICA_PIN_COOKIE
+        )
+
+    @staticmethod
+    def pin_primary(response):
+        """
+        Make the browser read from the primary when the request wrote.
+        """
+        if has_written() and REPLICA_DB_ALIAS in settings.DATABASES:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE,
+                "1",
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
@@ -0,0 +1,157 @@
+"""
+This file contains the rule engine of the data validation: every rule checks the values of a form (or a record)
+and gives the SQL condition of the stored rows breaking it, so the same rules validate the forms and the
+whole tables (see renaldataregistry/dataquality.py).
+"""
+import re
+from abc import ABC, abstractmethod
+from datetime import date
+
+from django.db.models import Q
+
+
+class Rule(ABC):
+    """
+    Define a validation rule of a field, with the error message given when the rule is broken.
+    """
+
+    def __init__(self, name, field, message):
+        self.name = name
+        self.field = field
+        self.message = message
+
+    @abstractmethod
+    def is_broken(self, data, current_date):
+        """
+        Return whether the values of data (e.g. a form's cleaned_data) break the rule.
+        """
+
+    @abstractmethod
+    def get_condition(self, current_date):
+        """
+        Return the condition (Q) of the stored rows breaking the rule.
+        """
+
+    def get_message(self, data, current_date):
+        """
+        Return the error message, formatted with the value and the current date when it has placeholders.
+        """
+        value = data.get(self.field)
+        return self.message.format(
+            value=value.strftime("%d/%m/%Y") if isinstance(value, date) else value,
+            current_date=current_date.strftime("%d/%m/%Y"),
+        )
+
+
+class PatternRule(Rule):
+    """
+    The value must match a regular expression, when the other fields have the values of when
+    (e.g. the N.I.C pattern applies when the identifier type is N.I.C).
+    The pattern is used by Python and PostgreSQL, so it must only use the syntax they share.
+    """
+
+    def __init__(self, name, field, message, pattern, when=None):
+        super().__init__(name, field, message)
+        self.pattern = pattern
+        self.when = when or {}
+
+    def is_broken(self, data, current_date):
+        value = data.get(self.field)
+        if value is None:
+            return False
+        if any(data.get(field) != expected for field, expected in self.when.items()):
+            return False
+        return not self.pattern.match(value)
+
+    def get_condition(self, current_date):
+        # re.match only matches at the start of the value
+        regex = self.pattern.pattern
+        if not regex.startswith("^"):
+            regex = "^" + regex
+        lookup = "iregex" if self.pattern.flags & re.IGNORECASE else "regex"
+        return Q(**self.when, **{f"{self.field}__isnull": False}) & ~Q(
+            **{f"{self.field}__{lookup}": regex}
+        )
+
+
+class RangeRule(Rule):
+    """
+    The value must be between minimum and maximum (both included), with at most decimal_places decimals.
+    """
+
+    def __init__(
+        self, name, field, message, minimum, maximum, decimal_places=None
+    ):  # pylint: disable=too-many-arguments
+        super().__init__(name, field, message)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decimal_places = decimal_places
+
+    def is_broken(self, data, current_date):
+        value = data.get(self.field)
+        if value is None:
+            return False
+        return (
+            value < self.minimum
+            or value > self.maximum
+            or (
+                self.decimal_places is not None
+                and round(value, self.decimal_places) != value
+            )
+        )
+
+    def get_condition(self, current_date):
+        # The decimal places are enforced by the columns (DecimalField)
+        return Q(**{f"{self.field}__lt": self.minimum}) | Q(
+            **{f"{self.field}__gt": self.maximum}
+        )
+
+
+class NotAfterTodayRule(Rule):
+    """
+    The date cannot be after the current date.
+    """
+
+    def is_broken(self, data, current_date):
+        value = data.get(self.field)
+        return value is not None and value > current_date
+
+    def get_condition(self, current_date):
+        return Q(**{f"{self.field}__gt": current_date})
+
+
+class RequiredWhenRule(Rule):
+    """
+    At least one of the fields must have a value when the lookup (e.g. health_institution__is_unit_required)
+    is true.
+    """
+
+    def __init__(self, name, fields, message, when):
+        super().__init__(name, fields[0], message)
+        self.fields = fields
+        self.when = when
+
+    def is_broken(self, data, current_date):
+        field, *attributes = self.when.split("__")
+        value = data.get(field)
+        for attribute in attributes:
+            value = getattr(value, attribute, None)
+        return bool(value) and not any(data.get(field) for field in self.fields)
+
+    def get_condition(self, current_date):
+        condition = Q(**{self.when: True})
+        for field in self.fields:
+            condition &= Q(**{f"{field}__isnull": True}) | Q(**{field: ""})
+        return condition
+
+
+def check_rules(rules, data, current_date=None):
+    """
+    Return the error messages of the rules broken by the values of data.
+    """
+    current_date = current_date or date.today()
+    return [
+        rule.get_message(data, current_date)
+        for rule in rules
+        if rule.is_broken(data, current_date)
+    ]
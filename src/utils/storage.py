@@ -0,0 +1,53 @@
+"""
+This file contains the storage of the collected static files.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, only gzip variants are written without it
+    brotli = None
+
+# Types of files worth compressing (images and fonts are already compressed)
+COMPRESSED_EXTENSIONS = (".css", ".js", ".svg", ".map", ".json", ".txt")
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Store static files with hashed names (cached forever by the browsers) and write gzip (and brotli)
+    variants next to them, served by nginx without compressing on every request.
+    """
+
+    def post_process(self, *args, **kwargs):
+        dry_run = kwargs.get("dry_run", False)
+        processed_files = []
+        for name, hashed_name, processed in super().post_process(*args, **kwargs):
+            yield name, hashed_name, processed
+            if not dry_run and hashed_name and not isinstance(processed, Exception):
+                processed_files.extend([name, hashed_name])
+        if dry_run:
+            return
+
+        for name in set(processed_files):
+            if name.endswith(COMPRESSED_EXTENSIONS):
+                self.write_compressed_variants(self.path(name))
+
+    @staticmethod
+    def write_compressed_variants(path):
+        """
+        Write the .gz and .br variants of a file, unless compression does not make it smaller.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as file:
+            content = file.read()
+        variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(content)))
+        for extension, compressed_content in variants:
+            if len(compressed_content) < len(content):
+                with open(path + extension, "wb") as file:
+                    file.write(compressed_content)